@@ -1,13 +1,43 @@
-from flask import Flask, render_template, request, jsonify
+import time
+IMPORT_STARTED = time.perf_counter()  # reported as the app_import startup phase
+
+from flask import Flask, Response, g, render_template, request, jsonify
 from flask_cors import CORS
-import openai
+import asyncio
+import httpx
 import requests
 import os
+import queue
+import threading
 from dotenv import load_dotenv
 import json
 from datetime import datetime
-import signal
-import threading
+import sqlite3
+import tempfile
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FuturesTimeoutError, wait
+from autocomplete import build_prefix_index
+from capture import TrafficCapture, recommendations_shape, search_shape
+from cache import create_cache_from_env, make_key, normalize_duration, normalize_location, normalize_preferences
+from city_index import CityIndex
+from fallback import QLOO_UNAVAILABLE_JSON, fallback_json, fallback_recommendations, fallback_response_body, qloo_unavailable
+from gpt_output import (MULTI_TRIP_SYSTEM_PROMPT, SYSTEM_PROMPT, clean_section, parse_json_object, response_format,
+                        validate_recommendations)
+from hedging import HedgeCancelled, Hedger
+from metrics import (FALLBACKS, GPT_CALL_SECONDS, GPT_OUTPUT_REPAIRS, REQUEST_SECONDS, RESPONSE_BYTES, STAGE_SECONDS, UPSTREAM_ERRORS,
+                     UPSTREAM_IN_FLIGHT, UPSTREAM_OVERRUN_SECONDS, UPSTREAM_RETRIES, UPSTREAM_TIMEOUTS, WARM_REFRESHES,
+                     Gauge, record_token_usage, registry, upstream_health)
+from qloo_client import QlooClient
+from ratelimit import AdmissionController, MemoryBucketStore, RateLimiter, SQLiteBucketStore
+from resilience import CircuitBreaker, CircuitOpenError, RateLimitExceeded, RetryPolicy
+from semantic_cache import create_semantic_cache_from_env
+from serialization import BodyCache, JSONBody, encoder_name, response_headers
+from singleflight import AsyncSingleFlight, SingleFlight
+from snapshot import SnapshotStore, is_generic_preferences
+from startup import PerProcess, load_module, timings
+from static_assets import REVALIDATE, Asset, StaticAssets
+from streaming import SectionStreamParser, sse_event, sse_frame
+from warmer import CacheWarmer, DemandTracker
 
 # Load environment variables
 load_dotenv()
@@ -15,442 +45,1467 @@ load_dotenv()
 app = Flask(__name__)
 CORS(app)
 
-# Configure OpenAI
-openai.api_key = os.getenv('OPENAI_API_KEY')
+# Background cache warming for the most requested destinations
+WARM_CACHE = os.getenv('WARM_CACHE', 'false').lower() == 'true'  # refresh popular entries before they expire
+WARM_TOP_N = int(os.getenv('WARM_TOP_N', 20))  # most requested GPT trips/Qloo categories kept warm
+WARM_INTERVAL = float(os.getenv('WARM_INTERVAL', 60))  # seconds between warming passes
+WARM_MAX_PER_MINUTE = int(os.getenv('WARM_MAX_PER_MINUTE', 6))  # upstream calls warming may make per minute
+WARM_PAUSE_IN_FLIGHT = int(os.getenv('WARM_PAUSE_IN_FLIGHT', 4))  # live calls to an upstream at which warming waits
 
 # Qloo API configuration
 QLOO_API_KEY = os.getenv('QLOO_API_KEY')
-QLOO_BASE_URL = "https://hackathon.api.qloo.com"
+QLOO_BASE_URL = os.getenv('QLOO_BASE_URL', "https://hackathon.api.qloo.com")
+QLOO_POOL_SIZE = int(os.getenv('QLOO_POOL_SIZE', 16))  # keep-alive connections kept open to Qloo
+QLOO_POOL_BLOCK = os.getenv('QLOO_POOL_BLOCK', 'false').lower() == 'true'  # wait for a free connection instead of opening extras
+COALESCE_LEASE_TTL = float(os.getenv('COALESCE_LEASE_TTL', 30))  # how long one worker may claim a cross-worker fetch
+COALESCE_POLL_INTERVAL = 0.1  # how often other workers check the shared cache for its result
+CITY_INDEX_PATH = os.getenv('CITY_INDEX_PATH', 'city_index.json')  # local city name -> Qloo entity id map
+CITY_INDEX_SAVE_DELAY = float(os.getenv('CITY_INDEX_SAVE_DELAY', 5))  # newly learned cities are written in batches this often
+CITY_SEEDS_PATH = os.getenv('CITY_SEEDS_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'city_seeds.json'))  # popular destinations for autocomplete
+AUTOCOMPLETE_LIMIT = 8  # suggestions returned by default (at most 20)
+AUTOCOMPLETE_QLOO_MIN_CHARS = 3  # shorter queries with no local match don't go to Qloo
+AUTOCOMPLETE_QLOO_TIMEOUT = 3  # typeahead can't wait long for Qloo on a local miss
+QLOO_CATEGORIES = [c.strip() for c in os.getenv('QLOO_CATEGORIES', 'restaurants,attractions,hotels,bars,cafes,museums').split(',') if c.strip()]
+QLOO_CATEGORY_LIMIT = int(os.getenv('QLOO_CATEGORY_LIMIT', 10))  # results per category
+QLOO_CATEGORY_LIMITS = {  # per-category overrides, e.g. "hotels=5,attractions=8"
+    name.strip(): int(limit) for name, _, limit in
+    (item.partition('=') for item in os.getenv('QLOO_CATEGORY_LIMITS', '').split(',') if '=' in item)
+}
+QLOO_CATEGORY_TIMEOUT = float(os.getenv('QLOO_CATEGORY_TIMEOUT', 8))  # per-category budget once the city is resolved
+
+# Upstream fan-out configuration
+UPSTREAM_POOL_SIZE = int(os.getenv('UPSTREAM_POOL_SIZE', 16))  # worker threads shared by all requests
+REQUEST_DEADLINE = float(os.getenv('REQUEST_DEADLINE', 25))  # overall budget for one request, in seconds
+GPT_TIMEOUT = float(os.getenv('GPT_TIMEOUT', 20))  # GPT's slice of the request budget
+GPT_RESPONSE_FORMAT = os.getenv('GPT_RESPONSE_FORMAT', 'json_schema')  # json_schema, json_object (JSON mode) or text
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv('UPSTREAM_CONNECT_TIMEOUT', 3.05))  # TCP/TLS connect budget per upstream attempt
+
+# Hedged GPT requests: race a second identical completion against one that is slower than usual
+GPT_HEDGE = os.getenv('GPT_HEDGE', 'false').lower() == 'true'  # costs extra tokens on the hedged calls
+GPT_HEDGE_PERCENTILE = float(os.getenv('GPT_HEDGE_PERCENTILE', 95))  # hedge once a completion outlasts this percentile of recent ones
+GPT_HEDGE_MAX_RATE = float(os.getenv('GPT_HEDGE_MAX_RATE', 0.05))  # at most this fraction of completions is sent twice
+GPT_HEDGE_MIN_DELAY = float(os.getenv('GPT_HEDGE_MIN_DELAY', 1))  # never hedge sooner than this, in seconds
+
+# Upstream resilience: retries with backoff and jitter, and a circuit breaker per upstream
+RETRY_MAX_ATTEMPTS = int(os.getenv('RETRY_MAX_ATTEMPTS', 3))  # attempts per upstream call, including the first
+RETRY_BASE_DELAY = float(os.getenv('RETRY_BASE_DELAY', 0.25))  # backoff before the first retry (doubles each retry)
+RETRY_MAX_DELAY = float(os.getenv('RETRY_MAX_DELAY', 2))  # backoff cap, in seconds
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', 5))  # consecutive failures that open a circuit
+CIRCUIT_RESET_TIMEOUT = float(os.getenv('CIRCUIT_RESET_TIMEOUT', 30))  # seconds before an open circuit lets a probe through
+GPT_ATTEMPT_TIMEOUT = 15  # per GPT attempt, before capping to the request deadline
+QLOO_ATTEMPT_TIMEOUT = 20  # per Qloo attempt, before capping to the request deadline
+
+# Upstream rate limits (token buckets shared by every worker on the host) and admission control
+QLOO_RATE_LIMIT = float(os.getenv('QLOO_RATE_LIMIT', 0))  # Qloo calls per second across all workers (0 disables)
+QLOO_RATE_BURST = int(os.getenv('QLOO_RATE_BURST', 10))  # Qloo calls that may go out back to back
+GPT_RATE_LIMIT = float(os.getenv('GPT_RATE_LIMIT', 0))  # OpenAI calls per second across all workers (0 disables)
+GPT_RATE_BURST = int(os.getenv('GPT_RATE_BURST', 16))  # OpenAI calls that may go out back to back
+RATE_LIMIT_PATH = os.getenv('RATE_LIMIT_PATH', os.path.join(tempfile.gettempdir(), 'wanderwise_ratelimit.sqlite3'))  # shared bucket file; empty for per-worker buckets
+RATE_LIMIT_MAX_WAIT = float(os.getenv('RATE_LIMIT_MAX_WAIT', 2))  # longest a call queues for a token before falling back
+RATE_LIMIT_MAX_QUEUE = int(os.getenv('RATE_LIMIT_MAX_QUEUE', 32))  # calls per worker that may queue for one upstream's tokens
+RATE_LIMIT_MIN_CALL_TIME = 1  # never queue for a token into the last second of an attempt's timeout
+ADMISSION_MAX_ACTIVE = int(os.getenv('ADMISSION_MAX_ACTIVE', 32))  # uncached requests per worker calling upstreams at once
+ADMISSION_MAX_QUEUE = int(os.getenv('ADMISSION_MAX_QUEUE', 64))  # further requests that may wait for a slot
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv('ADMISSION_QUEUE_TIMEOUT', 1))  # how long they wait before getting the fallback
+
+# Batch (multi-city) endpoint configuration
+BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', 10))  # trips accepted in one batch request
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', 4))  # upstream calls one batch may have in flight
+BATCH_DEADLINE = float(os.getenv('BATCH_DEADLINE', 40))  # overall budget for one batch request, in seconds
+BATCH_GPT_MAX_TOKENS = int(os.getenv('BATCH_GPT_MAX_TOKENS', 2400))  # output token budget per multi-city completion
+GPT_TOKENS_PER_TRIP = 800  # max_tokens of a single-trip completion
+
+# Serialized responses (JSON_ENCODER picks the encoder, see serialization.py)
+RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', 300))  # seconds a serialized response is reused, and its Cache-Control max-age
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 256))  # serialized responses kept per worker
+RESPONSE_CACHE_CONTROL = f"public, max-age={RESPONSE_CACHE_TTL}"  # for responses without fallback content
+
+# Precomputed recommendations for popular trips (built with `python snapshot.py build`)
+SNAPSHOT_PATH = os.getenv('SNAPSHOT_PATH', 'recommendations.snapshot')  # empty disables snapshot serving
+SNAPSHOT_MAX_AGE = float(os.getenv('SNAPSHOT_MAX_AGE', 7 * 24 * 3600))  # older snapshots aren't served (0 = no limit)
+SNAPSHOT_CHECK_INTERVAL = 5  # seconds between checks for a replaced snapshot file
+
+# Traffic capture for replaying production-shaped load locally (benchmarks/replay.py)
+CAPTURE_TRAFFIC = os.getenv('CAPTURE_TRAFFIC', 'false').lower() == 'true'  # log request shapes and upstream timings
+CAPTURE_DIR = os.getenv('CAPTURE_DIR', 'captures')  # one traffic-<pid>.jsonl per worker
+CAPTURE_SAMPLE_RATE = float(os.getenv('CAPTURE_SAMPLE_RATE', 1))  # fraction of requests and upstream calls logged
+CAPTURE_MAX_BYTES = int(os.getenv('CAPTURE_MAX_BYTES', 50 * 1024 * 1024))  # a worker's log is rotated at this size
+CAPTURE_BACKUPS = int(os.getenv('CAPTURE_BACKUPS', 3))  # rotated logs kept per worker
+
+# Worker startup (see startup.py and gunicorn.conf.py)
+STARTUP_WARM_CONNECTIONS = os.getenv('STARTUP_WARM_CONNECTIONS', 'false').lower() == 'true'  # open upstream connections before the first request
+
+# Shared, bounded pool for upstream calls (replaces two fresh threads per request). Pools
+# and clients are PerProcess: built on first use, so each forked worker has its own.
+upstream_executor = PerProcess("upstream_executor",
+                               lambda: ThreadPoolExecutor(max_workers=UPSTREAM_POOL_SIZE, thread_name_prefix="upstream"))
+# Both requests of a hedged GPT call run here, so they never queue behind the calls waiting on them
+hedge_executor = PerProcess("hedge_executor",
+                            lambda: ThreadPoolExecutor(max_workers=2 * UPSTREAM_POOL_SIZE, thread_name_prefix="gpt-hedge"))
+
+gpt_retry = RetryPolicy(RETRY_MAX_ATTEMPTS, RETRY_BASE_DELAY, RETRY_MAX_DELAY)
+qloo_retry = RetryPolicy(RETRY_MAX_ATTEMPTS, RETRY_BASE_DELAY, RETRY_MAX_DELAY)
+gpt_breaker = CircuitBreaker("OpenAI", CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT)
+qloo_breaker = CircuitBreaker("Qloo", CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT)
+CIRCUIT_BREAKERS = {"gpt": gpt_breaker, "qloo": qloo_breaker}
+
+def create_bucket_store():
+    """Rate-limit buckets shared through RATE_LIMIT_PATH, or per worker if it's empty or can't be opened"""
+    if RATE_LIMIT_PATH:
+        try:
+            return SQLiteBucketStore(RATE_LIMIT_PATH)
+        except sqlite3.Error:
+            pass
+    return MemoryBucketStore()
+
+bucket_store = create_bucket_store()
+gpt_limiter = RateLimiter("OpenAI", GPT_RATE_LIMIT, GPT_RATE_BURST, bucket_store, RATE_LIMIT_MAX_WAIT, RATE_LIMIT_MAX_QUEUE)
+qloo_limiter = RateLimiter("Qloo", QLOO_RATE_LIMIT, QLOO_RATE_BURST, bucket_store, RATE_LIMIT_MAX_WAIT, RATE_LIMIT_MAX_QUEUE)
+RATE_LIMITERS = {"gpt": gpt_limiter, "qloo": qloo_limiter}
+admission = AdmissionController(ADMISSION_MAX_ACTIVE, ADMISSION_MAX_QUEUE, ADMISSION_QUEUE_TIMEOUT)
+traffic_capture = None
+if CAPTURE_TRAFFIC:
+    traffic_capture = TrafficCapture(CAPTURE_DIR, CAPTURE_MAX_BYTES, CAPTURE_BACKUPS, CAPTURE_SAMPLE_RATE)
+
+@contextmanager
+def upstream_call(upstream, stage):
+    """Count one OpenAI or Qloo call in flight and time it, logging its timing while traffic capture is on"""
+    started = time.perf_counter()
+    succeeded = False
+    with UPSTREAM_IN_FLIGHT.track(upstream=upstream), STAGE_SECONDS.time(stage=stage):
+        try:
+            yield
+            succeeded = True
+        finally:
+            if traffic_capture is not None and traffic_capture.sampled():
+                traffic_capture.record({"type": "upstream", "upstream": upstream, "stage": stage,
+                                        "seconds": round(time.perf_counter() - started, 4), "ok": succeeded})
+
+def take_token(upstream, timeout):
+    """Wait for the upstream's rate limit before one attempt, returning what's left of the attempt's timeout
+    
+    Raises RateLimitExceeded when no token frees up in time, which callers handle like an open circuit.
+    """
+    waited = RATE_LIMITERS[upstream].acquire(max_wait=timeout - RATE_LIMIT_MIN_CALL_TIME)
+    if waited:
+        STAGE_SECONDS.observe(waited, stage="rate_limit_wait")
+    return timeout - waited
+
+gpt_hedger = None
+if GPT_HEDGE:
+    gpt_hedger = Hedger(GPT_HEDGE_PERCENTILE, GPT_HEDGE_MAX_RATE, GPT_HEDGE_MIN_DELAY,
+                        on_result=lambda seconds, outcome: GPT_CALL_SECONDS.observe(seconds, outcome=outcome))
+
+def gpt_can_hedge():
+    """Hedge only while OpenAI's rate limit has a token to spare for the second request"""
+    return not gpt_limiter.enabled or gpt_limiter.available() >= 1
+
+async def take_token_async(upstream, timeout):
+    """Async counterpart of take_token"""
+    waited = await RATE_LIMITERS[upstream].acquire_async(max_wait=timeout - RATE_LIMIT_MIN_CALL_TIME)
+    if waited:
+        STAGE_SECONDS.observe(waited, stage="rate_limit_wait")
+    return timeout - waited
+
+def gpt_timeout(timeout):
+    """OpenAI client timeout for one attempt: connect, and every socket read, bounded by the time it has left"""
+    return httpx.Timeout(timeout, connect=min(UPSTREAM_CONNECT_TIMEOUT, timeout))
+
+def peer_poll_interval(deadline):
+    """Seconds to sleep before checking on another worker's fetch again; None once the deadline has passed"""
+    if deadline is None:
+        return COALESCE_POLL_INTERVAL
+    remaining = deadline - time.monotonic()
+    return min(COALESCE_POLL_INTERVAL, remaining) if remaining > 0 else None
+
+def count_retry(upstream):
+    """on_retry hook counting retries of an upstream"""
+    return lambda error: UPSTREAM_RETRIES.inc(upstream=upstream)
+
+def vague_location_error(location):
+    return {"error": f"'{location}' is too vague. Please enter a more specific city name (e.g., 'Tokyo' instead of 'T')."}
+
+def is_vague_match(location, city):
+    """Short input that isn't a prefix of the resolved city name is too vague to trust"""
+    user_input = location.lower().strip()
+    return len(user_input) < 5 and not city.get('name', '').lower().startswith(user_input)
+
+def qloo_error_response(error_msg):
+    """Turn the final Qloo failure into a user-facing error"""
+    if "401" in error_msg:
+        return {"error": "Qloo API temporarily unavailable (rate limit or service issue). Please try again in a few moments."}
+    elif "timeout" in error_msg.lower() or "timed out" in error_msg.lower():
+        return {"error": "Qloo API request timed out. Please try again."}
+    else:
+        return {"error": f"Qloo API error: {error_msg}"}
+
+def gpt_response_format(multi_trip=False):
+    """response_format for OpenAI calls, or NOT_GIVEN when GPT_RESPONSE_FORMAT is text"""
+    return response_format(GPT_RESPONSE_FORMAT, multi_trip) or load_module("openai").NOT_GIVEN
+
+def record_gpt_output(repaired, problems):
+    """Count replies that needed their JSON repaired or didn't fully match the schema"""
+    if repaired:
+        GPT_OUTPUT_REPAIRS.inc(kind="json")
+    if problems:
+        GPT_OUTPUT_REPAIRS.inc(kind="schema")
+
+def parse_gpt_content(content, location=None):
+    """Parse and validate GPT's recommendation JSON, repairing slightly malformed output
+    
+    Raises ValueError only when nothing usable can be recovered - the one case worth a retry.
+    """
+    with STAGE_SECONDS.time(stage="gpt_parse"):
+        obj, repaired = parse_json_object(content or "")
+        result, problems = validate_recommendations(obj, location)
+    record_gpt_output(repaired, problems)
+    return result
+
+def parse_gpt_trips(content, trips):
+    """Parse a multi-trip reply into one validated result (or error dict) per trip"""
+    with STAGE_SECONDS.time(stage="gpt_parse"):
+        obj, repaired = parse_json_object(content or "")
+        answered = obj.get("trips")
+        if not isinstance(answered, list):
+            raise ValueError("GPT response has no trips list")
+        results, all_problems = [], []
+        for i, (location, _, _) in enumerate(trips):
+            try:
+                result, problems = validate_recommendations(answered[i] if i < len(answered) else None, location)
+            except ValueError:
+                results.append({"error": f"GPT API error: no recommendations returned for {location}"})
+                continue
+            results.append(result)
+            all_problems.extend(problems)
+    record_gpt_output(repaired, all_problems)
+    return results
 
 class TravelRecommender:
-    def __init__(self):
-        self.openai_client = openai.OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+    def __init__(self, qloo_client, cache=None, city_index=None, semantic_cache=None):
+        # Retries are ours (gpt_retry), so the client must not add its own on top
+        self.openai_client = PerProcess("openai_client", lambda: load_module("openai").OpenAI(
+            api_key=os.getenv('OPENAI_API_KEY'), max_retries=0))
+        self.qloo_client = qloo_client
+        self.cache = cache
+        self.city_index = city_index
+        self.semantic_cache = semantic_cache
+        # Created by init_async_clients() when serving through asgi.py
+        self.async_openai_client = None
+        self.async_qloo_client = None
+        self.single_flight = SingleFlight()
+        self.async_single_flight = AsyncSingleFlight()
+        # Refreshes only coalesce with each other: one that finds another worker's lease
+        # comes back with None, which a live request must never be handed
+        self.refresh_flight = SingleFlight()
+        self.peer_waits = 0  # requests that waited on another worker's identical upstream call
+    
+    def _cached(self, source, key, deadline, fetch, *args):
+        """Serve an upstream call from the response cache, coalescing identical in-flight misses"""
+        if self.cache is not None:
+            cached = self.cache.get(source, key)
+            if cached is not None:
+                return cached
+        
+        # Concurrent identical requests in this worker share one upstream call
+        return self.single_flight.do(key, self._fetch_and_store, source, key, deadline, fetch, *args)
+    
+    def refresh_gpt_recommendations(self, location, preferences, duration, deadline=None):
+        """Re-fetch a GPT result into the cache ahead of its expiry (used by the cache warmer)"""
+        key = self._gpt_cache_key(location, preferences, duration)
+        
+        def fetch():
+            result = self._fetch_gpt_recommendations(location, preferences, duration, deadline)
+            self._remember_gpt_recommendations(location, preferences, duration, result)
+            return result
+        return self.refresh_flight.do(key, self._refresh, "gpt", key, fetch)
+    
+    def refresh_qloo_recommendations(self, location, category, deadline=None):
+        """Re-fetch a Qloo category into the cache ahead of its expiry (used by the cache warmer)"""
+        key = self._qloo_cache_key(location, category)
+        return self.refresh_flight.do(key, self._refresh, "qloo", key, self._fetch_qloo_recommendations, location, category, deadline)
+    
+    def _refresh(self, source, key, fetch, *args):
+        """Fetch and cache even though the current entry is still valid; None if another worker is on it"""
+        if self.cache is None or not self.cache.acquire_lease(key, COALESCE_LEASE_TTL):
+            return None
+        try:
+            result = fetch(*args)
+            if isinstance(result, dict) and "error" not in result:
+                self.cache.set(source, key, result)
+            return result
+        finally:
+            self.cache.release_lease(key)
+    
+    def _fetch_and_store(self, source, key, deadline, fetch, *args):
+        """Fetch from upstream and cache the result, deferring to a worker already fetching it
+        
+        deadline only bounds the wait for another worker; fetch gets its own in args.
+        """
+        if self.cache is None:
+            return fetch(*args)
+        
+        # The previous leader may have stored the result just after our cache check
+        cached = self.cache.peek(key)
+        if cached is not None:
+            return cached
+        
+        # With a shared backend, another worker may already be fetching this key
+        leased = self.cache.acquire_lease(key, COALESCE_LEASE_TTL)
+        if not leased:
+            cached = self._wait_for_peer(key, deadline)
+            if cached is not None:
+                return cached
+            # The peer gave up or failed (errors aren't cached), or we can't wait any
+            # longer - fetch it ourselves, taking the lease over if it is free now
+            leased = self.cache.acquire_lease(key, COALESCE_LEASE_TTL)
+        
+        try:
+            result = fetch(*args)
+            # Never cache errors - the next request should get a fresh attempt
+            if isinstance(result, dict) and "error" not in result:
+                self.cache.set(source, key, result)
+            return result
+        finally:
+            # A lease we didn't get is another worker's to release
+            if leased:
+                self.cache.release_lease(key)
+    
+    def _wait_for_peer(self, key, deadline):
+        """Poll the shared cache until the worker holding the lease stores its result, or the deadline"""
+        self.peer_waits += 1
+        while self.cache.lease_held(key):
+            interval = peer_poll_interval(deadline)
+            if interval is None:
+                break
+            time.sleep(interval)
+            cached = self.cache.peek(key)
+            if cached is not None:
+                return cached
+        return self.cache.peek(key)
+    
+    def get_qloo_recommendations(self, location, category="restaurants", deadline=None):
+        """Get Qloo recommendations, served from the response cache when possible
+        
+        deadline (a time.monotonic() value) is when the caller stops waiting; no retry
+        is started that couldn't finish before it.
+        """
+        key = self._qloo_cache_key(location, category)
+        return self._cached("qloo", key, deadline, self._fetch_qloo_recommendations, location, category, deadline)
+    
+    def _qloo_cache_key(self, location, category):
+        return make_key("qloo", normalize_location(location), category)
+    
+    def has_cached_recommendations(self, location, preferences, duration, categories):
+        """Can a request be answered from the response cache alone, without any upstream call?"""
+        if self.cache is None:
+            return False
+        keys = [self._gpt_cache_key(location, preferences, duration)]
+        keys += [self._qloo_cache_key(location, category) for category in categories]
+        return all(self.cache.peek(key) is not None for key in keys)
     
-    def get_qloo_recommendations(self, location, category="restaurants"):
+    def get_cached_qloo_recommendations(self, location, category):
+        """A cached Qloo category for a location, or None (no upstream call)"""
+        if self.cache is None:
+            return None
+        return self.cache.get("qloo", self._qloo_cache_key(location, category))
+    
+    def get_qloo_category(self, location, city, category, deadline=None):
+        """Qloo recommendations in one category for an already-resolved city, after a get_cached_qloo_recommendations miss"""
+        key = self._qloo_cache_key(location, category)
+        # The caller has already checked the cache; _fetch_and_store still re-checks it
+        return self.single_flight.do(key, self._fetch_and_store, "qloo", key, deadline, self._fetch_qloo_category, city, category, deadline)
+    
+    def _gpt_cache_key(self, location, preferences, duration):
+        return make_key("gpt", normalize_location(location), normalize_preferences(preferences), normalize_duration(duration))
+    
+    def get_gpt_recommendations(self, location, preferences, duration, deadline=None):
+        """Get GPT recommendations, served from the response cache when possible"""
+        key = self._gpt_cache_key(location, preferences, duration)
+        return self._cached("gpt", key, deadline, self._fetch_gpt_or_similar, location, preferences, duration, deadline)
+    
+    def _similar_gpt_recommendations(self, location, preferences, duration):
+        """A cached result for differently worded but equivalent preferences, if there is one"""
+        if self.semantic_cache is None:
+            return None
+        with STAGE_SECONDS.time(stage="semantic_lookup"):
+            return self.semantic_cache.get(location, preferences, duration)
+    
+    def _remember_gpt_recommendations(self, location, preferences, duration, result):
+        if self.semantic_cache is not None and "error" not in result:
+            self.semantic_cache.set(location, preferences, duration, result)
+    
+    def _fetch_gpt_or_similar(self, location, preferences, duration, deadline=None):
+        """Serve an exact-cache miss from the semantic cache, or else from GPT"""
+        result = self._similar_gpt_recommendations(location, preferences, duration)
+        if result is None:
+            result = self._fetch_gpt_recommendations(location, preferences, duration, deadline)
+            self._remember_gpt_recommendations(location, preferences, duration, result)
+        return result
+    
+    def _fetch_qloo_recommendations(self, location, category="restaurants", deadline=None):
         """Get recommendations from Qloo Taste AI API with retry logic"""
-        headers = {
-            "Authorization": f"Bearer {QLOO_API_KEY}",
-            "Content-Type": "application/json"
-        }
+        city, error = self.resolve_qloo_city(location, deadline)
+        if error is not None:
+            return error
+        return self._fetch_qloo_category(city, category, deadline)
+    
+    def resolve_qloo_city(self, location, deadline=None):
+        """Validate and resolve a location to a Qloo city: (city, None), or (None, error dict)
         
-        # Set timeout to prevent hanging requests
-        timeout = 20  # 20 second timeout for HTTP requests
+        Raises CircuitOpenError while Qloo is failing, so callers fall back immediately.
+        """
+        # Very short input is too vague to resolve - no need to ask Qloo
+        if len(location.strip()) < 3:
+            return None, vague_location_error(location)
         
-        # Retry logic for intermittent issues
-        max_retries = 2
-        for attempt in range(max_retries):
-            try:
-                # Search for the location first
-                search_url = f"{QLOO_BASE_URL}/search"
-                search_params = {
-                    "query": location,
-                    "category": "cities"
-                }
-                
-                search_response = requests.get(search_url, headers=headers, params=search_params, timeout=timeout)
-                search_response.raise_for_status()
-                search_data = search_response.json()
-                
-                if not search_data.get('results'):
-                    return {"error": f"Location '{location}' not found. Please check the spelling or try a different city name."}
-                
-                # Validate that the search result is actually relevant
-                first_result = search_data['results'][0]
-                search_result_name = first_result.get('name', '').lower()
-                user_input = location.lower().strip()
-                
-                # Check if the search result is too generic or doesn't match well
-                if len(user_input) < 3 or (len(user_input) < 5 and not search_result_name.startswith(user_input)):
-                    return {"error": f"'{location}' is too vague. Please enter a more specific city name (e.g., 'Tokyo' instead of 'T')."}
-                
-                # Get the first result (most relevant)
-                location_id = first_result['id']
-                
-                # Get recommendations for the location
-                rec_url = f"{QLOO_BASE_URL}/recommendations"
-                rec_params = {
-                    "entity_id": location_id,
-                    "category": category,
-                    "limit": 10
-                }
-                
-                rec_response = requests.get(rec_url, headers=headers, params=rec_params, timeout=timeout)
-                rec_response.raise_for_status()
-                rec_data = rec_response.json()
-                
-                return rec_data
-                
-            except requests.exceptions.RequestException as e:
-                error_msg = str(e)
-                if attempt < max_retries - 1:  # Don't retry on last attempt
-                    continue  # Retry
+        try:
+            # Resolve the location locally first, falling back to Qloo search
+            first_result = qloo_retry.call(
+                lambda timeout: self.resolve_city(location, timeout),
+                QLOO_ATTEMPT_TIMEOUT, deadline, breaker=qloo_breaker, on_retry=count_retry("qloo")
+            )
+        except CircuitOpenError:
+            raise
+        except requests.exceptions.RequestException as e:
+            # Final attempt failed
+            UPSTREAM_ERRORS.inc(upstream="qloo")
+            upstream_health.failure("qloo", e)
+            return None, qloo_error_response(str(e))
+        
+        if first_result is None:
+            return None, self.location_not_found(location)
+        
+        # Check if the resolved city is too generic or doesn't match well
+        if is_vague_match(location, first_result):
+            return None, vague_location_error(location)
+        
+        return first_result, None
+    
+    def location_not_found(self, location):
+        """Error for a location Qloo doesn't know, suggesting a known city it may have meant"""
+        suggestion = self.city_index.suggest(location) if self.city_index is not None else None
+        if suggestion is not None:
+            return {"error": f"Location '{location}' not found. Did you mean '{suggestion['name']}'?",
+                    "suggestion": suggestion['name']}
+        return {"error": f"Location '{location}' not found. Please check the spelling or try a different city name."}
+    
+    def _fetch_qloo_category(self, city, category, deadline=None):
+        """Get one category of Qloo recommendations for a resolved city, with retry logic"""
+        limit = QLOO_CATEGORY_LIMITS.get(category, QLOO_CATEGORY_LIMIT)
+        
+        def attempt(timeout):
+            timeout = take_token("qloo", timeout)
+            with upstream_call("qloo", "qloo_recommendations"):
+                return self.qloo_client.recommendations(city['id'], category, limit=limit, timeout=timeout)
+        
+        try:
+            result = qloo_retry.call(attempt, QLOO_ATTEMPT_TIMEOUT, deadline, breaker=qloo_breaker, on_retry=count_retry("qloo"))
+        except CircuitOpenError:
+            raise
+        except requests.exceptions.RequestException as e:
+            UPSTREAM_ERRORS.inc(upstream="qloo")
+            upstream_health.failure("qloo", e)
+            return qloo_error_response(str(e))
+        upstream_health.success("qloo")
+        return result
+    
+    def resolve_city(self, location, timeout):
+        """Resolve user text to a Qloo city entity, consulting the local index before /search"""
+        if self.city_index is not None:
+            with STAGE_SECONDS.time(stage="city_lookup"):
+                city = self.city_index.lookup(location)
+            if city is not None:
+                return city
+        
+        timeout = take_token("qloo", timeout)
+        with upstream_call("qloo", "qloo_search"):
+            results = self.qloo_client.search(location, "cities", timeout=timeout).get('results')
+        if not results:
+            return None
+        
+        if self.city_index is not None:
+            self.city_index.add_search_results(location, results)
+        return results[0]
+    
+    def build_gpt_messages(self, location, preferences, duration):
+        """Build the chat messages asking GPT for recommendations
+        
+        The schema lives in the shared system prompt, so only this short user line varies
+        between requests and the identical prefix stays eligible for prompt caching.
+        """
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": f"Location: {location}. Duration: {duration}. Preferences: {preferences}."}
+        ]
+    
+    def stream_gpt_recommendations(self, location, preferences, duration, stop=None, deadline=None):
+        """Yield (section, value) pairs as GPT streams them, caching the assembled result
+        
+        A reply cut short (by the deadline, or ending before its JSON object closed)
+        raises once its completed sections have been yielded, and is never cached.
+        """
+        key = self._gpt_cache_key(location, preferences, duration)
+        cached = self.cache.get("gpt", key) if self.cache is not None else None
+        if cached is None:
+            cached = self._similar_gpt_recommendations(location, preferences, duration)
+        if cached is not None:
+            yield from cached.items()
+            return
+        
+        def open_stream(timeout):
+            timeout = take_token("gpt", timeout)
+            return self.openai_client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=self.build_gpt_messages(location, preferences, duration),
+                temperature=0.5,
+                max_tokens=800,
+                timeout=gpt_timeout(timeout),
+                response_format=gpt_response_format(),
+                stream=True,
+                # The final chunk then carries token usage for the metrics
+                stream_options={"include_usage": True}
+            )
+        
+        started = time.perf_counter()
+        try:
+            # A stream can't be resumed part-way, so only opening it is retried
+            stream = gpt_retry.call(open_stream, GPT_ATTEMPT_TIMEOUT, deadline, breaker=gpt_breaker, on_retry=count_retry("gpt"))
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            UPSTREAM_ERRORS.inc(upstream="gpt")
+            upstream_health.failure("gpt", e)
+            raise
+        parser = SectionStreamParser()
+        UPSTREAM_IN_FLIGHT.inc(upstream="gpt")
+        try:
+            for chunk in stream:
+                # The client went away or the request deadline passed - stop paying for tokens
+                if stop is not None and stop.is_set():
+                    return
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise TimeoutError("GPT stream passed the request deadline")
+                if chunk.choices and chunk.choices[0].delta.content:
+                    for name, value in parser.feed(chunk.choices[0].delta.content):
+                        value, _ = clean_section(name, value)
+                        if value is not None:
+                            yield name, value
+                if getattr(chunk, "usage", None) is not None:
+                    record_token_usage(chunk.usage)
+        finally:
+            # Closing the stream drops its connection, which is what actually stops the generation
+            stream.close()
+            UPSTREAM_IN_FLIGHT.dec(upstream="gpt")
+            STAGE_SECONDS.observe(time.perf_counter() - started, stage="gpt_completion")
+        
+        try:
+            # Checked even when cut short, so a reply with nothing usable fails as such
+            result, problems = validate_recommendations(parser.sections, location)
+        except ValueError:
+            UPSTREAM_ERRORS.inc(upstream="gpt")
+            upstream_health.failure("gpt", "stream ended before the JSON object was complete")
+            raise ValueError("GPT response ended before the JSON object was complete")
+        record_gpt_output(not parser.complete, problems)
+        if not parser.complete:
+            # The client already has the sections that completed; the rest is its fallback
+            raise ValueError("GPT response ended before the JSON object was complete")
+        upstream_health.success("gpt")
+        if self.cache is not None:
+            self.cache.set("gpt", key, result)
+        self._remember_gpt_recommendations(location, preferences, duration, result)
+    
+    def _fetch_gpt_recommendations(self, location, preferences, duration, deadline=None):
+        """Get personalized recommendations using GPT with retry logic
+        
+        Raises CircuitOpenError while OpenAI is failing, so callers fall back immediately.
+        """
+        messages = self.build_gpt_messages(location, preferences, duration)
+        
+        def complete(timeout, stop=None):
+            timeout = take_token("gpt", timeout)
+            with upstream_call("gpt", "gpt_completion"):
+                if stop is None:
+                    response = self.openai_client.chat.completions.create(
+                        model="gpt-4o-mini",
+                        messages=messages,
+                        temperature=0.5,
+                        max_tokens=800,  # Back to original for 2-3 recommendations
+                        timeout=gpt_timeout(timeout),
+                        response_format=gpt_response_format()
+                    )
+                    content, usage = response.choices[0].message.content, response.usage
                 else:
-                    # Final attempt failed
-                    if "401" in error_msg:
-                        return {"error": "Qloo API temporarily unavailable (rate limit or service issue). Please try again in a few moments."}
-                    elif "timeout" in error_msg.lower():
-                        return {"error": "Qloo API request timed out. Please try again."}
-                    else:
-                        return {"error": f"Qloo API error: {error_msg}"}
-    
-    def get_gpt_recommendations(self, location, preferences, duration):
-        """Get personalized recommendations using GPT with retry logic"""
-        prompt = f"""
-        Provide quick travel tips for {location}. Duration: {duration}. Preferences: {preferences}.
-        
-        Return JSON with 2-3 items per category:
-        {{
-            "destination_info": {{
-                "name": "{location}",
-                "best_time_to_visit": "brief info",
-                "weather_info": "brief info", 
-                "cultural_highlights": "brief info"
-            }},
-            "food_recommendations": [
-                {{
-                    "name": "Restaurant name",
-                    "cuisine": "cuisine type",
-                    "description": "brief description",
-                    "price_range": "price level",
-                    "must_try_dishes": ["dish1", "dish2"],
-                    "location": "area"
-                }}
-            ],
-            "experience_recommendations": [
-                {{
-                    "name": "Experience name",
-                    "category": "category",
-                    "description": "brief description",
-                    "duration": "time needed",
-                    "best_time": "when to go",
-                    "tips": "quick tip"
-                }}
-            ],
-            "hidden_gems": [
-                {{
-                    "name": "Place name",
-                    "type": "type",
-                    "description": "brief description",
-                    "location": "location"
-                }}
-            ],
-            "travel_tips": ["tip1", "tip2", "tip3"]
-        }}
-        
-        Keep responses concise and specific to {location}.
+                    content, usage = self._stream_completion(messages, timeout, stop)
+            record_token_usage(usage)
+            
+            # Parse the JSON response
+            return parse_gpt_content(content, location)
+        
+        def attempt(timeout):
+            if gpt_hedger is None:
+                return complete(timeout)
+            # A completion slower than usual is raced against a second, identical one
+            return gpt_hedger.call(complete, timeout, hedge_executor, can_hedge=gpt_can_hedge)
+        
+        try:
+            # A reply with nothing salvageable in it is worth another try, but doesn't count against the circuit
+            result = gpt_retry.call(attempt, GPT_ATTEMPT_TIMEOUT, deadline, breaker=gpt_breaker,
+                                    retry_on=(ValueError,), on_retry=count_retry("gpt"))
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            UPSTREAM_ERRORS.inc(upstream="gpt")
+            upstream_health.failure("gpt", e)
+            return {"error": f"GPT API error: {str(e)}"}
+        upstream_health.success("gpt")
+        return result
+    
+    def _stream_completion(self, messages, timeout, stop):
+        """(content, usage) of a completion streamed so that setting stop abandons it (a hedged call that lost)"""
+        stream = self.openai_client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=messages,
+            temperature=0.5,
+            max_tokens=800,
+            timeout=gpt_timeout(timeout),
+            response_format=gpt_response_format(),
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        parts, usage = [], None
+        try:
+            for chunk in stream:
+                if stop.is_set():
+                    raise HedgeCancelled("The other request answered first")
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+                if getattr(chunk, "usage", None) is not None:
+                    usage = chunk.usage
+        finally:
+            # Closing the stream drops its connection, which is what actually stops the generation
+            stream.close()
+        return "".join(parts), usage
+    
+    def build_multi_trip_gpt_messages(self, trips):
+        """Build the chat messages asking GPT for several trips in one completion"""
+        listing = "\n".join(
+            f"{i + 1}. {location} - Duration: {duration}. Preferences: {preferences}."
+            for i, (location, preferences, duration) in enumerate(trips)
+        )
+        return [
+            {"role": "system", "content": MULTI_TRIP_SYSTEM_PROMPT},
+            {"role": "user", "content": f"Trips:\n{listing}"}
+        ]
+    
+    def get_gpt_recommendations_multi(self, trips, deadline=None):
+        """GPT recommendations for several (location, preferences, duration) trips, one result per trip
+        
+        Cached trips are served from the same cache entries the single endpoint uses; the rest
+        share one completion, and each of their results is cached on its own.
         """
+        keys = [self._gpt_cache_key(*trip) for trip in trips]
+        results = [self.cache.get("gpt", key) if self.cache is not None else None for key in keys]
+        missing = [i for i, result in enumerate(results) if result is None]
         
-        # Retry logic for GPT calls
-        max_retries = 2
-        for attempt in range(max_retries):
-            try:
+        if len(missing) == 1:
+            # Nothing to share - take the single-trip path (and its request coalescing)
+            results[missing[0]] = self.get_gpt_recommendations(*trips[missing[0]], deadline=deadline)
+        elif missing:
+            for i in missing:
+                results[i] = self._similar_gpt_recommendations(*trips[i])
+            missing = [i for i in missing if results[i] is None]
+            fetched = self._fetch_gpt_recommendations_multi([trips[i] for i in missing], deadline) if missing else []
+            for i, result in zip(missing, fetched):
+                results[i] = result
+                if self.cache is not None and "error" not in result:
+                    self.cache.set("gpt", keys[i], result)
+                self._remember_gpt_recommendations(*trips[i], result)
+        return results
+    
+    def _fetch_gpt_recommendations_multi(self, trips, deadline=None):
+        """One GPT completion covering several trips, returning a result (or error dict) per trip"""
+        messages = self.build_multi_trip_gpt_messages(trips)
+        
+        def attempt(timeout):
+            timeout = take_token("gpt", timeout)
+            with upstream_call("gpt", "gpt_completion"):
                 response = self.openai_client.chat.completions.create(
                     model="gpt-4o-mini",
-                    messages=[
-                        {"role": "system", "content": "You are a travel expert. Respond with valid JSON only."},
-                        {"role": "user", "content": prompt}
-                    ],
+                    messages=messages,
                     temperature=0.5,
-                    max_tokens=800,  # Back to original for 2-3 recommendations
-                    timeout=15  # Increased timeout for each attempt
+                    max_tokens=GPT_TOKENS_PER_TRIP * len(trips),
+                    timeout=gpt_timeout(timeout),
+                    response_format=gpt_response_format(multi_trip=True)
                 )
-                
-                # Parse the JSON response
-                content = response.choices[0].message.content
-                # Clean up the response to ensure it's valid JSON
-                content = content.strip()
-                if content.startswith("```json"):
-                    content = content[7:]
-                if content.endswith("```"):
-                    content = content[:-3]
-                
-                return json.loads(content)
-                
-            except Exception as e:
-                if attempt < max_retries - 1:  # Don't retry on last attempt
-                    continue  # Retry
-                else:
-                    return {"error": f"GPT API error: {str(e)}"}
+            record_token_usage(response.usage)
+            return parse_gpt_trips(response.choices[0].message.content, trips)
+        
+        try:
+            # Longer output takes longer to generate
+            results = gpt_retry.call(attempt, GPT_ATTEMPT_TIMEOUT + 5 * (len(trips) - 1), deadline, breaker=gpt_breaker,
+                                     retry_on=(ValueError,), on_retry=count_retry("gpt"))
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            UPSTREAM_ERRORS.inc(upstream="gpt")
+            upstream_health.failure("gpt", e)
+            return [{"error": f"GPT API error: {str(e)}"} for _ in trips]
+        upstream_health.success("gpt")
+        return results
+    
+    # Async variants of the upstream calls, used by the ASGI serving mode (asgi.py)
+    
+    def init_async_clients(self, async_qloo_client):
+        """Attach the async OpenAI and Qloo clients; call from inside the serving event loop"""
+        self.async_openai_client = load_module("openai").AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'), max_retries=0)
+        self.async_qloo_client = async_qloo_client
+    
+    async def _cached_async(self, source, key, deadline, fetch, *args):
+        """Async counterpart of _cached"""
+        if self.cache is not None:
+            cached = self.cache.get(source, key)
+            if cached is not None:
+                return cached
+        
+        return await self.async_single_flight.do(key, self._fetch_and_store_async, source, key, deadline, fetch, *args)
+    
+    async def _fetch_and_store_async(self, source, key, deadline, fetch, *args):
+        """Async counterpart of _fetch_and_store"""
+        if self.cache is None:
+            return await fetch(*args)
+        
+        cached = self.cache.peek(key)
+        if cached is not None:
+            return cached
+        
+        leased = self.cache.acquire_lease(key, COALESCE_LEASE_TTL)
+        if not leased:
+            self.peer_waits += 1
+            while self.cache.lease_held(key):
+                interval = peer_poll_interval(deadline)
+                if interval is None:
+                    break
+                await asyncio.sleep(interval)
+                cached = self.cache.peek(key)
+                if cached is not None:
+                    return cached
+            cached = self.cache.peek(key)
+            if cached is not None:
+                return cached
+            leased = self.cache.acquire_lease(key, COALESCE_LEASE_TTL)
+        
+        try:
+            result = await fetch(*args)
+            if isinstance(result, dict) and "error" not in result:
+                self.cache.set(source, key, result)
+            return result
+        finally:
+            if leased:
+                self.cache.release_lease(key)
+    
+    async def get_qloo_recommendations_async(self, location, category="restaurants", deadline=None):
+        """Get Qloo recommendations without blocking the event loop"""
+        key = self._qloo_cache_key(location, category)
+        return await self._cached_async("qloo", key, deadline, self._fetch_qloo_recommendations_async, location, category, deadline)
+    
+    async def get_qloo_category_async(self, location, city, category, deadline=None):
+        """Async counterpart of get_qloo_category"""
+        key = self._qloo_cache_key(location, category)
+        return await self.async_single_flight.do(key, self._fetch_and_store_async, "qloo", key, deadline, self._fetch_qloo_category_async, city, category, deadline)
+    
+    async def get_gpt_recommendations_async(self, location, preferences, duration, deadline=None):
+        """Get GPT recommendations without blocking the event loop"""
+        key = self._gpt_cache_key(location, preferences, duration)
+        return await self._cached_async("gpt", key, deadline, self._fetch_gpt_or_similar_async, location, preferences, duration, deadline)
+    
+    async def _fetch_gpt_or_similar_async(self, location, preferences, duration, deadline=None):
+        """Async counterpart of _fetch_gpt_or_similar"""
+        result = self._similar_gpt_recommendations(location, preferences, duration)
+        if result is None:
+            result = await self._fetch_gpt_recommendations_async(location, preferences, duration, deadline)
+            self._remember_gpt_recommendations(location, preferences, duration, result)
+        return result
+    
+    async def resolve_city_async(self, location, timeout):
+        """Async counterpart of resolve_city"""
+        if self.city_index is not None:
+            with STAGE_SECONDS.time(stage="city_lookup"):
+                city = self.city_index.lookup(location)
+            if city is not None:
+                return city
+        
+        timeout = await take_token_async("qloo", timeout)
+        with upstream_call("qloo", "qloo_search"):
+            results = (await self.async_qloo_client.search(location, "cities", timeout=timeout)).get('results')
+        if not results:
+            return None
+        
+        if self.city_index is not None:
+            self.city_index.add_search_results(location, results)
+        return results[0]
+    
+    async def _fetch_qloo_recommendations_async(self, location, category="restaurants", deadline=None):
+        """Async counterpart of _fetch_qloo_recommendations"""
+        city, error = await self.resolve_qloo_city_async(location, deadline)
+        if error is not None:
+            return error
+        return await self._fetch_qloo_category_async(city, category, deadline)
+    
+    async def resolve_qloo_city_async(self, location, deadline=None):
+        """Async counterpart of resolve_qloo_city"""
+        if len(location.strip()) < 3:
+            return None, vague_location_error(location)
+        
+        try:
+            first_result = await qloo_retry.call_async(
+                lambda timeout: self.resolve_city_async(location, timeout),
+                QLOO_ATTEMPT_TIMEOUT, deadline, breaker=qloo_breaker, on_retry=count_retry("qloo")
+            )
+        except CircuitOpenError:
+            raise
+        except httpx.HTTPError as e:
+            # httpx timeouts often carry an empty message, so name them explicitly
+            error_msg = "timeout" if isinstance(e, httpx.TimeoutException) else str(e)
+            UPSTREAM_ERRORS.inc(upstream="qloo")
+            upstream_health.failure("qloo", error_msg)
+            return None, qloo_error_response(error_msg)
+        
+        if first_result is None:
+            return None, self.location_not_found(location)
+        if is_vague_match(location, first_result):
+            return None, vague_location_error(location)
+        return first_result, None
+    
+    async def _fetch_qloo_category_async(self, city, category, deadline=None):
+        """Async counterpart of _fetch_qloo_category"""
+        limit = QLOO_CATEGORY_LIMITS.get(category, QLOO_CATEGORY_LIMIT)
+        
+        async def attempt(timeout):
+            timeout = await take_token_async("qloo", timeout)
+            with upstream_call("qloo", "qloo_recommendations"):
+                return await self.async_qloo_client.recommendations(city['id'], category, limit=limit, timeout=timeout)
+        
+        try:
+            result = await qloo_retry.call_async(attempt, QLOO_ATTEMPT_TIMEOUT, deadline, breaker=qloo_breaker, on_retry=count_retry("qloo"))
+        except CircuitOpenError:
+            raise
+        except httpx.HTTPError as e:
+            error_msg = "timeout" if isinstance(e, httpx.TimeoutException) else str(e)
+            UPSTREAM_ERRORS.inc(upstream="qloo")
+            upstream_health.failure("qloo", error_msg)
+            return qloo_error_response(error_msg)
+        upstream_health.success("qloo")
+        return result
+    
+    async def _fetch_gpt_recommendations_async(self, location, preferences, duration, deadline=None):
+        """Async counterpart of _fetch_gpt_recommendations"""
+        messages = self.build_gpt_messages(location, preferences, duration)
+        
+        async def complete(timeout):
+            timeout = await take_token_async("gpt", timeout)
+            with upstream_call("gpt", "gpt_completion"):
+                response = await self.async_openai_client.chat.completions.create(
+                    model="gpt-4o-mini",
+                    messages=messages,
+                    temperature=0.5,
+                    max_tokens=800,
+                    timeout=gpt_timeout(timeout),
+                    response_format=gpt_response_format()
+                )
+            record_token_usage(response.usage)
+            return parse_gpt_content(response.choices[0].message.content, location)
+        
+        async def attempt(timeout):
+            if gpt_hedger is None:
+                return await complete(timeout)
+            # The losing request's task is cancelled, which closes its connection
+            return await gpt_hedger.call_async(complete, timeout, can_hedge=gpt_can_hedge)
+        
+        try:
+            result = await gpt_retry.call_async(attempt, GPT_ATTEMPT_TIMEOUT, deadline, breaker=gpt_breaker,
+                                                retry_on=(ValueError,), on_retry=count_retry("gpt"))
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            UPSTREAM_ERRORS.inc(upstream="gpt")
+            upstream_health.failure("gpt", e)
+            return {"error": f"GPT API error: {str(e)}"}
+        upstream_health.success("gpt")
+        return result
 
 # Initialize the recommender
-recommender = TravelRecommender()
+qloo_client = PerProcess("qloo_client", lambda: QlooClient(QLOO_API_KEY, QLOO_BASE_URL, pool_size=QLOO_POOL_SIZE,
+                                                           pool_block=QLOO_POOL_BLOCK, connect_timeout=UPSTREAM_CONNECT_TIMEOUT))
+recommender = TravelRecommender(qloo_client, cache=create_cache_from_env(),
+                                city_index=CityIndex(CITY_INDEX_PATH, save_delay=CITY_INDEX_SAVE_DELAY),
+                                semantic_cache=create_semantic_cache_from_env())
+# Seed list plus every city the index learns, for autocomplete without a Qloo call per keystroke
+city_prefixes = build_prefix_index(CITY_SEEDS_PATH, recommender.city_index)
+# Serialized (and compressed) recommendations responses, reused for identical requests
+response_bodies = BodyCache(RESPONSE_CACHE_TTL, RESPONSE_CACHE_MAX_ENTRIES)
+# Memory-mapped snapshot of popular trips, answered without any upstream call
+snapshots = SnapshotStore(SNAPSHOT_PATH, SNAPSHOT_MAX_AGE, SNAPSHOT_CHECK_INTERVAL) if SNAPSHOT_PATH else None
+# The page's stylesheet and script under content-hashed URLs, and the page rendered once to link them
+static_assets = StaticAssets(os.path.join(app.root_path, 'static'))
+with app.app_context():
+    page_shell = Asset('index.html', render_template('index.html', asset_url=static_assets.url).encode())
+
+def refresh_cache_entry(source, args):
+    """Cache warmer hook: re-fetch one GPT trip or Qloo category with a normal request's deadline"""
+    deadline = time.monotonic() + REQUEST_DEADLINE
+    if source == "gpt":
+        return recommender.refresh_gpt_recommendations(*args, deadline=deadline)
+    return recommender.refresh_qloo_recommendations(*args, deadline=deadline)
+
+def upstream_busy(source):
+    """Warming waits while live requests are using the upstream, its circuit isn't closed, or its rate limit is half spent"""
+    if CIRCUIT_BREAKERS[source].state != CircuitBreaker.CLOSED:
+        return True
+    limiter = RATE_LIMITERS[source]
+    if limiter.enabled and limiter.available() < limiter.burst / 2:
+        return True
+    return UPSTREAM_IN_FLIGHT.value(upstream=source) >= WARM_PAUSE_IN_FLIGHT
+
+cache_warmer = None
+if WARM_CACHE and recommender.cache is not None:
+    cache_warmer = CacheWarmer(
+        recommender.cache, DemandTracker(), refresh_cache_entry, upstream_busy,
+        top_n=WARM_TOP_N, interval=WARM_INTERVAL, max_per_minute=WARM_MAX_PER_MINUTE,
+        on_result=lambda source, result: WARM_REFRESHES.inc(source=source, result=result),
+    )
+
+def preload_modules():
+    """Import what the workers will use, once, in a gunicorn master that preloads the app
+
+    Imported modules hold no sockets or threads, so forked workers share them safely.
+    Clients and pools are not kept: each worker builds its own (warm_up).
+    """
+    with timings.time("preload_modules"):
+        # The OpenAI client imports its HTTP transport and API resources on first use.
+        # Building one (without sending anything) and closing it imports them here.
+        client = load_module("openai").OpenAI(api_key=os.getenv('OPENAI_API_KEY') or "preload", max_retries=0)
+        client.chat.completions
+        client.close()
+        if recommender.semantic_cache is not None:
+            load_module("numpy")
+
+def warm_up(connect=STARTUP_WARM_CONNECTIONS):
+    """Build this process's clients and pools now rather than on its first request
+
+    gunicorn.conf.py runs this in the background in each freshly forked worker. With
+    connect, one connection to each upstream is also opened and kept alive. A failure
+    there is left for the first real call to meet, with its retries and fallbacks.
+    """
+    with timings.time("warm_up"):
+        for component in (recommender.openai_client, qloo_client, upstream_executor, hedge_executor):
+            component.instance()
+        if recommender.semantic_cache is not None:
+            load_module("numpy")
+        if cache_warmer is not None:
+            cache_warmer.start()
+        if connect:
+            try:
+                qloo_client.session.head(QLOO_BASE_URL, timeout=UPSTREAM_CONNECT_TIMEOUT)
+            except requests.RequestException:
+                pass
+            try:
+                recommender.openai_client.with_options(timeout=UPSTREAM_CONNECT_TIMEOUT).models.list()
+            except load_module("openai").OpenAIError:
+                pass
+
+def start_warm_up():
+    """warm_up() on a background thread, so a worker can accept requests straight away"""
+    thread = threading.Thread(target=warm_up, name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+def record_demand(location, preferences, duration, categories):
+    """Count a request towards autocomplete ranking and the cache warmer's most requested entries"""
+    city_prefixes.touch(location)
+    if cache_warmer is None:
+        return
+    cache_warmer.record("gpt", recommender._gpt_cache_key(location, preferences, duration), (location, preferences, duration))
+    for category in categories:
+        cache_warmer.record("qloo", recommender._qloo_cache_key(location, category), (location, category))
+
+def wait_for_upstream(future, deadline):
+    """Wait for an upstream call until the deadline, returning (result, error, timed_out)"""
+    try:
+        return future.result(timeout=max(0, deadline - time.monotonic())), None, False
+    except FuturesTimeoutError:
+        # Drop the call if it is still queued behind other requests. One already running
+        # can't be interrupted, but its socket timeouts are capped to the same deadline,
+        # so it gives up shortly after; record by how much it overran.
+        if not future.cancel():
+            future.add_done_callback(lambda _: UPSTREAM_OVERRUN_SECONDS.observe(max(0.0, time.monotonic() - deadline)))
+        return None, None, True
+    except Exception as e:
+        return None, str(e), False
+
+def record_timeout(upstream):
+    """Count an upstream call abandoned at the request deadline"""
+    UPSTREAM_TIMEOUTS.inc(upstream=upstream)
+    FALLBACKS.inc(upstream=upstream, reason="timeout")
+    upstream_health.failure(upstream, "timed out at the request deadline")
+
+def parse_trip(data):
+    """(location, preferences, duration, error message) from a JSON body or query string
+
+    The fields are interpolated into prompts and cache keys, so anything but a string
+    (or a missing field) is refused rather than guessed at.
+    """
+    if not isinstance(data, dict):
+        return None, None, None, "Request body must be a JSON object"
+    fields = []
+    for name in ('location', 'preferences', 'duration'):
+        value = data.get(name)
+        if value is None:
+            value = ''
+        if not isinstance(value, str):
+            return None, None, None, f"'{name}' must be a string"
+        fields.append(value)
+    location, preferences, duration = fields
+    return location.strip(), preferences, duration, None
+
+def parse_categories(value):
+    """Requested Qloo categories from a list or comma-separated string: (categories, error message)"""
+    if not value:
+        return ["restaurants"], None
+    if isinstance(value, str):
+        value = value.split(',')
+    if not isinstance(value, list):
+        return None, "'categories' must be a list of Qloo categories"
+    categories = list(dict.fromkeys(str(c).strip().lower() for c in value if str(c).strip()))
+    unknown = [c for c in categories if c not in QLOO_CATEGORIES]
+    if unknown:
+        return None, f"Unknown categories: {', '.join(unknown)}. Available: {', '.join(QLOO_CATEGORIES)}"
+    return categories or ["restaurants"], None
+
+def fetch_qloo_categories(location, categories, deadline):
+    """Resolve the city once, then fetch every uncached category in parallel
+    
+    Each category gets QLOO_CATEGORY_TIMEOUT from the moment the city is resolved, so one
+    slow category doesn't hold up the rest. Returns {category: (result, error, timed_out)}.
+    """
+    outcomes = {}
+    for category in categories:
+        cached = recommender.get_cached_qloo_recommendations(location, category)
+        if cached is not None:
+            outcomes[category] = (cached, None, False)
+    missing = [category for category in categories if category not in outcomes]
+    if not missing:
+        return outcomes
+    
+    resolved, error, timed_out = wait_for_upstream(upstream_executor.submit(recommender.resolve_qloo_city, location, deadline), deadline)
+    city, city_error = resolved if resolved is not None else (None, None)
+    if city is None:
+        # Too vague, not found or Qloo failing - the same answer for every category
+        for category in missing:
+            outcomes[category] = (city_error, error, timed_out)
+        return {category: outcomes[category] for category in categories}
+    
+    category_deadline = min(deadline, time.monotonic() + QLOO_CATEGORY_TIMEOUT)
+    futures = {category: upstream_executor.submit(recommender.get_qloo_category, location, city, category, category_deadline)
+               for category in missing}
+    for category, future in futures.items():
+        outcomes[category] = wait_for_upstream(future, category_deadline)
+    return {category: outcomes[category] for category in categories}
+
+def combine_qloo_category(category, outcome):
+    """One category of qloo_recommendations from its (result, error, timed_out) outcome"""
+    result, error, timed_out = outcome
+    if timed_out:
+        # Qloo is taking too long, use fallback
+        record_timeout("qloo")
+        return qloo_unavailable(category)
+    if error:
+        # Qloo failed with error
+        FALLBACKS.inc(upstream="qloo", reason="error")
+        return {"error": f"Qloo API error: {error}"}
+    if not result:
+        # Qloo didn't return anything
+        FALLBACKS.inc(upstream="qloo", reason="empty")
+        singular = category[:-1] if category.endswith("s") else category
+        return {"error": f"Unable to fetch {singular} recommendations"}
+    if isinstance(result, dict) and "error" in result:
+        FALLBACKS.inc(upstream="qloo", reason="error")
+    return result
+
+def combine_recommendations(location, gpt_result, qloo_results):
+    """Merge (result, error, timed_out) outcomes from GPT and each Qloo category into one response, with fallbacks"""
+    gpt_recommendations, gpt_error, gpt_timed_out = gpt_result
+    
+    if gpt_timed_out:
+        # GPT is taking too long, use comprehensive fallback
+        record_timeout("gpt")
+        gpt_recommendations = fallback_recommendations(location, "AI recommendations temporarily unavailable - using fallback recommendations")
+    elif gpt_error:
+        # GPT failed with error, use comprehensive fallback
+        FALLBACKS.inc(upstream="gpt", reason="error")
+        gpt_recommendations = fallback_recommendations(location, f"GPT API error: {gpt_error}")
+    elif isinstance(gpt_recommendations, dict) and "error" in gpt_recommendations:
+        FALLBACKS.inc(upstream="gpt", reason="error")
+    
+    # Handle Qloo results
+    qloo_recommendations = {category: combine_qloo_category(category, outcome) for category, outcome in qloo_results.items()}
+    
+    # Combine recommendations
+    return {
+        "gpt_recommendations": gpt_recommendations,
+        "qloo_recommendations": qloo_recommendations,
+        "generated_at": datetime.now().isoformat()
+    }
+
+def fetch_recommendations(location, preferences, duration, categories):
+    """GPT and every Qloo category for one trip, combined into a response with fallbacks"""
+    # Fan out to GPT and Qloo concurrently on the shared upstream pool so the
+    # request costs the slower of the two calls rather than their sum
+    deadline = time.monotonic() + REQUEST_DEADLINE
+    # GPT (more important - AI recommendations) gets its own slice of the budget
+    gpt_deadline = min(deadline, time.monotonic() + GPT_TIMEOUT)
+    gpt_future = upstream_executor.submit(recommender.get_gpt_recommendations, location, preferences, duration, gpt_deadline)
+    
+    # Qloo (supplementary data) may use whatever is left of the budget; this thread
+    # resolves the city and fans out the categories while GPT is generating
+    qloo_results = fetch_qloo_categories(location, categories, deadline)
+    gpt_result = wait_for_upstream(gpt_future, gpt_deadline)
+    return combine_recommendations(location, gpt_result, qloo_results)
+
+def snapshot_body(location, preferences, duration, categories):
+    """The precomputed response for a trip with empty or generic preferences, or None"""
+    if snapshots is None or not is_generic_preferences(preferences):
+        return None
+    with STAGE_SECONDS.time(stage="snapshot"):
+        return snapshots.get(location, duration, categories)
+
+def recommendations_key(location, preferences, duration, categories):
+    """Key under which a serialized recommendations response is reused"""
+    return make_key("response", normalize_location(location), normalize_preferences(preferences),
+                    normalize_duration(duration), ",".join(categories))
+
+def is_degraded(combined):
+    """Does a combined response carry fallback or error content anywhere?"""
+    parts = [combined.get("gpt_recommendations")] + list(combined.get("qloo_recommendations", {}).values())
+    return any(not isinstance(part, (dict, list)) or (isinstance(part, dict) and "error" in part) for part in parts)
+
+def recommendations_body(key, combined):
+    """Serialize a combined response: (JSONBody, Cache-Control)
+    
+    Responses with fallback content aren't kept or cached by clients, so the next
+    request gets a fresh attempt at the upstreams.
+    """
+    with STAGE_SECONDS.time(stage="serialize"):
+        body = JSONBody.build(combined)
+    if is_degraded(combined):
+        return body, "no-store"
+    response_bodies.set(key, body)
+    return body, RESPONSE_CACHE_CONTROL
+
+def json_response(body, status=200, cache_control="no-store"):
+    """Send a JSONBody compressed as the client accepts, or a 304 when a GET already has this version"""
+    if_none_match = request.headers.get('If-None-Match') if request.method in ('GET', 'HEAD') else None
+    with STAGE_SECONDS.time(stage="compress"):
+        not_modified, encoding, data = body.negotiate(request.headers.get('Accept-Encoding'), if_none_match)
+    RESPONSE_BYTES.observe(len(data), endpoint=route_label(), encoding=encoding)
+    return Response(data, status=304 if not_modified else status, headers=response_headers(body, encoding, cache_control),
+                    mimetype='application/json')
+
+def asset_response(asset, cache_control):
+    """Send the page shell or a static asset compressed as the client accepts, or a 304 for a matching ETag"""
+    not_modified, encoding, data = asset.negotiate(request.headers.get('Accept-Encoding'), request.headers.get('If-None-Match'))
+    return Response(data, status=304 if not_modified else 200, headers=response_headers(asset, encoding, cache_control),
+                    mimetype=asset.mimetype)
+
+def overloaded_response(location, categories):
+    """Fallback response for a request turned away by admission control, built without any upstream call"""
+    FALLBACKS.inc(upstream="gpt", reason="overloaded")
+    FALLBACKS.inc(upstream="qloo", reason="overloaded")
+    return {
+        "gpt_recommendations": fallback_recommendations(location, "High demand right now - using fallback recommendations"),
+        "qloo_recommendations": {category: qloo_unavailable(category) for category in categories},
+        "generated_at": datetime.now().isoformat()
+    }
+
+def run_bounded(tasks, limit, deadline):
+    """Run (fn, *args) tasks on the upstream pool with at most `limit` in flight at once
+    
+    Returns a (result, error, timed_out) outcome per task, in order. Tasks still running or
+    not yet started at the deadline are reported as timed out.
+    """
+    outcomes = [(None, None, True)] * len(tasks)
+    queued = list(enumerate(tasks))
+    running = {}
+    while queued or running:
+        while queued and len(running) < limit:
+            index, (fn, *args) = queued.pop(0)
+            running[upstream_executor.submit(fn, *args)] = index
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        done, _ = wait(running, timeout=remaining, return_when=FIRST_COMPLETED)
+        for future in done:
+            outcomes[running.pop(future)] = wait_for_upstream(future, deadline)
+    for future in running:
+        future.cancel()
+    return outcomes
+
+def batch_item_error(item):
+    """Why one item of a batch can't be planned, or None - a bad item fails alone, not the batch"""
+    if not isinstance(item, dict):
+        return "Each item must be a JSON object"
+    location, _, _, error = parse_trip(item)
+    if error:
+        return error
+    return None if location else "Location is required"
+
+def plan_batch(items):
+    """Deduplicate a batch into unique Qloo cities and GPT trips, with GPT trips grouped per completion
+    
+    Returns (qloo_locations, gpt_groups, item_refs) where item_refs[i] is
+    (qloo index, (group index, position)) for each valid item, or an error dict.
+    """
+    qloo_locations, qloo_index = [], {}
+    trips, trip_index = [], {}
+    item_refs = []
+    for item in items:
+        error = batch_item_error(item)
+        if error:
+            item_refs.append({"error": error})
+            continue
+        location, preferences, duration, _ = parse_trip(item)
+        trip = (location, preferences, duration)
+        
+        city_key = normalize_location(location)
+        if city_key not in qloo_index:
+            qloo_index[city_key] = len(qloo_locations)
+            qloo_locations.append(location)
+        trip_key = recommender._gpt_cache_key(*trip)
+        if trip_key not in trip_index:
+            trip_index[trip_key] = len(trips)
+            trips.append(trip)
+        item_refs.append((qloo_index[city_key], trip_index[trip_key]))
+    
+    # As many trips per completion as the output token budget allows
+    per_group = max(1, BATCH_GPT_MAX_TOKENS // GPT_TOKENS_PER_TRIP)
+    gpt_groups = [trips[i:i + per_group] for i in range(0, len(trips), per_group)]
+    item_refs = [ref if isinstance(ref, dict) else (ref[0], divmod(ref[1], per_group)) for ref in item_refs]
+    return qloo_locations, gpt_groups, item_refs
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    if cache_warmer is not None:
+        # Started from a request rather than at import so it runs in each forked worker
+        cache_warmer.start()
+
+@app.after_request
+def record_request_time(response):
+    # Streamed responses are timed by their generator, once the stream has finished
+    started = g.pop('request_started', None)
+    if started is not None and not response.is_streamed:
+        seconds = time.perf_counter() - started
+        REQUEST_SECONDS.observe(seconds, endpoint=route_label(), status=response.status_code)
+        shape = g.pop('capture', None)
+        if shape is not None:
+            # Stamped with the arrival time, which is what a replay schedules by
+            traffic_capture.record(dict(shape, type="request", status=response.status_code, seconds=round(seconds, 4),
+                                        bytes=response.content_length or 0, ts=round(time.time() - seconds, 4)))
+    return response
+
+def start_capture(shape):
+    """Log this request's shape once it has been answered, if traffic capture is on and samples it"""
+    if traffic_capture is not None and traffic_capture.sampled():
+        g.capture = shape
+
+def note_capture(**fields):
+    """Add to the captured record of this request, e.g. where its answer came from"""
+    shape = g.get('capture')
+    if shape is not None:
+        shape.update(fields)
+
+def route_label():
+    """The matched route pattern (not the raw path), so unknown URLs can't explode label cardinality"""
+    return request.url_rule.rule if request.url_rule is not None else "unmatched"
 
 @app.route('/')
 def index():
-    """Main page"""
-    return render_template('index.html')
+    """Main page: the shell rendered at startup, revalidated by browsers on each visit"""
+    return asset_response(page_shell, REVALIDATE)
+
+@app.route('/assets/<name>')
+def static_asset(name):
+    """The page's stylesheet and script, cached by browsers for a year under fingerprinted names"""
+    asset, cache_control = static_assets.lookup(name)
+    if asset is None:
+        return jsonify({"error": "Not found"}), 404
+    return asset_response(asset, cache_control)
 
-@app.route('/api/recommendations', methods=['POST'])
+@app.route('/api/recommendations', methods=['GET', 'POST'])
 def get_recommendations():
-    """API endpoint to get travel recommendations"""
+    """API endpoint to get travel recommendations (GET takes the same fields as query parameters, for HTTP caching)"""
+    location = ''
     try:
-        data = request.get_json()
-        location = data.get('location', '').strip()
-        preferences = data.get('preferences', '')
-        duration = data.get('duration', '')
-        
+        data = request.get_json() if request.method == 'POST' else request.args
+        location, preferences, duration, error = parse_trip(data)
+        if error:
+            return jsonify({"error": error}), 400
         if not location:
             return jsonify({"error": "Location is required"}), 400
+        categories, categories_error = parse_categories(data.get('categories'))
+        if categories_error:
+            return jsonify({"error": categories_error}), 400
+        record_demand(location, preferences, duration, categories)
+        start_capture(recommendations_shape(request.method, location, preferences, duration, categories))
         
-        # Try GPT first (more important - AI recommendations)
-        gpt_recommendations = None
-        gpt_error = None
+        # An identical request was answered moments ago - send the same bytes again
+        key = recommendations_key(location, preferences, duration, categories)
+        body = response_bodies.get(key)
+        if body is not None:
+            note_capture(source="response_cache")
+            return json_response(body, cache_control=RESPONSE_CACHE_CONTROL)
+        # A popular trip with no particular preferences was answered ahead of time
+        body = snapshot_body(location, preferences, duration, categories)
+        if body is not None:
+            note_capture(source="snapshot")
+            return json_response(body, cache_control=RESPONSE_CACHE_CONTROL)
         
-        def gpt_call():
-            nonlocal gpt_recommendations, gpt_error
-            try:
-                gpt_recommendations = recommender.get_gpt_recommendations(location, preferences, duration)
-            except Exception as e:
-                gpt_error = str(e)
-        
-        # Run GPT in a thread with timeout
-        gpt_thread = threading.Thread(target=gpt_call)
-        gpt_thread.daemon = True
-        gpt_thread.start()
-        gpt_thread.join(timeout=20)  # 20 second timeout (increased from 15s)
-        
-        # Then try Qloo (supplementary restaurant data)
-        qloo_recommendations = None
-        qloo_error = None
-        
-        def qloo_call():
-            nonlocal qloo_recommendations, qloo_error
-            try:
-                qloo_restaurants = recommender.get_qloo_recommendations(location, "restaurants")
-                qloo_recommendations = {
-                    "restaurants": qloo_restaurants
-                }
-            except Exception as e:
-                qloo_error = str(e)
-        
-        # Run Qloo in a thread with timeout
-        qloo_thread = threading.Thread(target=qloo_call)
-        qloo_thread.daemon = True
-        qloo_thread.start()
-        qloo_thread.join(timeout=25)  # 25 second timeout (allowing extra time for Qloo)
-        
-        if gpt_thread.is_alive():
-            # GPT is taking too long, use comprehensive fallback
-            gpt_recommendations = {
-                "error": "AI recommendations temporarily unavailable - using fallback recommendations",
-                "destination_info": {
-                    "name": location,
-                    "best_time_to_visit": "Spring (March-May) and Fall (September-November) are generally the best times to visit most destinations. Check local tourism websites for specific seasonal events.",
-                    "weather_info": "Check weather apps for current conditions. Pack layers for unpredictable weather changes.",
-                    "cultural_highlights": "Explore local museums, historical sites, and cultural districts. Visit during local festivals for authentic experiences."
-                },
-                "food_recommendations": [
-                    {
-                        "name": "Local Street Food",
-                        "cuisine": "Local specialties",
-                        "description": "Try street food vendors for authentic local flavors and budget-friendly dining options.",
-                        "price_range": "Budget-friendly",
-                        "must_try_dishes": ["Local street food", "Traditional dishes"],
-                        "location": "Street markets and food districts"
-                    },
-                    {
-                        "name": "Popular Local Restaurant",
-                        "cuisine": "Regional cuisine",
-                        "description": "Visit well-reviewed local restaurants to experience traditional cooking methods and regional specialties.",
-                        "price_range": "Mid-range",
-                        "must_try_dishes": ["Signature dishes", "Local specialties"],
-                        "location": "City center and popular districts"
-                    }
-                ],
-                "experience_recommendations": [
-                    {
-                        "name": "City Walking Tour",
-                        "category": "Cultural",
-                        "description": "Explore the city on foot to discover hidden gems and local neighborhoods.",
-                        "duration": "2-3 hours",
-                        "best_time": "Morning or late afternoon",
-                        "tips": "Wear comfortable shoes and bring water"
-                    },
-                    {
-                        "name": "Local Market Visit",
-                        "category": "Cultural",
-                        "description": "Visit local markets to experience daily life and find unique souvenirs.",
-                        "duration": "1-2 hours",
-                        "best_time": "Morning for fresh produce",
-                        "tips": "Bargain politely and try local snacks"
-                    }
-                ],
-                "hidden_gems": [
-                    {
-                        "name": "Local Neighborhood",
-                        "type": "Cultural district",
-                        "description": "Explore residential areas away from tourist centers for authentic local experiences.",
-                        "location": "Residential districts"
-                    }
-                ],
-                "travel_tips": [
-                    "Always check local tourism websites for the latest information and current events",
-                    "Consider booking popular attractions in advance to avoid long queues",
-                    "Learn a few basic phrases in the local language - locals appreciate the effort",
-                    "Use public transportation to experience the city like a local",
-                    "Ask hotel staff or locals for restaurant recommendations",
-                    "Keep emergency contact numbers and embassy information handy"
-                ]
-            }
-        elif gpt_error:
-            # GPT failed with error, use comprehensive fallback
-            gpt_recommendations = {
-                "error": f"GPT API error: {gpt_error}",
-                "destination_info": {
-                    "name": location,
-                    "best_time_to_visit": "Spring (March-May) and Fall (September-November) are generally the best times to visit most destinations. Check local tourism websites for specific seasonal events.",
-                    "weather_info": "Check weather apps for current conditions. Pack layers for unpredictable weather changes.",
-                    "cultural_highlights": "Explore local museums, historical sites, and cultural districts. Visit during local festivals for authentic experiences."
-                },
-                "food_recommendations": [
-                    {
-                        "name": "Local Street Food",
-                        "cuisine": "Local specialties",
-                        "description": "Try street food vendors for authentic local flavors and budget-friendly dining options.",
-                        "price_range": "Budget-friendly",
-                        "must_try_dishes": ["Local street food", "Traditional dishes"],
-                        "location": "Street markets and food districts"
-                    },
-                    {
-                        "name": "Popular Local Restaurant",
-                        "cuisine": "Regional cuisine",
-                        "description": "Visit well-reviewed local restaurants to experience traditional cooking methods and regional specialties.",
-                        "price_range": "Mid-range",
-                        "must_try_dishes": ["Signature dishes", "Local specialties"],
-                        "location": "City center and popular districts"
-                    }
-                ],
-                "experience_recommendations": [
-                    {
-                        "name": "City Walking Tour",
-                        "category": "Cultural",
-                        "description": "Explore the city on foot to discover hidden gems and local neighborhoods.",
-                        "duration": "2-3 hours",
-                        "best_time": "Morning or late afternoon",
-                        "tips": "Wear comfortable shoes and bring water"
-                    },
-                    {
-                        "name": "Local Market Visit",
-                        "category": "Cultural",
-                        "description": "Visit local markets to experience daily life and find unique souvenirs.",
-                        "duration": "1-2 hours",
-                        "best_time": "Morning for fresh produce",
-                        "tips": "Bargain politely and try local snacks"
-                    }
-                ],
-                "hidden_gems": [
-                    {
-                        "name": "Local Neighborhood",
-                        "type": "Cultural district",
-                        "description": "Explore residential areas away from tourist centers for authentic local experiences.",
-                        "location": "Residential districts"
-                    }
-                ],
-                "travel_tips": [
-                    "Always check local tourism websites for the latest information and current events",
-                    "Consider booking popular attractions in advance to avoid long queues",
-                    "Learn a few basic phrases in the local language - locals appreciate the effort",
-                    "Use public transportation to experience the city like a local",
-                    "Ask hotel staff or locals for restaurant recommendations",
-                    "Keep emergency contact numbers and embassy information handy"
-                ]
-            }
-        
-        # Handle Qloo results
-        if qloo_thread.is_alive():
-            # Qloo is taking too long, use fallback
-            qloo_recommendations = {
-                "restaurants": {"error": "Qloo API temporarily unavailable - restaurant recommendations not available"}
-            }
-        elif qloo_error:
-            # Qloo failed with error
-            qloo_recommendations = {
-                "restaurants": {"error": f"Qloo API error: {qloo_error}"}
-            }
-        elif not qloo_recommendations:
-            # Qloo didn't return anything
-            qloo_recommendations = {
-                "restaurants": {"error": "Unable to fetch restaurant recommendations"}
-            }
-        
-        # Combine recommendations
-        combined_recommendations = {
-            "gpt_recommendations": gpt_recommendations,
-            "qloo_recommendations": qloo_recommendations,
-            "generated_at": datetime.now().isoformat()
-        }
-        
-        return jsonify(combined_recommendations)
+        # Requests that need upstream calls wait briefly for a slot, or get the fallback straight away
+        cached = recommender.has_cached_recommendations(location, preferences, duration, categories)
+        note_capture(source="cache" if cached else "live")
+        if not cached:
+            with STAGE_SECONDS.time(stage="admission"):
+                admitted = admission.acquire()
+            if not admitted:
+                note_capture(source="overloaded")
+                return json_response(JSONBody.build(overloaded_response(location, categories)))
+        try:
+            combined = fetch_recommendations(location, preferences, duration, categories)
+        finally:
+            if not cached:
+                admission.release()
+        
+        body, cache_control = recommendations_body(key, combined)
+        note_capture(degraded=cache_control == "no-store")
+        return json_response(body, cache_control=cache_control)
         
     except Exception as e:
-        # Return a proper JSON response even on error
-        return jsonify({
-            "gpt_recommendations": {
-                "error": f"Server temporarily unavailable: {str(e)}",
-                "destination_info": {
-                    "name": location,
-                    "best_time_to_visit": "Spring (March-May) and Fall (September-November) are generally the best times to visit most destinations. Check local tourism websites for specific seasonal events.",
-                    "weather_info": "Check weather apps for current conditions. Pack layers for unpredictable weather changes.",
-                    "cultural_highlights": "Explore local museums, historical sites, and cultural districts. Visit during local festivals for authentic experiences."
-                },
-                "food_recommendations": [
-                    {
-                        "name": "Local Street Food",
-                        "cuisine": "Local specialties",
-                        "description": "Try street food vendors for authentic local flavors and budget-friendly dining options.",
-                        "price_range": "Budget-friendly",
-                        "must_try_dishes": ["Local street food", "Traditional dishes"],
-                        "location": "Street markets and food districts"
-                    },
-                    {
-                        "name": "Popular Local Restaurant",
-                        "cuisine": "Regional cuisine",
-                        "description": "Visit well-reviewed local restaurants to experience traditional cooking methods and regional specialties.",
-                        "price_range": "Mid-range",
-                        "must_try_dishes": ["Signature dishes", "Local specialties"],
-                        "location": "City center and popular districts"
-                    }
-                ],
-                "experience_recommendations": [
-                    {
-                        "name": "City Walking Tour",
-                        "category": "Cultural",
-                        "description": "Explore the city on foot to discover hidden gems and local neighborhoods.",
-                        "duration": "2-3 hours",
-                        "best_time": "Morning or late afternoon",
-                        "tips": "Wear comfortable shoes and bring water"
-                    },
-                    {
-                        "name": "Local Market Visit",
-                        "category": "Cultural",
-                        "description": "Visit local markets to experience daily life and find unique souvenirs.",
-                        "duration": "1-2 hours",
-                        "best_time": "Morning for fresh produce",
-                        "tips": "Bargain politely and try local snacks"
-                    }
-                ],
-                "hidden_gems": [
-                    {
-                        "name": "Local Neighborhood",
-                        "type": "Cultural district",
-                        "description": "Explore residential areas away from tourist centers for authentic local experiences.",
-                        "location": "Residential districts"
-                    }
-                ],
-                "travel_tips": [
-                    "Always check local tourism websites for the latest information and current events",
-                    "Consider booking popular attractions in advance to avoid long queues",
-                    "Learn a few basic phrases in the local language - locals appreciate the effort",
-                    "Use public transportation to experience the city like a local",
-                    "Ask hotel staff or locals for restaurant recommendations",
-                    "Keep emergency contact numbers and embassy information handy"
-                ]
-            },
-            "qloo_recommendations": {
-                "restaurants": {"error": "Qloo API temporarily unavailable - restaurant recommendations not available"}
-            },
-            "generated_at": datetime.now().isoformat()
-        }), 500
+        # Return a proper JSON response even on error, spliced into the pre-serialized fallback
+        body = fallback_response_body(location, f"Server temporarily unavailable: {str(e)}", datetime.now().isoformat())
+        return Response(body, status=500, mimetype='application/json')
+
+@app.route('/api/recommendations/batch', methods=['POST'])
+def get_batch_recommendations():
+    """API endpoint to get recommendations for every city of a multi-city trip in one request"""
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({"error": "Request body must be a JSON object"}), 400
+    items = data.get('items')
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "'items' must be a non-empty list of {location, preferences, duration}"}), 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify({"error": f"At most {BATCH_MAX_ITEMS} items per batch"}), 400
+    
+    qloo_locations, gpt_groups, item_refs = plan_batch(items)
+    for item, ref in zip(items, item_refs):
+        if not isinstance(ref, dict):
+            record_demand(*parse_trip(item)[:3], ["restaurants"])
+    
+    # Each unique city is resolved once and each GPT group is one completion; the GPT
+    # groups go first since they are the long pole
+    deadline = time.monotonic() + BATCH_DEADLINE
+    tasks = [(recommender.get_gpt_recommendations_multi, group, deadline) for group in gpt_groups]
+    tasks += [(recommender.get_qloo_recommendations, location, "restaurants", deadline) for location in qloo_locations]
+    outcomes = run_bounded(tasks, BATCH_CONCURRENCY, deadline)
+    gpt_outcomes, qloo_outcomes = outcomes[:len(gpt_groups)], outcomes[len(gpt_groups):]
+    
+    results = []
+    for item, ref in zip(items, item_refs):
+        if isinstance(ref, dict):
+            results.append(ref)
+            continue
+        qloo_ref, (group, position) = ref
+        group_results, gpt_error, gpt_timed_out = gpt_outcomes[group]
+        gpt_result = (group_results[position] if group_results else None, gpt_error, gpt_timed_out)
+        location = parse_trip(item)[0]
+        qloo_results = {"restaurants": qloo_outcomes[qloo_ref]}
+        results.append(dict(combine_recommendations(location, gpt_result, qloo_results), location=location))
+    
+    with STAGE_SECONDS.time(stage="serialize"):
+        body = JSONBody.build({"results": results, "generated_at": datetime.now().isoformat()})
+    return json_response(body)
+
+@app.route('/api/recommendations/stream', methods=['POST'])
+def stream_recommendations():
+    """API endpoint streaming travel recommendations as Server-Sent Events"""
+    location, preferences, duration, error = parse_trip(request.get_json(silent=True) or {})
+    if error:
+        return jsonify({"error": error}), 400
+    if not location:
+        return jsonify({"error": "Location is required"}), 400
+    record_demand(location, preferences, duration, ["restaurants"])
+    
+    return Response(
+        generate_recommendation_events(location, preferences, duration),
+        mimetype='text/event-stream',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def generate_recommendation_events(location, preferences, duration):
+    """Yield the Qloo block as soon as it lands and each GPT section as it completes"""
+    started = time.perf_counter()
+    deadline = time.monotonic() + REQUEST_DEADLINE
+    events = queue.Queue()
+    stop = threading.Event()
+    
+    def stream_gpt():
+        try:
+            for name, value in recommender.stream_gpt_recommendations(location, preferences, duration, stop, deadline):
+                events.put(("section", {"name": name, "value": value}))
+        except Exception as e:
+            FALLBACKS.inc(upstream="gpt", reason="error")
+            events.put(("gpt_error", fallback_recommendations(location, f"GPT API error: {str(e)}")))
+        events.put(("gpt_done", None))
+    
+    def qloo_done(future):
+        try:
+            events.put(("qloo", {"restaurants": future.result()}))
+        except Exception as e:
+            events.put(("qloo", {"restaurants": {"error": f"Qloo API error: {str(e)}"}}))
+    
+    upstream_executor.submit(stream_gpt)
+    qloo_future = upstream_executor.submit(recommender.get_qloo_recommendations, location, "restaurants", deadline)
+    qloo_future.add_done_callback(qloo_done)
+    
+    pending = {"gpt", "qloo"}
+    try:
+        # Flush headers straight away so the browser knows the stream is open. Inside the
+        # try: a client gone before anything else was sent must still stop the GPT stream.
+        yield ": stream open\n\n"
+        
+        while pending:
+            try:
+                event, payload = events.get(timeout=max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if event == "gpt_done":
+                pending.discard("gpt")
+                continue
+            if event == "qloo":
+                pending.discard("qloo")
+            yield sse_event(event, payload)
+        
+        # Whatever hasn't arrived by the deadline is reported as unavailable
+        if "gpt" in pending:
+            record_timeout("gpt")
+            yield sse_frame("gpt_error", fallback_json(location, "AI recommendations temporarily unavailable - using fallback recommendations"))
+        if "qloo" in pending:
+            qloo_future.cancel()
+            record_timeout("qloo")
+            yield sse_frame("qloo", QLOO_UNAVAILABLE_JSON)
+        yield sse_event("done", {"generated_at": datetime.now().isoformat()})
+    finally:
+        stop.set()
+        REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint="/api/recommendations/stream", status=200)
 
 @app.route('/api/qloo-search', methods=['GET'])
 def qloo_search():
@@ -459,30 +1514,188 @@ def qloo_search():
         query = request.args.get('q', '').strip()
         if not query:
             return jsonify({"error": "Query parameter 'q' is required"}), 400
+        if request.args.get('mode') == 'autocomplete':
+            limit = parse_autocomplete_limit(request.args.get('limit'))
+            start_capture(search_shape(query, "autocomplete", limit))
+            local = autocomplete_local(query, limit)
+            if local is not None:
+                note_capture(source="local")
+                return jsonify(local)
+            note_capture(source="qloo")
+            try:
+                # Typeahead never queues for Qloo's rate limit
+                qloo_limiter.acquire(max_wait=0)
+                with upstream_call("qloo", "qloo_search"):
+                    search_data = qloo_client.search(query, "cities", timeout=AUTOCOMPLETE_QLOO_TIMEOUT)
+            except (RateLimitExceeded, requests.exceptions.RequestException):
+                return jsonify({"results": [], "source": "local"})
+            return jsonify(autocomplete_from_search(query, search_data, limit))
         
-        headers = {
-            "Authorization": f"Bearer {QLOO_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        
-        search_url = f"{QLOO_BASE_URL}/search"
-        search_params = {
-            "query": query,
-            "category": "cities"
-        }
+        start_capture(search_shape(query))
+        try:
+            timeout = take_token("qloo", 10)
+        except RateLimitExceeded as e:
+            return jsonify({"error": f"Search error: {str(e)}"}), 429
+        with upstream_call("qloo", "qloo_search"):
+            search_data = qloo_client.search(query, "cities", timeout=timeout)
         
-        response = requests.get(search_url, headers=headers, params=search_params, timeout=10)
-        response.raise_for_status()
+        # Every search teaches the local city index the cities it found, so later lookups
+        # skip Qloo; the query itself wasn't resolved to any of them, so it isn't an alias
+        recommender.city_index.add_search_results(query, search_data.get('results'), alias=False)
         
-        return jsonify(response.json())
+        return jsonify(search_data)
         
     except Exception as e:
         return jsonify({"error": f"Search error: {str(e)}"}), 500
 
+def parse_autocomplete_limit(value):
+    try:
+        return max(1, min(20, int(value)))
+    except (TypeError, ValueError):
+        return AUTOCOMPLETE_LIMIT
+
+def autocomplete_local(query, limit):
+    """Suggestions from the local prefix index, or None when Qloo should be asked instead"""
+    with STAGE_SECONDS.time(stage="autocomplete"):
+        results = city_prefixes.complete(query, limit)
+    if results or len(query) < AUTOCOMPLETE_QLOO_MIN_CHARS:
+        return {"results": results, "source": "local"}
+    return None
+
+def autocomplete_from_search(query, search_data, limit):
+    """Suggestions from a Qloo search made on a local miss; the index learns them for next time"""
+    results = search_data.get('results') or []
+    recommender.city_index.add_search_results(query, results, alias=False)
+    return {"results": [{"name": r.get('name'), "id": r.get('id')} for r in results[:limit]], "source": "qloo"}
+
+def collect_runtime_metrics():
+    """Gauges sampled from the cache, connection pools, single-flight, rate limits and admission at scrape time"""
+    cache_lookups = Gauge("wanderwise_cache_lookups", "Response cache lookups since start", ["source", "result"])
+    cache_entries = Gauge("wanderwise_cache_entries", "Entries in the response cache")
+    pool_in_flight = Gauge("wanderwise_qloo_pool_in_flight", "Qloo requests holding a pooled connection", ["client"])
+    pool_size = Gauge("wanderwise_qloo_pool_size", "Qloo connection pool size", ["client"])
+    coalesced = Gauge("wanderwise_single_flight_coalesced", "Requests that shared another request's upstream call", ["mode"])
+    
+    if recommender.cache is not None:
+        stats = recommender.cache.stats()
+        for source, counters in stats["sources"].items():
+            cache_lookups.set(counters["hits"], source=source, result="hit")
+            cache_lookups.set(counters["misses"], source=source, result="miss")
+        if stats["entries"] is not None:
+            cache_entries.set(stats["entries"])
+    clients = {"sync": qloo_client}
+    if recommender.async_qloo_client is not None:
+        clients["async"] = recommender.async_qloo_client
+    for name, client in clients.items():
+        stats = client.pool_stats()
+        pool_in_flight.set(stats["in_flight"], client=name)
+        pool_size.set(stats["pool_size"], client=name)
+    if recommender.semantic_cache is not None:
+        stats = recommender.semantic_cache.stats()
+        cache_lookups.set(stats["hits"], source="gpt_semantic", result="hit")
+        cache_lookups.set(stats["misses"], source="gpt_semantic", result="miss")
+    stats = response_bodies.stats()
+    cache_lookups.set(stats["hits"], source="response", result="hit")
+    cache_lookups.set(stats["misses"], source="response", result="miss")
+    if snapshots is not None:
+        stats = snapshots.stats()
+        cache_lookups.set(stats["hits"], source="snapshot", result="hit")
+        cache_lookups.set(stats["misses"], source="snapshot", result="miss")
+    coalesced.set(recommender.single_flight.stats()["coalesced"], mode="sync")
+    coalesced.set(recommender.async_single_flight.stats()["coalesced"], mode="async")
+    
+    circuit_open = Gauge("wanderwise_circuit_open", "1 while an upstream's circuit breaker is open or probing", ["upstream"])
+    circuit_rejected = Gauge("wanderwise_circuit_rejected_calls", "Upstream calls failed fast by an open circuit", ["upstream"])
+    for upstream, breaker in CIRCUIT_BREAKERS.items():
+        stats = breaker.stats()
+        circuit_open.set(0 if stats["state"] == CircuitBreaker.CLOSED else 1, upstream=upstream)
+        circuit_rejected.set(stats["rejected_calls"], upstream=upstream)
+    
+    rate_limit_tokens = Gauge("wanderwise_rate_limit_tokens", "Tokens left in an upstream's shared rate-limit bucket (negative while calls queue)", ["upstream"])
+    rate_limit_queued = Gauge("wanderwise_rate_limit_queue_depth", "Upstream calls in this worker waiting for a rate-limit token", ["upstream"])
+    rate_limit_calls = Gauge("wanderwise_rate_limited_calls", "Upstream calls that waited for a token (delayed) or fell back without one (rejected)", ["upstream", "result"])
+    for upstream, limiter in RATE_LIMITERS.items():
+        stats = limiter.stats()
+        rate_limit_tokens.set(stats["tokens"], upstream=upstream)
+        rate_limit_queued.set(stats["queued"], upstream=upstream)
+        rate_limit_calls.set(stats["delayed_calls"], upstream=upstream, result="delayed")
+        rate_limit_calls.set(stats["rejected_calls"], upstream=upstream, result="rejected")
+    stats = admission.stats()
+    admission_active = Gauge("wanderwise_admission_active", "Uncached recommendation requests calling upstreams")
+    admission_queued = Gauge("wanderwise_admission_queue_depth", "Recommendation requests waiting for an admission slot")
+    admission_rejected = Gauge("wanderwise_admission_rejected", "Recommendation requests turned away to the fallback by admission control")
+    admission_active.set(stats["active"])
+    admission_queued.set(stats["queued"])
+    admission_rejected.set(stats["rejected"])
+    gauges = [cache_lookups, cache_entries, pool_in_flight, pool_size, coalesced, circuit_open, circuit_rejected,
+               rate_limit_tokens, rate_limit_queued, rate_limit_calls, admission_active, admission_queued, admission_rejected]
+    if gpt_hedger is not None:
+        stats = gpt_hedger.stats()
+        hedges = Gauge("wanderwise_gpt_hedges", "GPT calls hedged with a second request (sent), won by it (won), or not hedged for lack of budget (skipped)", ["result"])
+        hedge_rate = Gauge("wanderwise_gpt_hedge_rate", "Fraction of GPT calls sent twice")
+        hedge_delay = Gauge("wanderwise_gpt_hedge_delay_seconds", "How long a GPT call runs before it is hedged (learned percentile)")
+        hedges.set(stats["hedged"], result="sent")
+        hedges.set(stats["hedge_wins"], result="won")
+        hedges.set(stats["skipped"], result="skipped")
+        hedge_rate.set(stats["hedge_rate"])
+        hedge_delay.set(stats["delay"])
+        gauges += [hedges, hedge_rate, hedge_delay]
+    if traffic_capture is not None:
+        stats = traffic_capture.stats()
+        captured = Gauge("wanderwise_capture_records", "Traffic capture records written to the log, or dropped with the queue full", ["result"])
+        captured.set(stats["written"], result="written")
+        captured.set(stats["dropped"], result="dropped")
+        gauges.append(captured)
+    startup_seconds = Gauge("wanderwise_startup_seconds", "Time spent in each startup phase, by this worker or the preloaded master it was forked from", ["phase", "process"])
+    for phase, seconds in timings.phases().items():
+        startup_seconds.set(seconds, phase=phase, process="worker")
+    for phase, seconds in timings.parent_phases.items():
+        startup_seconds.set(seconds, phase=phase, process="master")
+    gauges.append(startup_seconds)
+    return gauges
+
+registry.add_collector(collect_runtime_metrics)
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics for this worker"""
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/health')
 def health_check():
     """Health check endpoint"""
-    return jsonify({"status": "healthy", "timestamp": datetime.now().isoformat()})
+    upstreams = upstream_health.status()
+    for upstream, breaker in CIRCUIT_BREAKERS.items():
+        upstreams.setdefault(upstream, {})["circuit"] = breaker.stats()
+    # Still serving (with fallbacks) when an upstream is down, so report degraded rather than fail
+    down = any(u.get("status") == "down" or u["circuit"]["state"] != CircuitBreaker.CLOSED for u in upstreams.values())
+    status = "degraded" if down else "healthy"
+    for upstream, limiter in RATE_LIMITERS.items():
+        if limiter.enabled:
+            upstreams[upstream]["rate_limit"] = limiter.stats()
+    if gpt_hedger is not None:
+        upstreams["gpt"]["hedging"] = gpt_hedger.stats()
+    health = {"status": status, "timestamp": datetime.now().isoformat(), "upstreams": upstreams}
+    health["admission"] = admission.stats()
+    if recommender.cache is not None:
+        health["cache"] = recommender.cache.stats()
+    if recommender.semantic_cache is not None:
+        health["semantic_cache"] = recommender.semantic_cache.stats()
+    if cache_warmer is not None:
+        health["cache_warmer"] = cache_warmer.stats()
+    health["response_bodies"] = dict(response_bodies.stats(), encoder=encoder_name())
+    if snapshots is not None:
+        health["snapshot"] = snapshots.stats()
+    if traffic_capture is not None:
+        health["capture"] = traffic_capture.stats()
+    health["qloo_pool"] = qloo_client.pool_stats()
+    health["startup"] = timings.stats()
+    health["single_flight"] = dict(recommender.single_flight.stats(), peer_waits=recommender.peer_waits)
+    if recommender.async_qloo_client is not None:
+        health["async_qloo_pool"] = recommender.async_qloo_client.pool_stats()
+    return jsonify(health)
+
+timings.record("app_import", time.perf_counter() - IMPORT_STARTED)
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
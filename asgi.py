@@ -0,0 +1,284 @@
+"""
+ASGI entry point for WanderWise
+
+The upstream-bound endpoints (/api/recommendations and /api/qloo-search) are served by
+async handlers, so a slow OpenAI or Qloo call only parks a coroutine instead of pinning
+a worker. Every other route is delegated to the Flask app.
+
+Run with:
+    uvicorn asgi:application --host 0.0.0.0 --port 5000
+    gunicorn -k uvicorn.workers.UvicornWorker -w 2 asgi:application
+"""
+
+import asyncio
+import json
+import os
+import time
+from datetime import datetime
+from urllib.parse import parse_qs
+
+import httpx
+from asgiref.wsgi import WsgiToAsgi
+
+from app import (AUTOCOMPLETE_QLOO_TIMEOUT, GPT_TIMEOUT, QLOO_API_KEY, QLOO_BASE_URL, QLOO_CATEGORY_TIMEOUT,
+                 REQUEST_DEADLINE, RESPONSE_CACHE_CONTROL, UPSTREAM_CONNECT_TIMEOUT, admission, app,
+                 autocomplete_from_search, autocomplete_local, cache_warmer, combine_recommendations,
+                 overloaded_response, parse_autocomplete_limit, parse_categories, parse_trip, qloo_limiter,
+                 recommendations_body, recommendations_key, recommender, record_demand, response_bodies, snapshot_body,
+                 take_token_async, traffic_capture, upstream_call)
+from capture import recommendations_shape, search_shape
+from fallback import fallback_response_body
+from metrics import REQUEST_SECONDS, RESPONSE_BYTES, STAGE_SECONDS
+from qloo_client import AsyncQlooClient
+from resilience import RateLimitExceeded
+from serialization import JSONBody, response_headers
+
+# Keep-alive connections each worker's event loop may hold open to Qloo
+ASYNC_QLOO_POOL_SIZE = int(os.getenv('ASYNC_QLOO_POOL_SIZE', 100))
+
+flask_app = WsgiToAsgi(app)
+
+def ensure_async_clients():
+    """Create the async clients on the serving event loop (lifespan startup or first request)"""
+    if recommender.async_qloo_client is None:
+        recommender.init_async_clients(AsyncQlooClient(QLOO_API_KEY, QLOO_BASE_URL, pool_size=ASYNC_QLOO_POOL_SIZE,
+                                                       connect_timeout=UPSTREAM_CONNECT_TIMEOUT))
+
+async def read_json_body(receive):
+    """Read the full request body and decode it as JSON"""
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+    return json.loads(body) if body else {}
+
+async def send_json(send, payload, status=200):
+    with STAGE_SECONDS.time(stage="serialize"):
+        body = json.dumps(payload).encode()
+    await send_body(send, body, status)
+
+async def send_body(send, body, status=200, headers=()):
+    """Send an already-serialized JSON response"""
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"access-control-allow-origin", b"*"),
+        ] + [(name.lower().encode(), value.encode()) for name, value in headers],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+def request_header(scope, name):
+    """A request header's value from the ASGI scope, or None"""
+    name = name.lower().encode()
+    for key, value in scope.get("headers", []):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+async def send_json_body(scope, send, body, status=200, cache_control="no-store"):
+    """Async counterpart of app.json_response"""
+    if_none_match = request_header(scope, "if-none-match") if scope.get("method") in ("GET", "HEAD") else None
+    with STAGE_SECONDS.time(stage="compress"):
+        not_modified, encoding, data = body.negotiate(request_header(scope, "accept-encoding"), if_none_match)
+    RESPONSE_BYTES.observe(len(data), endpoint=scope["path"], encoding=encoding)
+    await send_body(send, data, 304 if not_modified else status, response_headers(body, encoding, cache_control))
+
+def start_capture(scope, shape):
+    """Async counterpart of app.start_capture: the shape rides on the scope until the response is sent"""
+    if traffic_capture is not None and traffic_capture.sampled():
+        scope["wanderwise.capture"] = shape
+
+def note_capture(scope, **fields):
+    shape = scope.get("wanderwise.capture")
+    if shape is not None:
+        shape.update(fields)
+
+async def wait_for_task(task, deadline):
+    """Async counterpart of app.wait_for_upstream, returning (result, error, timed_out)"""
+    done, _ = await asyncio.wait({task}, timeout=max(0, deadline - time.monotonic()))
+    if not done:
+        # Unlike a thread, a task can really be abandoned - this closes its connection
+        task.cancel()
+        return None, None, True
+    try:
+        return task.result(), None, False
+    except Exception as e:
+        return None, str(e), False
+
+async def fetch_qloo_categories(location, categories, deadline):
+    """Async counterpart of app.fetch_qloo_categories"""
+    outcomes = {}
+    for category in categories:
+        cached = recommender.get_cached_qloo_recommendations(location, category)
+        if cached is not None:
+            outcomes[category] = (cached, None, False)
+    missing = [category for category in categories if category not in outcomes]
+    if not missing:
+        return outcomes
+
+    resolved, error, timed_out = await wait_for_task(asyncio.ensure_future(recommender.resolve_qloo_city_async(location, deadline)), deadline)
+    city, city_error = resolved if resolved is not None else (None, None)
+    if city is None:
+        for category in missing:
+            outcomes[category] = (city_error, error, timed_out)
+        return {category: outcomes[category] for category in categories}
+
+    category_deadline = min(deadline, time.monotonic() + QLOO_CATEGORY_TIMEOUT)
+    tasks = {category: asyncio.ensure_future(recommender.get_qloo_category_async(location, city, category, category_deadline))
+             for category in missing}
+    results = await asyncio.gather(*(wait_for_task(task, category_deadline) for task in tasks.values()))
+    outcomes.update(zip(tasks, results))
+    return {category: outcomes[category] for category in categories}
+
+async def recommendations(scope, receive, send):
+    """Async handler for GET and POST /api/recommendations"""
+    location = ''
+    acquired = False
+    try:
+        if scope.get("method") == "GET":
+            data = {name: values[0] for name, values in parse_qs(scope.get("query_string", b"").decode()).items()}
+        else:
+            try:
+                data = await read_json_body(receive)
+            except ValueError:
+                data = {}
+        location, preferences, duration, error = parse_trip(data)
+        if error:
+            return await send_json(send, {"error": error}, 400)
+        if not location:
+            return await send_json(send, {"error": "Location is required"}, 400)
+        categories, categories_error = parse_categories(data.get('categories'))
+        if categories_error:
+            return await send_json(send, {"error": categories_error}, 400)
+        record_demand(location, preferences, duration, categories)
+        start_capture(scope, recommendations_shape(scope["method"], location, preferences, duration, categories))
+
+        key = recommendations_key(location, preferences, duration, categories)
+        body = response_bodies.get(key)
+        if body is not None:
+            note_capture(scope, source="response_cache")
+            return await send_json_body(scope, send, body, cache_control=RESPONSE_CACHE_CONTROL)
+        body = snapshot_body(location, preferences, duration, categories)
+        if body is not None:
+            note_capture(scope, source="snapshot")
+            return await send_json_body(scope, send, body, cache_control=RESPONSE_CACHE_CONTROL)
+
+        cached = recommender.has_cached_recommendations(location, preferences, duration, categories)
+        note_capture(scope, source="cache" if cached else "live")
+        if not cached:
+            with STAGE_SECONDS.time(stage="admission"):
+                acquired = await admission.acquire_async()
+            if not acquired:
+                note_capture(scope, source="overloaded")
+                return await send_json_body(scope, send, JSONBody.build(overloaded_response(location, categories)))
+
+        deadline = time.monotonic() + REQUEST_DEADLINE
+        gpt_deadline = min(deadline, time.monotonic() + GPT_TIMEOUT)
+        gpt_task = asyncio.ensure_future(recommender.get_gpt_recommendations_async(location, preferences, duration, gpt_deadline))
+
+        qloo_results = await fetch_qloo_categories(location, categories, deadline)
+        gpt_result = await wait_for_task(gpt_task, gpt_deadline)
+
+        body, cache_control = recommendations_body(key, combine_recommendations(location, gpt_result, qloo_results))
+        note_capture(scope, degraded=cache_control == "no-store")
+        await send_json_body(scope, send, body, cache_control=cache_control)
+    except Exception as e:
+        body = fallback_response_body(location, f"Server temporarily unavailable: {str(e)}", datetime.now().isoformat())
+        await send_body(send, body, 500)
+    finally:
+        if acquired:
+            admission.release()
+
+async def qloo_search(scope, receive, send):
+    """Async handler for GET /api/qloo-search"""
+    params = parse_qs(scope.get("query_string", b"").decode())
+    query = params.get("q", [""])[0].strip()
+    if not query:
+        return await send_json(send, {"error": "Query parameter 'q' is required"}, 400)
+    if params.get("mode", [""])[0] == "autocomplete":
+        limit = parse_autocomplete_limit(params.get("limit", [None])[0])
+        start_capture(scope, search_shape(query, "autocomplete", limit))
+        local = autocomplete_local(query, limit)
+        if local is not None:
+            note_capture(scope, source="local")
+            return await send_json(send, local)
+        note_capture(scope, source="qloo")
+        try:
+            await qloo_limiter.acquire_async(max_wait=0)
+            with upstream_call("qloo", "qloo_search"):
+                search_data = await recommender.async_qloo_client.search(query, "cities", timeout=AUTOCOMPLETE_QLOO_TIMEOUT)
+        except (RateLimitExceeded, httpx.HTTPError):
+            return await send_json(send, {"results": [], "source": "local"})
+        return await send_json(send, autocomplete_from_search(query, search_data, limit))
+
+    start_capture(scope, search_shape(query))
+    try:
+        timeout = await take_token_async("qloo", 10)
+    except RateLimitExceeded as e:
+        return await send_json(send, {"error": f"Search error: {str(e)}"}, 429)
+    try:
+        with upstream_call("qloo", "qloo_search"):
+            search_data = await recommender.async_qloo_client.search(query, "cities", timeout=timeout)
+    except Exception as e:
+        return await send_json(send, {"error": f"Search error: {str(e)}"}, 500)
+
+    recommender.city_index.add_search_results(query, search_data.get('results'), alias=False)
+    await send_json(send, search_data)
+
+ASYNC_ROUTES = {
+    ("GET", "/api/recommendations"): recommendations,
+    ("POST", "/api/recommendations"): recommendations,
+    ("GET", "/api/qloo-search"): qloo_search,
+}
+
+async def lifespan(scope, receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            ensure_async_clients()
+            if cache_warmer is not None:
+                cache_warmer.start()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            if cache_warmer is not None:
+                cache_warmer.stop()
+            if recommender.async_qloo_client is not None:
+                await recommender.async_qloo_client.aclose()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+async def application(scope, receive, send):
+    """ASGI application: async handlers for upstream-bound routes, Flask for everything else"""
+    if scope["type"] == "lifespan":
+        return await lifespan(scope, receive, send)
+
+    handler = ASYNC_ROUTES.get((scope.get("method"), scope.get("path"))) if scope["type"] == "http" else None
+    if handler is not None:
+        ensure_async_clients()
+        started = time.perf_counter()
+        status = [500]
+        sent = [0]
+
+        async def send_and_record_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            else:
+                sent[0] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            return await handler(scope, receive, send_and_record_status)
+        finally:
+            seconds = time.perf_counter() - started
+            REQUEST_SECONDS.observe(seconds, endpoint=scope["path"], status=status[0])
+            shape = scope.get("wanderwise.capture")
+            if shape is not None:
+                traffic_capture.record(dict(shape, type="request", status=status[0], seconds=round(seconds, 4), bytes=sent[0],
+                                            ts=round(time.time() - seconds, 4)))
+
+    await flask_app(scope, receive, send)
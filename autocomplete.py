@@ -0,0 +1,116 @@
+"""
+In-memory prefix index of city names for location autocomplete
+
+Names come from a seed list of popular destinations and from every city the local
+city index learns from Qloo search results. Every normalized name is stored in a
+sorted array once per word it can be completed from ("new york" under both "new york"
+and "york"), so completing a prefix is a bisect plus a short scan - no upstream call.
+"""
+
+import bisect
+import json
+import threading
+
+from cache import normalize_location
+
+# Candidates looked at per query; enough to rank a one-letter prefix sensibly
+MAX_SCAN = 400
+
+
+def word_starts(normalized):
+    """The name and every suffix of it that starts at a word: 'new york, usa' -> 'york, usa', 'usa'"""
+    forms = [normalized]
+    for i, ch in enumerate(normalized):
+        if ch in " ,-" and i + 1 < len(normalized) and normalized[i + 1] not in " ,-":
+            forms.append(normalized[i + 1:])
+    return forms
+
+
+class PrefixIndex:
+    """Sorted (form, name) pairs searched with bisect, ranked by where the match is and popularity"""
+
+    def __init__(self):
+        self._cities = {}  # normalized name -> {"name", "id", "popularity"}
+        self._forms = []   # sorted (form, normalized name)
+        self._heads = {}   # 'tokyo' -> 'tokyo, japan', so Qloo's "Tokyo" fills in the seed's id
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._cities)
+
+    def add(self, name, entity_id=None, popularity=0.0):
+        """Add a city, or fill in its Qloo id and raise its popularity if it's already known"""
+        normalized = normalize_location(name)
+        if not normalized:
+            return
+        with self._lock:
+            city = self._cities.get(normalized) or self._cities.get(self._heads.get(normalized))
+            if city is None:
+                self._cities[normalized] = {"name": name.strip(), "id": entity_id, "popularity": popularity}
+                for form in word_starts(normalized):
+                    bisect.insort(self._forms, (form, normalized))
+                head = normalized.split(",")[0].strip()
+                if head != normalized:
+                    self._heads.setdefault(head, normalized)
+                return
+            if entity_id and not city["id"]:
+                city["id"] = entity_id
+            city["popularity"] = max(city["popularity"], popularity)
+
+    def add_city(self, city):
+        """Add a city entity from the city index ({"id", "name", "aliases"})"""
+        self.add(city["name"], city.get("id"))
+
+    def touch(self, name):
+        """Count a city as chosen, so it ranks higher for everyone after"""
+        normalized = normalize_location(name)
+        with self._lock:
+            city = self._cities.get(normalized) or self._cities.get(self._heads.get(normalized))
+            if city is not None:
+                city["popularity"] += 1
+
+    def complete(self, prefix, limit=8):
+        """Up to limit {"name", "id"} matches for prefix, best first
+
+        Matches at the start of the name beat matches at a later word, then more
+        popular cities beat less popular ones, then shorter names beat longer ones.
+        """
+        prefix = normalize_location(prefix)
+        if not prefix:
+            return []
+        with self._lock:
+            position = bisect.bisect_left(self._forms, (prefix,))
+            best = {}
+            for form, normalized in self._forms[position:position + MAX_SCAN]:
+                if not form.startswith(prefix):
+                    break
+                at_start = form == normalized
+                if normalized not in best or at_start:
+                    best[normalized] = at_start
+            ranked = sorted(best.items(), key=lambda item: (
+                not item[1], -self._cities[item[0]]["popularity"], len(item[0]), item[0]))
+            return [{"name": self._cities[normalized]["name"], "id": self._cities[normalized]["id"]}
+                    for normalized, _ in ranked[:limit]]
+
+
+def load_seed_cities(path):
+    """Seed list of popular destinations, most popular first (empty if the file is missing)"""
+    try:
+        with open(path) as f:
+            names = json.load(f)
+    except (OSError, ValueError):
+        return []
+    return [name for name in names if isinstance(name, str) and name.strip()]
+
+def build_prefix_index(seed_path, city_index=None):
+    """Index the seed list (ranked by its order) and every city the city index knows"""
+    index = PrefixIndex()
+    seeds = load_seed_cities(seed_path)
+    for position, name in enumerate(seeds):
+        index.add(name, popularity=len(seeds) - position)
+    if city_index is not None:
+        for city in city_index.cities():
+            index.add_city(city)
+        city_index.on_add(index.add_city)
+    return index
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Local stand-ins for the OpenAI and Qloo APIs, for benchmarking WanderWise without API keys
+
+One HTTP server answers both APIs:
+    POST /v1/chat/completions   OpenAI chat completions (plain and stream=true)
+    GET  /search                Qloo city search
+    GET  /recommendations       Qloo recommendations
+
+Latency, error rate and timeout rate are configured per upstream. Latency specs:
+    fixed:0.5            always 0.5s
+    uniform:0.2,1.5      uniformly between 0.2s and 1.5s
+    normal:1.0,0.3       normal with mean 1.0s and standard deviation 0.3s
+    lognormal:1.0,0.5    log-normal with median 1.0s and sigma 0.5 (long right tail)
+
+Run standalone:
+    python benchmarks/fake_upstreams.py --port 8900 --openai-latency lognormal:2,0.4 --qloo-error-rate 0.05
+"""
+
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+RECOMMENDATION_CONTENT = {
+    "destination_info": {
+        "name": "{location}",
+        "best_time_to_visit": "Spring and autumn for mild weather.",
+        "weather_info": "Warm summers and cool winters.",
+        "cultural_highlights": "Historic old town, museums and local festivals."
+    },
+    "food_recommendations": [
+        {"name": "Old Town Market", "cuisine": "Local", "description": "Stalls serving regional snacks.",
+         "price_range": "Budget-friendly", "must_try_dishes": ["Dumplings", "Flatbread"], "location": "Old Town"},
+        {"name": "Harbour Grill", "cuisine": "Seafood", "description": "Fresh catch cooked over charcoal.",
+         "price_range": "Mid-range", "must_try_dishes": ["Grilled fish"], "location": "Harbour"}
+    ],
+    "experience_recommendations": [
+        {"name": "Walking Tour", "category": "Cultural", "description": "Guided walk through the historic center.",
+         "duration": "2 hours", "best_time": "Morning", "tips": "Wear comfortable shoes"}
+    ],
+    "hidden_gems": [
+        {"name": "Rooftop Garden", "type": "Park", "description": "Quiet garden with city views.", "location": "Center"}
+    ],
+    "travel_tips": ["Buy a transit pass", "Carry some cash", "Book museums ahead"]
+}
+
+
+def parse_latency(spec):
+    """Turn a latency spec like 'lognormal:1.0,0.5' into a function returning seconds"""
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",") if v] if args else []
+    if kind == "fixed":
+        return lambda: values[0]
+    if kind == "uniform":
+        return lambda: random.uniform(values[0], values[1])
+    if kind == "normal":
+        return lambda: max(0.0, random.gauss(values[0], values[1]))
+    if kind == "lognormal":
+        return lambda: random.lognormvariate(math.log(values[0]), values[1])
+    raise ValueError(f"Unknown latency spec: {spec}")
+
+
+class UpstreamProfile:
+    """How one fake upstream behaves: latency distribution, error rate and hang (timeout) rate"""
+
+    def __init__(self, latency="fixed:0", error_rate=0.0, timeout_rate=0.0, hang_seconds=60.0, error_status=500):
+        self.latency_spec = latency
+        self.latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.hang_seconds = hang_seconds
+        self.error_status = error_status
+
+    @classmethod
+    def from_samples(cls, latencies, error_rate=0.0, timeout_rate=0.0):
+        """A profile whose requests each take one of the given latencies, drawn at random (e.g. from a traffic capture)"""
+        profile = cls(error_rate=error_rate, timeout_rate=timeout_rate)
+        profile.latency_spec = f"empirical:{len(latencies)} samples"
+        profile.latency = (lambda: random.choice(latencies)) if latencies else (lambda: 0.0)
+        return profile
+
+    def describe(self):
+        return {"latency": self.latency_spec, "error_rate": self.error_rate, "timeout_rate": self.timeout_rate}
+
+    def outcome(self):
+        """Decide how to answer one request: ('ok' | 'error' | 'hang', delay seconds)"""
+        roll = random.random()
+        if roll < self.timeout_rate:
+            return "hang", self.hang_seconds
+        if roll < self.timeout_rate + self.error_rate:
+            return "error", self.latency()
+        return "ok", self.latency()
+
+
+class FakeUpstreamHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _apply_profile(self, upstream):
+        """Sleep per the upstream's profile; returns False if an error response was sent"""
+        profile = self.server.profiles[upstream]
+        outcome, delay = profile.outcome()
+        self.server.count(upstream, outcome)
+        time.sleep(delay)
+        if outcome == "error":
+            self._send_json({"error": {"message": "fake upstream error"}}, profile.error_status)
+            return False
+        return True
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        if url.path not in ("/search", "/recommendations"):
+            return self._send_json({"error": "not found"}, 404)
+        if not self._apply_profile("qloo"):
+            return
+
+        if url.path == "/search":
+            query = params.get("query", "")
+            slug = re.sub(r"[^a-z0-9]+", "-", query.lower()).strip("-")
+            self._send_json({"results": [{"id": f"city-{slug}", "name": query.split(",")[0].strip().title()}]})
+        else:
+            category = params.get("category", "restaurants")
+            limit = int(params.get("limit", 10))
+            self._send_json({"results": [
+                {"name": f"{category.title()} {i + 1}", "category": category, "location": params.get("entity_id"), "rating": 4.5}
+                for i in range(limit)
+            ]})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if urlparse(self.path).path.rstrip("/") not in ("/v1/chat/completions", "/chat/completions"):
+            return self._send_json({"error": "not found"}, 404)
+        if not self._apply_profile("openai"):
+            return
+
+        prompt = " ".join(str(m.get("content", "")) for m in request.get("messages", []))
+        trips = re.findall(r"^\s*\d+\.\s*(.+?) - Duration:", prompt, re.MULTILINE)
+        if trips:
+            # Multi-trip prompt from the batch endpoint
+            content = json.dumps({"trips": [
+                json.loads(json.dumps(RECOMMENDATION_CONTENT).replace("{location}", trip)) for trip in trips
+            ]})
+        else:
+            match = re.search(r"(?:tips for|Location:)\s*([^.\n]+)", prompt)
+            location = match.group(1).strip() if match else "Benchmark City"
+            content = json.dumps(RECOMMENDATION_CONTENT).replace("{location}", location)
+        usage = {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4,
+                 "total_tokens": (len(prompt) + len(content)) // 4}
+
+        if request.get("stream"):
+            include_usage = (request.get("stream_options") or {}).get("include_usage")
+            return self._stream_completion(content, usage if include_usage else None)
+        self._send_json({
+            "id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()),
+            "model": request.get("model", "gpt-4o-mini"),
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+            "usage": usage,
+        })
+
+    def _stream_completion(self, content, usage):
+        """Stream the completion as OpenAI-style SSE chunks, spread over a short interval"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        step = 40
+        for i in range(0, len(content), step):
+            chunk = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": "gpt-4o-mini",
+                     "choices": [{"index": 0, "delta": {"content": content[i:i + step]}, "finish_reason": None}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+            time.sleep(self.server.stream_chunk_delay)
+        if usage is not None:
+            chunk = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": "gpt-4o-mini", "choices": [], "usage": usage}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        self.wfile.write(b"data: [DONE]\n\n")
+
+
+class FakeUpstreamServer(ThreadingHTTPServer):
+    """Threaded fake OpenAI + Qloo server with per-upstream behaviour profiles"""
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, port=0, openai_profile=None, qloo_profile=None, stream_chunk_delay=0.02):
+        super().__init__(("127.0.0.1", port), FakeUpstreamHandler)
+        self.profiles = {"openai": openai_profile or UpstreamProfile(), "qloo": qloo_profile or UpstreamProfile()}
+        self.stream_chunk_delay = stream_chunk_delay
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def count(self, upstream, outcome):
+        with self._lock:
+            key = f"{upstream}_{outcome}"
+            self._counts[key] = self._counts.get(key, 0) + 1
+
+    def counts(self):
+        with self._lock:
+            return dict(self._counts)
+
+    def start(self):
+        """Serve in a background thread and return self"""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def add_profile_arguments(parser):
+    """Command-line options shared by the benchmark and replay tools"""
+    for upstream, default_latency in (("openai", "lognormal:1.5,0.35"), ("qloo", "lognormal:0.3,0.4")):
+        parser.add_argument(f"--{upstream}-latency", default=default_latency, help=f"{upstream} latency spec")
+        parser.add_argument(f"--{upstream}-error-rate", type=float, default=0.0)
+        parser.add_argument(f"--{upstream}-timeout-rate", type=float, default=0.0,
+                            help=f"fraction of {upstream} calls that hang (to exercise timeouts)")
+
+def profiles_from_args(args):
+    return (
+        UpstreamProfile(args.openai_latency, args.openai_error_rate, args.openai_timeout_rate),
+        UpstreamProfile(args.qloo_latency, args.qloo_error_rate, args.qloo_timeout_rate),
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI and Qloo upstreams for local benchmarking")
+    parser.add_argument("--port", type=int, default=8900)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    openai_profile, qloo_profile = profiles_from_args(args)
+    server = FakeUpstreamServer(args.port, openai_profile, qloo_profile)
+    print(f"Fake upstreams listening on {server.base_url}")
+    print(f"  OPENAI_BASE_URL={server.base_url}/v1")
+    print(f"  QLOO_BASE_URL={server.base_url}")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
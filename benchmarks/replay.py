@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+Replay captured WanderWise traffic against local fake upstreams, profiling the server
+
+Reads the JSONL logs written with CAPTURE_TRAFFIC=true (see capture.py). Each log holds
+request records and upstream call records.
+- The fake OpenAI and Qloo servers answer with latencies drawn from the captured calls,
+  and fail at the captured rate.
+- The app runs in a single process on the threaded Werkzeug server, started by this
+  script.
+- Captured requests are sent at their original pace, or faster or slower with --speed.
+- While the replay runs, every server thread is profiled with cProfile. A sampler also
+  records all thread stacks every few milliseconds.
+
+Writes:
+    <profile>.prof     cProfile stats (python -m pstats, snakeviz, gprof2dot)
+    <profile>.folded   wall-clock stacks in folded format (flamegraph.pl, speedscope, inferno)
+and prints a JSON report comparing captured and replayed latency per endpoint.
+
+Examples:
+    python benchmarks/replay.py captures/
+    python benchmarks/replay.py captures/traffic-1234.jsonl --speed 4 --profile /tmp/replay
+    python benchmarks/replay.py captures/ --speed 0 --limit 500 --env CACHE_BACKEND=none
+"""
+
+import argparse
+import cProfile
+import glob
+import json
+import os
+import pstats
+import re
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from fake_upstreams import FakeUpstreamServer, UpstreamProfile
+from run_benchmark import REPO_ROOT, free_port, git_revision, is_fallback, percentile, summarize
+
+sys.path.insert(0, REPO_ROOT)
+from capture import preferences_from_shape
+
+
+def log_files(paths):
+    """Capture logs named on the command line; a directory means every traffic-*.jsonl* in it"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(glob.glob(os.path.join(path, "traffic-*.jsonl*")))
+        else:
+            files.append(path)
+    return files
+
+
+def load_capture(paths):
+    """(request records sorted by time, {upstream: [upstream records]})"""
+    records, calls = [], defaultdict(list)
+    for path in log_files(paths):
+        with open(path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # a line cut short by a crash or rotation
+                if record.get("type") == "request":
+                    records.append(record)
+                elif record.get("type") == "upstream":
+                    calls[record["upstream"]].append(record)
+    records.sort(key=lambda record: record["ts"])
+    return records, calls
+
+
+def upstream_profile(calls):
+    """A fake upstream answering like the captured calls: their latencies, failing at their rate"""
+    latencies = [call["seconds"] for call in calls if call.get("ok")]
+    failures = sum(1 for call in calls if not call.get("ok"))
+    return UpstreamProfile.from_samples(latencies, error_rate=failures / len(calls) if calls else 0.0)
+
+
+def captured_summary(records):
+    """Per-endpoint server latency and answer sources as captured"""
+    summary = {}
+    for endpoint in sorted({record["endpoint"] for record in records}):
+        group = [record for record in records if record["endpoint"] == endpoint]
+        latencies = sorted(record["seconds"] for record in group)
+        summary[endpoint] = {
+            "requests": len(group),
+            "latency_ms": {name: round(1000 * percentile(latencies, pct), 1) for name, pct in (("p50", 50), ("p95", 95), ("p99", 99))},
+            "sources": dict(Counter(record.get("source", "unknown") for record in group)),
+            "mean_response_bytes": round(sum(record.get("bytes", 0) for record in group) / len(group)),
+        }
+    return summary
+
+
+def send(session, base_url, record, timeout):
+    """Re-issue one captured request; returns (status, bytes, parsed body)"""
+    if record["endpoint"] == "search":
+        params = {"q": record["q"]}
+        if record.get("mode"):
+            params.update(mode=record["mode"], limit=record.get("limit"))
+        response = session.get(f"{base_url}/api/qloo-search", params=params, timeout=timeout)
+    else:
+        trip = {"location": record["location"], "duration": record.get("duration", ""),
+                "preferences": preferences_from_shape(record.get("preferences", {})),
+                "categories": ",".join(record.get("categories") or ["restaurants"])}
+        if record.get("method") == "GET":
+            response = session.get(f"{base_url}/api/recommendations", params=trip, timeout=timeout)
+        else:
+            response = session.post(f"{base_url}/api/recommendations", json=trip, timeout=timeout)
+    try:
+        body = response.json()
+    except ValueError:
+        body = None
+    return response.status_code, len(response.content), body
+
+
+class Replayer:
+    """Sends captured requests at their captured offsets, divided by speed (0: back to back)"""
+
+    def __init__(self, base_url, records, speed, concurrency, timeout):
+        self.base_url = base_url
+        self.records = records
+        self.speed = speed
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.samples = []
+        self.lags = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _one(self, record, due):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        started = time.perf_counter()
+        lag = max(0.0, time.monotonic() - due)
+        try:
+            status, size, body = send(session, self.base_url, record, self.timeout)
+        except requests.exceptions.RequestException:
+            status, size, body = 0, 0, None
+        latency = time.perf_counter() - started
+        with self._lock:
+            self.lags.append(lag)
+            self.samples.append({"endpoint": record["endpoint"], "status": status, "latency": latency, "bytes": size,
+                                 "fallback": status != 0 and is_fallback(record["endpoint"], status, body)})
+
+    def run(self):
+        """Replay every record; returns the elapsed seconds"""
+        started = time.monotonic()
+        first = self.records[0]["ts"] if self.records else 0
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            for record in self.records:
+                due = started + (record["ts"] - first) / self.speed if self.speed > 0 else time.monotonic()
+                delay = due - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(self._one, record, due)
+        return time.monotonic() - started
+
+
+class ThreadProfilers:
+    """A cProfile profiler in every thread the server starts (cProfile only sees the thread that enabled it)"""
+
+    def __init__(self):
+        self.profilers = []
+        self._lock = threading.Lock()
+
+    def install(self):
+        threading.setprofile(self._start_in_thread)
+        self._start_in_thread()
+
+    def _start_in_thread(self, *args):
+        profiler = cProfile.Profile()
+        with self._lock:
+            self.profilers.append(profiler)
+        profiler.enable()  # replaces this hook for the rest of the thread's life
+
+    def write(self, path):
+        threading.setprofile(None)
+        stats = None
+        with self._lock:
+            profilers = list(self.profilers)
+        for profiler in profilers:
+            profiler.create_stats()
+            if not profiler.stats:
+                continue
+            if stats is None:
+                stats = pstats.Stats(profiler)
+            else:
+                stats.add(profiler)
+        if stats is not None:
+            stats.dump_stats(path)
+
+
+# Leaf frames of threads with nothing to do: an idle pool worker, the server waiting for connections
+IDLE_FRAMES = ("_worker (thread.py:", "select (selectors.py:")
+
+
+class StackSampler(threading.Thread):
+    """Samples every busy thread's Python stack at an interval into folded-stack counts for flame graphs"""
+
+    def __init__(self, interval):
+        super().__init__(name="stack-sampler", daemon=True)
+        self.interval = interval
+        self.counts = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        names = {}
+        while not self._stop_event.wait(self.interval):
+            for thread in threading.enumerate():
+                # "upstream_12" -> "upstream", so a pool's threads share one root
+                names[thread.ident] = re.sub(r"[_-]?\d+$", "", thread.name.split(" ")[0]) or thread.name
+            for ident, frame in sys._current_frames().items():
+                if ident == self.ident:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                if stack and stack[0].startswith(IDLE_FRAMES):
+                    continue
+                self.counts[";".join([names.get(ident, "thread")] + stack[::-1])] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def write(self, path):
+        with open(path, "w") as f:
+            for stack, count in self.counts.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def serve(args):
+    """Run the app on the threaded Werkzeug server under the profilers until SIGTERM"""
+    from werkzeug.serving import make_server
+
+    profilers = ThreadProfilers() if args.profile else None
+    sampler = StackSampler(args.sample_interval) if args.profile else None
+    if profilers is not None:
+        profilers.install()
+    import app
+
+    server = make_server("127.0.0.1", args.port, app.app, threaded=True)
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+    if sampler is not None:
+        sampler.start()
+    server.serve_forever()
+    if sampler is not None:
+        sampler.stop()
+        sampler.write(args.profile + ".folded")
+        profilers.write(args.profile + ".prof")
+
+
+def start_server(port, profile, sample_interval, env):
+    command = [sys.executable, os.path.abspath(__file__), "serve", "--port", str(port), "--sample-interval", str(sample_interval)]
+    if profile:
+        command += ["--profile", os.path.abspath(profile)]
+    process = subprocess.Popen(command, cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"App exited during startup:\n{process.stderr.read().decode()}")
+        try:
+            requests.get(f"http://127.0.0.1:{port}/health", timeout=1)
+            return process
+        except requests.exceptions.RequestException:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("App did not become healthy within 30s")
+
+
+def replay(args):
+    records, calls = load_capture(args.logs)
+    if args.limit:
+        records = records[:args.limit]
+    if not records:
+        raise SystemExit("No request records in the capture")
+    openai_profile, qloo_profile = upstream_profile(calls["gpt"]), upstream_profile(calls["qloo"])
+    upstreams = FakeUpstreamServer(0, openai_profile, qloo_profile).start()
+
+    workdir = tempfile.mkdtemp(prefix="wanderwise-replay-")
+    port = free_port()
+    env = dict(os.environ)
+    env.update({
+        "OPENAI_API_KEY": "replay-key",
+        "OPENAI_BASE_URL": f"{upstreams.base_url}/v1",
+        "QLOO_API_KEY": "replay-key",
+        "QLOO_BASE_URL": upstreams.base_url,
+        "CACHE_BACKEND": "memory",
+        "CITY_INDEX_PATH": os.path.join(workdir, "city_index.json"),
+        "CACHE_PATH": os.path.join(workdir, "cache.sqlite3"),
+        "RATE_LIMIT_PATH": os.path.join(workdir, "ratelimit.sqlite3"),
+        "SNAPSHOT_PATH": "",
+        "CAPTURE_TRAFFIC": "false",
+    })
+    env.update(item.split("=", 1) for item in args.env)
+
+    profile = None if args.no_profile else args.profile
+    server = start_server(port, profile, args.sample_interval, env)
+    try:
+        replayer = Replayer(f"http://127.0.0.1:{port}", records, args.speed, args.concurrency, args.client_timeout)
+        elapsed = replayer.run()
+    finally:
+        server.send_signal(signal.SIGTERM)
+        try:
+            server.wait(timeout=60)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        upstreams.shutdown()
+
+    lags = sorted(replayer.lags)
+    report = {
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {"logs": log_files(args.logs), "requests": len(records), "speed": args.speed,
+                   "concurrency": args.concurrency, "elapsed_s": round(elapsed, 2), "app_env": args.env,
+                   "openai": openai_profile.describe(), "qloo": qloo_profile.describe()},
+        "captured": captured_summary(records),
+        "replayed": summarize(replayer.samples, elapsed),
+        # How far sends fell behind the captured schedule (the client pool was full)
+        "schedule_lag_ms": {"p50": round(1000 * percentile(lags, 50), 1), "max": round(1000 * lags[-1], 1)},
+        "upstream_calls": upstreams.counts(),
+    }
+    if profile:
+        report["profile"] = {"cprofile": profile + ".prof", "folded_stacks": profile + ".folded"}
+    output = json.dumps(report, indent=2, default=str)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+
+def main():
+    if sys.argv[1:2] == ["serve"]:
+        # The server process a replay starts
+        parser = argparse.ArgumentParser(prog="replay.py serve")
+        parser.add_argument("--port", type=int, required=True)
+        parser.add_argument("--profile")
+        parser.add_argument("--sample-interval", type=float, default=0.005)
+        return serve(parser.parse_args(sys.argv[2:]))
+
+    parser = argparse.ArgumentParser(description="Replay captured WanderWise traffic and profile the server")
+    parser.add_argument("logs", nargs="+", help="capture logs, or directories of traffic-*.jsonl files")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay rate relative to the capture; 0 sends back to back")
+    parser.add_argument("--concurrency", type=int, default=64, help="most requests in flight at once")
+    parser.add_argument("--limit", type=int, help="only the first N captured requests")
+    parser.add_argument("--profile", default="replay", help="path prefix for the .prof and .folded profiles")
+    parser.add_argument("--no-profile", action="store_true", help="replay without profiling the server")
+    parser.add_argument("--sample-interval", type=float, default=0.005, help="seconds between stack samples")
+    parser.add_argument("--client-timeout", type=float, default=60.0)
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="extra environment for the app, e.g. --env CACHE_BACKEND=none")
+    parser.add_argument("--output", help="write the JSON report here as well as to stdout")
+    replay(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Load/latency benchmark for WanderWise against local fake upstreams
+
+Boots the fake OpenAI/Qloo server and the app (gunicorn, the Flask dev server or the
+ASGI app under uvicorn), drives /api/recommendations, /api/qloo-search and /health at
+the requested concurrency, and writes throughput, p50/p95/p99 latency and fallback
+rate as JSON so runs can be compared across commits.
+
+Examples:
+    python benchmarks/run_benchmark.py --concurrency 16 --duration 30
+    python benchmarks/run_benchmark.py --server uvicorn --concurrency 200 --requests 2000
+    python benchmarks/run_benchmark.py --openai-latency fixed:3 --openai-timeout-rate 0.1 --output bench.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from fake_upstreams import FakeUpstreamServer, add_profile_arguments, profiles_from_args
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LOCATIONS = ["Tokyo, Japan", "Paris, France", "Lisbon", "New York", "Mexico City", "Seoul", "Rome", "Cape Town",
+             "Bangkok", "Istanbul", "Buenos Aires", "Sydney", "Marrakech", "Reykjavik", "Hanoi", "Vienna"]
+DURATIONS = ["Weekend getaway (2-3 days)", "Short trip (4-7 days)", "Medium trip (1-2 weeks)"]
+PREFERENCES = ["", "I love street food and history", "museums, art and coffee", "hiking and nature", "nightlife"]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def start_app(server, port, workers, env):
+    """Start the app in a subprocess and wait until /health answers"""
+    if server == "gunicorn":
+        command = [sys.executable, "-m", "gunicorn", "-w", str(workers), "-b", f"127.0.0.1:{port}",
+                   "--timeout", "120", "app:app"]
+    elif server == "uvicorn":
+        command = [sys.executable, "-m", "uvicorn", "asgi:application", "--host", "127.0.0.1", "--port", str(port),
+                   "--workers", str(workers), "--log-level", "warning"]
+    else:
+        command = [sys.executable, "app.py"]
+    process = subprocess.Popen(command, cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"App exited during startup:\n{process.stderr.read().decode()}")
+        try:
+            requests.get(f"http://127.0.0.1:{port}/health", timeout=1)
+            return process
+        except requests.exceptions.RequestException:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("App did not become healthy within 30s")
+
+
+def is_fallback(endpoint, status, body):
+    """Did the app answer with degraded (fallback/error) content instead of real upstream data?"""
+    if endpoint != "recommendations":
+        return status >= 400
+    if status >= 400 or not isinstance(body, dict):
+        return True
+    gpt = body.get("gpt_recommendations") or {}
+    restaurants = (body.get("qloo_recommendations") or {}).get("restaurants") or {}
+    return "error" in gpt or "error" in restaurants
+
+
+class LoadGenerator:
+    """Drives a weighted mix of endpoints from a pool of client threads"""
+
+    def __init__(self, base_url, mix, timeout, seed):
+        self.base_url = base_url
+        self.mix = mix
+        self.timeout = timeout
+        self.random = random.Random(seed)
+        self.samples = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def _pick(self):
+        with self._lock:
+            endpoint = self.random.choices(list(self.mix), weights=list(self.mix.values()))[0]
+            return endpoint, self.random.choice(LOCATIONS), self.random.choice(DURATIONS), self.random.choice(PREFERENCES)
+
+    def one_request(self):
+        endpoint, location, duration, preferences = self._pick()
+        session = self._session()
+        started = time.perf_counter()
+        try:
+            if endpoint == "recommendations":
+                response = session.post(f"{self.base_url}/api/recommendations", timeout=self.timeout,
+                                        json={"location": location, "duration": duration, "preferences": preferences})
+            elif endpoint == "search":
+                response = session.get(f"{self.base_url}/api/qloo-search", params={"q": location}, timeout=self.timeout)
+            else:
+                response = session.get(f"{self.base_url}/health", timeout=self.timeout)
+            status, size = response.status_code, len(response.content)
+            try:
+                body = response.json()
+            except ValueError:
+                body = None
+        except requests.exceptions.RequestException:
+            status, size, body = 0, 0, None
+        latency = time.perf_counter() - started
+
+        with self._lock:
+            self.samples.append({
+                "endpoint": endpoint, "status": status, "latency": latency, "bytes": size,
+                "fallback": status != 0 and is_fallback(endpoint, status, body),
+            })
+
+    def run(self, concurrency, duration=None, total_requests=None):
+        """Keep `concurrency` requests in flight until the duration or request count is reached"""
+        stop_at = time.monotonic() + duration if duration else None
+        issued = [0]
+        issued_lock = threading.Lock()
+
+        def worker():
+            while True:
+                if stop_at is not None and time.monotonic() >= stop_at:
+                    return
+                with issued_lock:
+                    if total_requests is not None and issued[0] >= total_requests:
+                        return
+                    issued[0] += 1
+                self.one_request()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for _ in range(concurrency):
+                executor.submit(worker)
+        return time.perf_counter() - started
+
+
+def summarize(samples, elapsed):
+    """Per-endpoint and overall throughput, latency percentiles, error and fallback rates"""
+    def stats(group):
+        latencies = sorted(s["latency"] for s in group)
+        count = len(group)
+        return {
+            "requests": count,
+            "throughput_rps": round(count / elapsed, 2) if elapsed else None,
+            "latency_ms": {
+                "mean": round(1000 * sum(latencies) / count, 1) if count else None,
+                "p50": round(1000 * percentile(latencies, 50), 1) if count else None,
+                "p95": round(1000 * percentile(latencies, 95), 1) if count else None,
+                "p99": round(1000 * percentile(latencies, 99), 1) if count else None,
+                "max": round(1000 * latencies[-1], 1) if count else None,
+            },
+            "error_rate": round(sum(1 for s in group if s["status"] == 0 or s["status"] >= 500) / count, 4) if count else None,
+            "fallback_rate": round(sum(1 for s in group if s["fallback"]) / count, 4) if count else None,
+            "mean_response_bytes": round(sum(s["bytes"] for s in group) / count) if count else None,
+        }
+
+    endpoints = sorted({s["endpoint"] for s in samples})
+    return {
+        "overall": stats(samples),
+        "endpoints": {endpoint: stats([s for s in samples if s["endpoint"] == endpoint]) for endpoint in endpoints},
+    }
+
+
+def parse_mix(spec):
+    """'recommendations=8,search=1,health=1' -> weights dict"""
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    unknown = set(mix) - {"recommendations", "search", "health"}
+    if unknown:
+        raise SystemExit(f"Unknown endpoints in --mix: {', '.join(sorted(unknown))}")
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark WanderWise against local fake upstreams")
+    parser.add_argument("--server", choices=["gunicorn", "uvicorn", "flask"], default="gunicorn")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=8, help="client requests kept in flight")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds to run (ignored with --requests)")
+    parser.add_argument("--requests", type=int, help="stop after this many requests instead of --duration")
+    parser.add_argument("--warmup", type=int, default=0, help="requests to send (and discard) before measuring")
+    parser.add_argument("--mix", default="recommendations=8,search=1,health=1", help="endpoint weights")
+    parser.add_argument("--client-timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="extra environment for the app, e.g. --env CACHE_BACKEND=sqlite")
+    parser.add_argument("--output", help="write the JSON report here as well as to stdout")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    openai_profile, qloo_profile = profiles_from_args(args)
+    upstreams = FakeUpstreamServer(0, openai_profile, qloo_profile).start()
+
+    workdir = tempfile.mkdtemp(prefix="wanderwise-bench-")
+    port = free_port()
+    env = dict(os.environ)
+    env.update({
+        "PORT": str(port),
+        "OPENAI_API_KEY": "bench-key",
+        "OPENAI_BASE_URL": f"{upstreams.base_url}/v1",
+        "QLOO_API_KEY": "bench-key",
+        "QLOO_BASE_URL": upstreams.base_url,
+        # Measure the upstream path by default; opt into caching with --env CACHE_BACKEND=...
+        "CACHE_BACKEND": "none",
+        "CITY_INDEX_PATH": os.path.join(workdir, "city_index.json"),
+        "CACHE_PATH": os.path.join(workdir, "cache.sqlite3"),
+    })
+    env.update(item.split("=", 1) for item in args.env)
+
+    app_process = start_app(args.server, port, args.workers, env)
+    try:
+        base_url = f"http://127.0.0.1:{port}"
+        mix = parse_mix(args.mix)
+        if args.warmup:
+            LoadGenerator(base_url, mix, args.client_timeout, args.seed).run(args.concurrency, total_requests=args.warmup)
+
+        generator = LoadGenerator(base_url, mix, args.client_timeout, args.seed)
+        elapsed = generator.run(args.concurrency, duration=None if args.requests else args.duration,
+                                total_requests=args.requests)
+        report = {
+            "revision": git_revision(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "config": {
+                "server": args.server, "workers": args.workers, "concurrency": args.concurrency,
+                "mix": mix, "elapsed_s": round(elapsed, 2), "app_env": args.env,
+                "openai": openai_profile.describe(),
+                "qloo": qloo_profile.describe(),
+            },
+            "upstream_calls": upstreams.counts(),
+            "results": summarize(generator.samples, elapsed),
+        }
+    finally:
+        app_process.terminate()
+        try:
+            app_process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            app_process.kill()
+        upstreams.shutdown()
+
+    output = json.dumps(report, indent=2, default=str)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+"""
+Response cache for WanderWise upstream calls (GPT and Qloo)
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Words that don't change what a traveller is asking for
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "for", "i", "im", "in", "into",
+    "is", "it", "like", "love", "me", "my", "of", "on", "or", "really", "so", "the", "to",
+    "very", "want", "we", "with", "would",
+}
+
+def _text(value):
+    """A request field as text: None is empty, and other JSON values are taken as written"""
+    return "" if value is None else str(value)
+
+def normalize_location(location):
+    """Case- and whitespace-fold a location so 'Tokyo ,  Japan' and 'tokyo, japan' match"""
+    location = re.sub(r"\s+", " ", _text(location).strip().casefold())
+    return re.sub(r"\s*,\s*", ", ", location).strip(" ,.")
+
+def normalize_preferences(preferences):
+    """Canonicalize free-text preferences into their meaningful words, in the order written
+
+    Order is kept ("museums, not nightlife" isn't "nightlife, not museums"), and words
+    in any script count. Text with no words left keeps its own folded form rather than
+    collapsing into the key for no preferences.
+    """
+    text = re.sub(r"\s+", " ", _text(preferences).strip().casefold())
+    words = [word for word in re.findall(r"[\w$]+", text) if word not in STOPWORDS]
+    return " ".join(words) if words else text
+
+def normalize_duration(duration):
+    """Case- and whitespace-fold a trip duration"""
+    return re.sub(r"\s+", " ", _text(duration).strip().casefold())
+
+def make_key(source, *parts):
+    """Build a cache key for an upstream source from already-normalized parts"""
+    return f"{source}:" + "|".join(parts)
+
+
+class CacheBackend:
+    """Storage interface for the response cache"""
+
+    def get(self, key):
+        """Return the cached value, or None if missing or expired"""
+        raise NotImplementedError
+
+    def set(self, key, value, ttl):
+        """Store a JSON-serializable value for ttl seconds"""
+        raise NotImplementedError
+
+    def expires_in(self, key):
+        """Seconds until key expires, or None if it isn't cached"""
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def acquire_lease(self, key, ttl):
+        """Claim the right to fetch key for up to ttl seconds; False if another process holds it
+
+        Backends that aren't shared between processes have nobody to coordinate with.
+        """
+        return True
+
+    def release_lease(self, key):
+        pass
+
+    def lease_held(self, key):
+        return False
+
+
+class MemoryCache(CacheBackend):
+    """In-process LRU cache with per-entry expiry (not shared between workers)"""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def expires_in(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.time():
+            return None
+        return entry[0] - time.time()
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class SQLiteCache(CacheBackend):
+    """On-disk LRU cache shared by every gunicorn worker on the same host"""
+
+    # Trim the table back to max_entries every this many writes
+    PRUNE_INTERVAL = 50
+
+    def __init__(self, path, max_entries=10000):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)")
+            conn.execute("CREATE TABLE IF NOT EXISTS leases (key TEXT PRIMARY KEY, expires_at REAL NOT NULL)")
+
+    def _connect(self):
+        # sqlite3 connections can't be shared between threads, so keep one per thread. Nor
+        # between processes: a worker forked from a preloaded master opens its own.
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, key):
+        conn = self._connect()
+        row = conn.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        now = time.time()
+        if expires_at <= now:
+            conn.execute("DELETE FROM cache WHERE key = ? AND expires_at <= ?", (key, now))
+            return None
+        conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+        return json.loads(value)
+
+    def set(self, key, value, ttl):
+        now = time.time()
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value), now + ttl, now),
+        )
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % self.PRUNE_INTERVAL == 0
+        if prune:
+            self._prune(conn, now)
+
+    def expires_in(self, key):
+        row = self._connect().execute("SELECT expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None or row[0] <= time.time():
+            return None
+        return row[0] - time.time()
+
+    def _prune(self, conn, now):
+        """Drop expired rows, then the least recently used rows beyond max_entries"""
+        conn.execute("DELETE FROM cache WHERE expires_at <= ?", (now,))
+        conn.execute(
+            "DELETE FROM cache WHERE key NOT IN "
+            "(SELECT key FROM cache ORDER BY accessed_at DESC LIMIT ?)",
+            (self.max_entries,),
+        )
+
+    def delete(self, key):
+        self._connect().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self):
+        self._connect().execute("DELETE FROM cache")
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def acquire_lease(self, key, ttl):
+        """Claim key across workers; an expired lease (crashed holder) can be taken over"""
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM leases WHERE key = ? AND expires_at <= ?", (key, now))
+            acquired = conn.execute(
+                "INSERT OR IGNORE INTO leases (key, expires_at) VALUES (?, ?)", (key, now + ttl)
+            ).rowcount == 1
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+        return acquired
+
+    def release_lease(self, key):
+        self._connect().execute("DELETE FROM leases WHERE key = ?", (key,))
+
+    def lease_held(self, key):
+        row = self._connect().execute(
+            "SELECT 1 FROM leases WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return row is not None
+
+
+class ResponseCache:
+    """Per-source TTLs and hit/miss counters in front of a cache backend"""
+
+    def __init__(self, backend, ttls):
+        self.backend = backend
+        self.ttls = dict(ttls)
+        self._counters = {source: {"hits": 0, "misses": 0} for source in self.ttls}
+        self._lock = threading.Lock()
+
+    def get(self, source, key):
+        try:
+            value = self.backend.get(key)
+        except sqlite3.Error:
+            # A broken cache must never take down a request
+            value = None
+        with self._lock:
+            counters = self._counters.setdefault(source, {"hits": 0, "misses": 0})
+            counters["hits" if value is not None else "misses"] += 1
+        return value
+
+    def set(self, source, key, value):
+        try:
+            self.backend.set(key, value, self.ttls.get(source, 3600))
+        except sqlite3.Error:
+            pass
+
+    def peek(self, key):
+        """Read the backend without touching the hit/miss counters"""
+        try:
+            return self.backend.get(key)
+        except sqlite3.Error:
+            return None
+
+    def expires_in(self, key):
+        """Seconds until key expires (None if it isn't cached), without touching the counters"""
+        try:
+            return self.backend.expires_in(key)
+        except sqlite3.Error:
+            return None
+
+    def acquire_lease(self, key, ttl):
+        try:
+            return self.backend.acquire_lease(key, ttl)
+        except sqlite3.Error:
+            # Can't coordinate - fetch ourselves rather than fail the request
+            return True
+
+    def release_lease(self, key):
+        try:
+            self.backend.release_lease(key)
+        except sqlite3.Error:
+            pass
+
+    def lease_held(self, key):
+        try:
+            return self.backend.lease_held(key)
+        except sqlite3.Error:
+            return False
+
+    def stats(self):
+        """Hit/miss counters per source, plus the backend's current size"""
+        with self._lock:
+            sources = {source: dict(counters) for source, counters in self._counters.items()}
+        for counters in sources.values():
+            lookups = counters["hits"] + counters["misses"]
+            counters["hit_rate"] = round(counters["hits"] / lookups, 3) if lookups else 0.0
+        try:
+            entries = len(self.backend)
+        except sqlite3.Error:
+            entries = None
+        return {"backend": type(self.backend).__name__, "entries": entries, "sources": sources}
+
+
+def create_cache_from_env():
+    """Build the response cache described by CACHE_* environment variables (None if disabled)"""
+    backend_name = os.getenv("CACHE_BACKEND", "memory").lower()
+    max_entries = int(os.getenv("CACHE_MAX_ENTRIES", 1024))
+    if backend_name in ("none", "off", "disabled"):
+        return None
+    if backend_name == "sqlite":
+        backend = SQLiteCache(os.getenv("CACHE_PATH", "wanderwise_cache.sqlite3"), max_entries=max_entries)
+    else:
+        backend = MemoryCache(max_entries=max_entries)
+    ttls = {
+        "gpt": int(os.getenv("CACHE_TTL_GPT", 6 * 3600)),
+        "qloo": int(os.getenv("CACHE_TTL_QLOO", 24 * 3600)),
+    }
+    return ResponseCache(backend, ttls)
@@ -0,0 +1,158 @@
+"""
+Traffic capture: a rotating JSONL log of request shapes and upstream timings
+
+With CAPTURE_TRAFFIC=true, each /api/recommendations and /api/qloo-search request
+appends one "request" record. The record holds the request's shape, its status, server
+time, response size and where the answer came from. Each OpenAI or Qloo call appends
+an "upstream" record with its duration and whether it succeeded.
+benchmarks/replay.py re-drives such a log against local fake upstreams.
+
+Nothing a traveller typed is kept verbatim except the city. Preferences are kept only
+as a word count and a short hash, so a replay repeats the same mix of identical and
+distinct requests. Preferences made only of generic words ("must see highlights") are
+kept as they are. Requests only queue their records; a background thread encodes and
+writes them in batches. Each worker writes its own file, which is rotated at max_bytes.
+When the queue is full, records are dropped rather than slowing requests down.
+"""
+
+import hashlib
+import os
+import queue
+import random
+import threading
+import time
+
+from cache import normalize_location, normalize_preferences
+from serialization import dumps
+from snapshot import is_generic_preferences
+
+MAX_QUERY_LENGTH = 64  # longer search queries are cut short in the log
+WRITE_BATCH = 500  # records encoded and written at once
+
+
+def preferences_shape(preferences):
+    """What a capture keeps of free-text preferences"""
+    normalized = normalize_preferences(preferences)
+    if is_generic_preferences(preferences):
+        return {"generic": True, "text": normalized}
+    return {"words": len(normalized.split()), "hash": hashlib.blake2b(normalized.encode(), digest_size=6).hexdigest()}
+
+
+def preferences_from_shape(shape):
+    """Preferences text for replaying a captured shape: equal hashes give equal text"""
+    if shape.get("generic"):
+        return shape.get("text", "")
+    return f"interest {shape['hash']}"
+
+
+def recommendations_shape(method, location, preferences, duration, categories):
+    return {"endpoint": "recommendations", "method": method, "location": normalize_location(location),
+            "preferences": preferences_shape(preferences), "duration": duration, "categories": categories}
+
+
+def search_shape(query, mode=None, limit=None):
+    shape = {"endpoint": "search", "q": normalize_location(query)[:MAX_QUERY_LENGTH]}
+    if mode:
+        shape.update(mode=mode, limit=limit)
+    return shape
+
+
+class TrafficCapture:
+    """Queues capture records and appends them to this worker's rotating JSONL file from a background thread"""
+
+    def __init__(self, directory, max_bytes=50 * 1024 * 1024, backups=3, sample_rate=1.0, queue_size=10000):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.sample_rate = sample_rate
+        self.queue_size = queue_size
+        self._queue = queue.Queue(queue_size)
+        self._pid = None
+        self._lock = threading.Lock()
+        self._recorded = 0
+        self._written = 0
+        self._dropped = 0
+        self._rotations = 0
+
+    @property
+    def path(self):
+        return os.path.join(self.directory, f"traffic-{os.getpid()}.jsonl")
+
+    def sampled(self):
+        """Should this request be captured? (decided once per request)"""
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def record(self, entry):
+        """Queue one record for writing; never blocks the request"""
+        entry.setdefault("ts", round(time.time(), 4))
+        if self._pid != os.getpid():
+            self._start_writer()
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            with self._lock:
+                self._dropped += 1
+            return
+        with self._lock:
+            self._recorded += 1
+
+    def _start_writer(self):
+        # Started by the first record in each process, so forked workers get their own
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(self.queue_size)
+            os.makedirs(self.directory, exist_ok=True)
+            threading.Thread(target=self._run, args=(self._queue, self.path), name="traffic-capture", daemon=True).start()
+            self._pid = os.getpid()
+
+    def _run(self, records, path):
+        f = None
+        while True:
+            batch = [records.get()]
+            while len(batch) < WRITE_BATCH:
+                try:
+                    batch.append(records.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                if f is None:
+                    f = open(path, "ab")
+                f.write(b"".join(dumps(entry) + b"\n" for entry in batch))
+                f.flush()
+                with self._lock:
+                    self._written += len(batch)
+                if f.tell() >= self.max_bytes:
+                    f.close()
+                    f = None
+                    self._rotate(path)
+            except (OSError, TypeError, ValueError):
+                with self._lock:
+                    self._dropped += len(batch)
+            finally:
+                for _ in batch:
+                    records.task_done()
+
+    def _rotate(self, path):
+        """traffic-<pid>.jsonl -> .1 -> .2 ... keeping `backups` old files"""
+        for index in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{path}.{index}"):
+                os.replace(f"{path}.{index}", f"{path}.{index + 1}")
+        if self.backups > 0:
+            os.replace(path, f"{path}.1")
+        else:
+            os.remove(path)
+        with self._lock:
+            self._rotations += 1
+
+    def flush(self, timeout=5):
+        """Wait (up to timeout seconds) until every queued record is written"""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def stats(self):
+        with self._lock:
+            return {"path": self.path, "sample_rate": self.sample_rate, "recorded": self._recorded,
+                    "written": self._written, "dropped": self._dropped, "queued": self._queue.qsize(),
+                    "rotations": self._rotations}
@@ -0,0 +1,207 @@
+"""
+Local city-resolution index mapping city names to Qloo entity ids
+"""
+
+import atexit
+import bisect
+import difflib
+import json
+import os
+import tempfile
+import threading
+
+from cache import normalize_location
+
+# How close a misspelling has to be to be suggested (difflib ratio)
+FUZZY_CUTOFF = 0.8
+
+def name_forms(name):
+    """Normalized forms a city can be looked up by: 'Tokyo, Japan' -> {'tokyo, japan', 'tokyo'}"""
+    normalized = normalize_location(name)
+    forms = {normalized} if normalized else set()
+    head = normalized.split(",")[0].strip()
+    if head:
+        forms.add(head)
+    return forms
+
+
+class CityIndex:
+    """Maps city names, aliases and normalized forms to Qloo city entities, persisted as JSON
+
+    With save_delay, new entries are written by a background save that many seconds after
+    the first unsaved change, so a burst of learned cities is one write and no request
+    waits on the file. Otherwise every change is saved straight away.
+    """
+
+    def __init__(self, path=None, save_delay=None):
+        self.path = path
+        self.save_delay = save_delay
+        self._save_pending = None  # pid of the process with a background save scheduled
+        self._cities = {}        # entity id -> {"id", "name", "aliases"}
+        self._forms = {}         # normalized form -> entity id
+        self._sorted_forms = []  # every normalized form, sorted for prefix lookups
+        self._listeners = []     # called with each newly learned city
+        self._lock = threading.RLock()
+        self.load()
+        if path and save_delay is not None:
+            atexit.register(self.flush)
+
+    def __len__(self):
+        return len(self._cities)
+
+    def cities(self):
+        """Snapshot of every known city entity"""
+        with self._lock:
+            return [dict(city) for city in self._cities.values()]
+
+    def on_add(self, callback):
+        """Call callback(city) whenever a new city is learned (e.g. to feed autocomplete)"""
+        self._listeners.append(callback)
+
+    def load(self):
+        """Load entries persisted by this or another worker"""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                cities = json.load(f).get("cities", [])
+        except (OSError, ValueError):
+            return
+        with self._lock:
+            for city in cities:
+                self._add(city.get("id"), city.get("name"), city.get("aliases", []))
+
+    def save(self):
+        """Atomically write the index, merging entries other workers saved meanwhile"""
+        if not self.path:
+            return
+        with self._lock:
+            self._save_pending = None
+            self.load()
+            payload = {"cities": sorted(self._cities.values(), key=lambda city: city["name"])}
+            directory = os.path.dirname(os.path.abspath(self.path))
+            tmp_path = None
+            try:
+                fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+                with os.fdopen(fd, "w") as f:
+                    json.dump(payload, f)
+                os.replace(tmp_path, self.path)
+            except OSError:
+                # Also run from a background timer, where raising would only print a traceback
+                if tmp_path is not None and os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+    def flush(self):
+        """Write a pending background save now (e.g. at exit)"""
+        if self._save_pending == os.getpid():
+            self.save()
+
+    def _changed(self):
+        if self.save_delay is None:
+            self.save()
+            return
+        with self._lock:
+            # A forked worker doesn't inherit its parent's timer, so it schedules its own
+            if self._save_pending == os.getpid():
+                return  # the save already scheduled will include this change
+            self._save_pending = os.getpid()
+        timer = threading.Timer(self.save_delay, self.save)
+        timer.daemon = True
+        timer.start()
+
+    def _add(self, entity_id, name, aliases=()):
+        """Register a city and its aliases; returns True if anything new was learned"""
+        if not entity_id or not name:
+            return False
+        changed = entity_id not in self._cities
+        city = self._cities.setdefault(entity_id, {"id": entity_id, "name": name, "aliases": []})
+        if changed:
+            for callback in self._listeners:
+                callback(city)
+        for alias in aliases:
+            if alias and alias != city["name"] and alias not in city["aliases"]:
+                city["aliases"].append(alias)
+                changed = True
+        for text in [city["name"]] + city["aliases"]:
+            for form in name_forms(text):
+                if form not in self._forms:
+                    self._forms[form] = entity_id
+                    bisect.insort(self._sorted_forms, form)
+                    changed = True
+        return changed
+
+    def add(self, entity_id, name, aliases=()):
+        """Register a city and persist the index if it changed"""
+        with self._lock:
+            changed = self._add(entity_id, name, aliases)
+        if changed:
+            self._changed()
+
+    def add_search_results(self, query, results, alias=True):
+        """Learn cities from a Qloo /search response
+
+        With alias, the query becomes an alias of the top hit: only pass it for a query
+        that was resolved to that city, never for a typeahead prefix or a plain search.
+        """
+        changed = False
+        with self._lock:
+            for position, result in enumerate(results or []):
+                aliases = [query.strip()] if alias and position == 0 and query else []
+                changed = self._add(result.get("id"), result.get("name"), aliases) or changed
+        if changed:
+            self._changed()
+
+    def _qualifiers(self, city):
+        """Country and region parts of a city's name and aliases: 'Paris, France' -> {'france'}"""
+        parts = set()
+        for text in [city["name"]] + city["aliases"]:
+            parts.update(part.strip() for part in normalize_location(text).split(",")[1:])
+        return parts
+
+    def _fits(self, city, qualifier):
+        """Does a city agree with the qualifier the user typed ('texas' in 'Paris, Texas')?"""
+        return not qualifier or set(qualifier) <= self._qualifiers(city)
+
+    def lookup(self, query):
+        """Resolve user text to a city entity by its name or an alias, or None
+
+        Only the exact text counts. A prefix or close spelling of a known city may be a
+        different, real city that isn't indexed yet ("Lima" is not Limassol), so those
+        are left to Qloo (see suggest).
+        """
+        normalized = normalize_location(query)
+        if not normalized:
+            return None
+        head, *qualifier = [part.strip() for part in normalized.split(",")]
+        with self._lock:
+            # Exact match on the full text. The leading city part alone only counts when
+            # nothing else was typed, or the known city has the same country or region:
+            # "Paris, Texas" must not resolve to Paris, France.
+            if normalized in self._forms:
+                return self._cities[self._forms[normalized]]
+            if head in self._forms and self._fits(self._cities[self._forms[head]], qualifier):
+                return self._cities[self._forms[head]]
+        return None
+
+    def suggest(self, query):
+        """A known city the text might have meant, for a "did you mean" - never a resolution"""
+        normalized = normalize_location(query)
+        if not normalized:
+            return None
+        head, *qualifier = [part.strip() for part in normalized.split(",")]
+        with self._lock:
+            # Prefix match, preferring the shortest (most specific) completion
+            position = bisect.bisect_left(self._sorted_forms, normalized)
+            completions = []
+            while position < len(self._sorted_forms) and self._sorted_forms[position].startswith(normalized):
+                completions.append(self._sorted_forms[position])
+                position += 1
+            if completions:
+                return self._cities[self._forms[min(completions, key=len)]]
+
+            # Close misspellings like "Tokio"
+            for match in difflib.get_close_matches(normalized, self._forms.keys(), n=3, cutoff=FUZZY_CUTOFF):
+                city = self._cities[self._forms[match]]
+                if self._fits(city, qualifier):
+                    return city
+        return None
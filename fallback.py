@@ -0,0 +1,151 @@
+"""
+Fallback recommendations served when GPT is unavailable
+
+The payloads are built and serialized once at import; per response only the location
+and error message are spliced into the pre-serialized JSON. Curated per-city fallbacks
+can be supplied in a JSON file (FALLBACK_PATH) keyed by city name.
+"""
+
+import json
+import os
+
+from cache import normalize_location
+
+GENERIC_DESTINATION_INFO = {
+    "best_time_to_visit": "Spring (March-May) and Fall (September-November) are generally the best times to visit most destinations. Check local tourism websites for specific seasonal events.",
+    "weather_info": "Check weather apps for current conditions. Pack layers for unpredictable weather changes.",
+    "cultural_highlights": "Explore local museums, historical sites, and cultural districts. Visit during local festivals for authentic experiences."
+}
+
+GENERIC_SECTIONS = {
+    "food_recommendations": [
+        {
+            "name": "Local Street Food",
+            "cuisine": "Local specialties",
+            "description": "Try street food vendors for authentic local flavors and budget-friendly dining options.",
+            "price_range": "Budget-friendly",
+            "must_try_dishes": ["Local street food", "Traditional dishes"],
+            "location": "Street markets and food districts"
+        },
+        {
+            "name": "Popular Local Restaurant",
+            "cuisine": "Regional cuisine",
+            "description": "Visit well-reviewed local restaurants to experience traditional cooking methods and regional specialties.",
+            "price_range": "Mid-range",
+            "must_try_dishes": ["Signature dishes", "Local specialties"],
+            "location": "City center and popular districts"
+        }
+    ],
+    "experience_recommendations": [
+        {
+            "name": "City Walking Tour",
+            "category": "Cultural",
+            "description": "Explore the city on foot to discover hidden gems and local neighborhoods.",
+            "duration": "2-3 hours",
+            "best_time": "Morning or late afternoon",
+            "tips": "Wear comfortable shoes and bring water"
+        },
+        {
+            "name": "Local Market Visit",
+            "category": "Cultural",
+            "description": "Visit local markets to experience daily life and find unique souvenirs.",
+            "duration": "1-2 hours",
+            "best_time": "Morning for fresh produce",
+            "tips": "Bargain politely and try local snacks"
+        }
+    ],
+    "hidden_gems": [
+        {
+            "name": "Local Neighborhood",
+            "type": "Cultural district",
+            "description": "Explore residential areas away from tourist centers for authentic local experiences.",
+            "location": "Residential districts"
+        }
+    ],
+    "travel_tips": [
+        "Always check local tourism websites for the latest information and current events",
+        "Consider booking popular attractions in advance to avoid long queues",
+        "Learn a few basic phrases in the local language - locals appreciate the effort",
+        "Use public transportation to experience the city like a local",
+        "Ask hotel staff or locals for restaurant recommendations",
+        "Keep emergency contact numbers and embassy information handy"
+    ]
+}
+
+def qloo_unavailable(category):
+    """Placeholder for a Qloo category that didn't answer in time"""
+    singular = category[:-1] if category.endswith("s") else category
+    return {"error": f"Qloo API temporarily unavailable - {singular} recommendations not available"}
+
+QLOO_UNAVAILABLE = {"restaurants": qloo_unavailable("restaurants")}
+QLOO_UNAVAILABLE_JSON = json.dumps(QLOO_UNAVAILABLE)
+
+def _tail(obj):
+    """Serialize a dict without its opening brace, ready to splice after other members"""
+    return json.dumps(obj)[1:]
+
+
+class FallbackTemplate:
+    """A fallback payload serialized once, with slots for the location and error message"""
+
+    def __init__(self, destination_info, sections):
+        self.destination_info = dict(destination_info)
+        self.sections = dict(sections)
+        # Everything after the location slot, serialized once
+        self._tail = ", " + _tail(self.destination_info) + ", " + _tail(self.sections)
+
+    def to_json(self, location, error):
+        """The gpt_recommendations fallback object as a JSON string"""
+        return '{"error": ' + json.dumps(error) + ', "destination_info": {"name": ' + json.dumps(location) + self._tail
+
+    def to_dict(self, location, error):
+        """The same fallback object as a dict; the shared section data must not be mutated"""
+        payload = {"error": error, "destination_info": dict(self.destination_info, name=location)}
+        payload.update(self.sections)
+        return payload
+
+
+def load_curated_fallbacks(path):
+    """Load per-city fallbacks: {"Tokyo": {"destination_info": {...}, "food_recommendations": [...]}, ...}"""
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        curated = json.load(f)
+
+    templates = {}
+    for city, payload in curated.items():
+        # Curated sections override the generic ones; anything missing stays generic
+        destination_info = dict(GENERIC_DESTINATION_INFO, **payload.get("destination_info", {}))
+        destination_info.pop("name", None)
+        sections = dict(GENERIC_SECTIONS, **{k: v for k, v in payload.items() if k in GENERIC_SECTIONS})
+        templates[normalize_location(city)] = FallbackTemplate(destination_info, sections)
+    return templates
+
+
+FALLBACK_PATH = os.getenv('FALLBACK_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fallbacks.json'))
+
+GENERIC_FALLBACK = FallbackTemplate(GENERIC_DESTINATION_INFO, GENERIC_SECTIONS)
+CURATED_FALLBACKS = load_curated_fallbacks(FALLBACK_PATH)
+
+def template_for(location):
+    """The curated fallback for a city if we have one ('Tokyo, Japan' matches 'Tokyo'), else the generic one"""
+    normalized = normalize_location(location)
+    return (CURATED_FALLBACKS.get(normalized)
+            or CURATED_FALLBACKS.get(normalized.split(",")[0].strip())
+            or GENERIC_FALLBACK)
+
+def fallback_recommendations(location, error):
+    """gpt_recommendations fallback object for a location"""
+    return template_for(location).to_dict(location, error)
+
+def fallback_json(location, error):
+    """gpt_recommendations fallback object for a location, already serialized"""
+    return template_for(location).to_json(location, error)
+
+def fallback_response_body(location, error, generated_at):
+    """A complete degraded /api/recommendations response body as bytes, without touching a dict"""
+    return (
+        '{"gpt_recommendations": ' + fallback_json(location, error)
+        + ', "qloo_recommendations": ' + QLOO_UNAVAILABLE_JSON
+        + ', "generated_at": ' + json.dumps(generated_at) + '}'
+    ).encode()
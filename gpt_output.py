@@ -0,0 +1,227 @@
+"""
+Prompt, response format and validation for GPT's recommendation JSON
+
+The recommendation schema is defined once here. The system prompt and the OpenAI
+response_format are both built from it at import, so every request sends the same
+compact prefix and only a one-line user message changes. Replies are validated
+against the same schema: slightly malformed output (markdown fences, trailing
+commas, a reply cut off by max_tokens) is repaired rather than paid for again.
+"""
+
+import json
+
+# Top-level sections in the order GPT should write them (the stream shows them in this order)
+DESTINATION_FIELDS = ("name", "best_time_to_visit", "weather_info", "cultural_highlights")
+LIST_SECTIONS = {
+    "food_recommendations": ("name", "cuisine", "description", "price_range", "must_try_dishes", "location"),
+    "experience_recommendations": ("name", "category", "description", "duration", "best_time", "tips"),
+    "hidden_gems": ("name", "type", "description", "location"),
+}
+LIST_FIELDS = {"must_try_dishes"}  # item fields holding a list of strings
+SECTIONS = ("destination_info",) + tuple(LIST_SECTIONS) + ("travel_tips",)
+
+MAX_ITEMS = 5  # per list section; the prompt asks for 2-3
+MAX_TEXT = 600  # characters kept per text field
+
+
+def _outline():
+    """The schema as compact JSON-ish text: {"destination_info":{"name":str,...},...}"""
+    def fields(names):
+        return ",".join(f'"{name}":{"[str]" if name in LIST_FIELDS else "str"}' for name in names)
+    parts = [f'"destination_info":{{{fields(DESTINATION_FIELDS)}}}']
+    parts += [f'"{section}":[{{{fields(names)}}}]' for section, names in LIST_SECTIONS.items()]
+    parts.append('"travel_tips":[str]')
+    return "{" + ",".join(parts) + "}"
+
+def _json_schema():
+    """JSON Schema for one recommendation object, in the strict subset OpenAI structured outputs accept"""
+    def obj(names):
+        return {
+            "type": "object",
+            "properties": {
+                name: {"type": "array", "items": {"type": "string"}} if name in LIST_FIELDS else {"type": "string"}
+                for name in names
+            },
+            "required": list(names),
+            "additionalProperties": False,
+        }
+    properties = {"destination_info": obj(DESTINATION_FIELDS)}
+    for section, names in LIST_SECTIONS.items():
+        properties[section] = {"type": "array", "items": obj(names)}
+    properties["travel_tips"] = {"type": "array", "items": {"type": "string"}}
+    return {"type": "object", "properties": properties, "required": list(SECTIONS), "additionalProperties": False}
+
+OUTLINE = _outline()
+RECOMMENDATION_SCHEMA = _json_schema()
+TRIPS_SCHEMA = {
+    "type": "object",
+    "properties": {"trips": {"type": "array", "items": RECOMMENDATION_SCHEMA}},
+    "required": ["trips"],
+    "additionalProperties": False,
+}
+
+SYSTEM_PROMPT = (
+    "You are a travel expert. Reply with one JSON object and nothing else, shaped as "
+    f"{OUTLINE}. Give 2-3 items per list and 3 travel tips, each brief and specific to the destination."
+)
+MULTI_TRIP_SYSTEM_PROMPT = (
+    "You are a travel expert. Reply with one JSON object and nothing else, shaped as "
+    '{"trips":[...]} with one object per trip, in the order given, each shaped as '
+    f"{OUTLINE}. Give 2-3 items per list and 3 travel tips, each brief and specific to that trip's city."
+)
+
+def response_format(mode, multi_trip=False):
+    """The response_format argument for a GPT_RESPONSE_FORMAT mode (json_schema, json_object or text)"""
+    if mode == "json_schema":
+        return {"type": "json_schema", "json_schema": {
+            "name": "trips" if multi_trip else "recommendations",
+            "schema": TRIPS_SCHEMA if multi_trip else RECOMMENDATION_SCHEMA,
+            "strict": True,
+        }}
+    if mode == "json_object":
+        return {"type": "json_object"}
+    return None
+
+
+def repair_json(text):
+    """Best-effort fix of slightly malformed JSON, returning text json.loads accepts (or raising ValueError)
+
+    Drops anything around the outermost object (prose, ```json fences), removes trailing
+    commas, and closes a reply that was cut off - keeping every member that completed.
+    """
+    start = text.find("{")
+    if start < 0:
+        raise ValueError("GPT response contains no JSON object")
+
+    out, closers = [], []
+    in_string = escape = False
+    last_comma = None  # index in out of a comma with nothing significant after it yet
+    cut = None  # (length of out, closers) at the last point everything before it was complete
+    for ch in text[start:]:
+        if in_string:
+            out.append(ch)
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch.isspace():
+            out.append(ch)
+            continue
+        if ch in "}]":
+            if last_comma is not None:
+                del out[last_comma]
+            out.append(closers.pop())  # trust the opener over a mismatched closer
+            last_comma = None
+            if not closers:
+                return "".join(out)
+            cut = (len(out), list(closers))
+            continue
+        if ch == ",":
+            cut = (len(out), list(closers))
+            last_comma = len(out)
+        else:
+            last_comma = None
+            if ch in "{[":
+                closers.append("}" if ch == "{" else "]")
+            elif ch == '"':
+                in_string = True
+        out.append(ch)
+
+    # Cut off part-way: keep what completed and close the open containers
+    if cut is None:
+        raise ValueError("GPT response ended before any JSON member was complete")
+    length, open_closers = cut
+    return "".join(out[:length]) + "".join(reversed(open_closers))
+
+def parse_json_object(content):
+    """Decode GPT's reply as a JSON object, repairing it if needed: (object, repaired)"""
+    try:
+        obj, repaired = json.loads(content), False
+    except ValueError:
+        obj, repaired = json.loads(repair_json(content)), True
+    if not isinstance(obj, dict):
+        raise ValueError("GPT response is not a JSON object")
+    return obj, repaired
+
+
+def _text(value):
+    if isinstance(value, str):
+        return value.strip()[:MAX_TEXT]
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    return None
+
+def _texts(value):
+    if isinstance(value, str):
+        value = [value]
+    if not isinstance(value, list):
+        return []
+    return [text for text in (_text(v) for v in value) if text][:MAX_ITEMS]
+
+def clean_section(name, value):
+    """Validate one top-level section, returning (cleaned value or None, problems)
+
+    Items without a name and fields of the wrong type are dropped and reported as
+    problems; unknown fields are dropped silently.
+    """
+    if name == "destination_info":
+        if not isinstance(value, dict):
+            return None, [f"{name} is not an object"]
+        cleaned = {field: _text(value.get(field)) for field in DESTINATION_FIELDS}
+        problems = [f"{name}.{field} missing" for field, text in cleaned.items() if text is None]
+        return {field: text for field, text in cleaned.items() if text is not None}, problems
+
+    if name == "travel_tips":
+        if not isinstance(value, list):
+            return None, [f"{name} is not a list"]
+        return _texts(value), []
+
+    fields = LIST_SECTIONS.get(name)
+    if fields is None:
+        return None, []
+    if not isinstance(value, list):
+        return None, [f"{name} is not a list"]
+    items, problems = [], []
+    for item in value[:MAX_ITEMS]:
+        if not isinstance(item, dict) or not _text(item.get("name")):
+            problems.append(f"{name} item without a name")
+            continue
+        cleaned = {}
+        for field in fields:
+            if field in LIST_FIELDS:
+                cleaned[field] = _texts(item.get(field))
+            else:
+                text = _text(item.get(field))
+                if text is not None:
+                    cleaned[field] = text
+        items.append(cleaned)
+    return items, problems
+
+def validate_recommendations(obj, location=None):
+    """Check a recommendation object against the schema: (cleaned object, problems)
+
+    Missing or invalid sections become empty so the frontend can always render the
+    result; only an object with nothing usable in it raises ValueError.
+    """
+    if not isinstance(obj, dict):
+        raise ValueError("GPT recommendations are not a JSON object")
+    result, problems = {}, []
+    for name in SECTIONS:
+        if name not in obj:
+            problems.append(f"{name} missing")
+            value = None
+        else:
+            value, section_problems = clean_section(name, obj[name])
+            problems.extend(section_problems)
+        if value is None:
+            value = {} if name == "destination_info" else []
+        result[name] = value
+
+    if not any(result[name] for name in SECTIONS[1:]):
+        raise ValueError("GPT response has no usable recommendations")
+    if location and not result["destination_info"].get("name"):
+        result["destination_info"]["name"] = location
+    return result, problems
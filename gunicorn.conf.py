@@ -0,0 +1,27 @@
+"""
+Gunicorn settings, picked up automatically from the working directory
+
+The master imports the app once (GUNICORN_PRELOAD, on by default), and the workers are
+forked from it already imported, so a new worker takes traffic in milliseconds instead
+of repeating a 0.5s+ import. Clients, connection pools and thread pools are built per
+worker after the fork (startup.py). warm_up() builds them in the background as soon as
+the worker starts, so the first request doesn't wait for them either.
+"""
+
+import os
+
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() == "true"
+
+
+def when_ready(server):
+    if not server.cfg.preload_app:
+        return
+    import app  # already imported by the preload
+    app.preload_modules()
+    seconds = app.timings.phases()
+    server.log.info("App preloaded: " + ", ".join(f"{phase} {value:.3f}s" for phase, value in seconds.items()))
+
+
+def post_worker_init(worker):
+    import app
+    app.start_warm_up()
@@ -0,0 +1,174 @@
+"""
+Hedged upstream calls: race a second identical request against a slow first one
+
+Most GPT completions finish well inside their timeout, but a few run several times
+longer than usual and set the tail latency. A Hedger learns the recent latency
+distribution and sends a second identical call once the first has been running longer
+than a high percentile of it (p95 by default). Whichever call answers first wins, and
+the other one is cancelled. Hedges draw on a budget that grows by max_rate per call, so
+at most that fraction of calls is ever sent twice, however slow the upstream gets.
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+
+
+class HedgeCancelled(Exception):
+    """Raised inside a call that lost the race, once it notices it has been stopped"""
+
+
+class Hedger:
+    """Hedging delay learned from recent latencies, and the budget that caps how often it hedges"""
+
+    def __init__(self, percentile=95, max_rate=0.05, min_delay=1.0, initial_delay=5.0, window=200, min_samples=20,
+                 max_credit=5.0, min_hedge_time=1.0, on_result=None):
+        self.percentile = percentile
+        self.max_rate = max_rate
+        self.min_delay = min_delay
+        # Used until min_samples latencies have been seen
+        self.initial_delay = initial_delay
+        self.min_samples = min_samples
+        # Unused hedges saved up for a burst of slow calls
+        self.max_credit = max_credit
+        # Don't hedge with less than this left of the call's timeout
+        self.min_hedge_time = min_hedge_time
+        # on_result(seconds, outcome) for each answered call: "single", "primary" or "hedge" (which won)
+        self.on_result = on_result or (lambda seconds, outcome: None)
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._credit = 1.0
+        self._calls = 0
+        self._hedged = 0
+        self._hedge_wins = 0
+        self._skipped = 0
+
+    def record(self, seconds):
+        """Record how long a call took to answer, from when its first request went out"""
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def delay(self):
+        """Seconds to wait for the first request before hedging"""
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if len(latencies) < self.min_samples:
+            return self.initial_delay
+        index = min(len(latencies) - 1, int(len(latencies) * self.percentile / 100))
+        return max(self.min_delay, latencies[index])
+
+    def _start_call(self):
+        with self._lock:
+            self._calls += 1
+            self._credit = min(self.max_credit, self._credit + self.max_rate)
+
+    def _take_hedge(self):
+        """Spend one hedge from the budget, or False if it's used up"""
+        with self._lock:
+            if self._credit < 1.0 - 1e-9:  # ten credits of 0.1 add up to 0.999...
+                self._skipped += 1
+                return False
+            self._credit -= 1.0
+            self._hedged += 1
+            return True
+
+    def _finish(self, started, hedged, hedge_won):
+        seconds = time.monotonic() - started
+        self.record(seconds)
+        if hedge_won:
+            with self._lock:
+                self._hedge_wins += 1
+        self.on_result(seconds, "hedge" if hedge_won else "primary" if hedged else "single")
+
+    def call(self, fn, timeout, executor, can_hedge=None):
+        """fn(timeout, stop) on the executor, hedged with a second call if the first is slow
+
+        fn should give up with HedgeCancelled once stop is set. Returns the first result;
+        if every call raised, re-raises the first call's error. can_hedge() may veto a
+        hedge the budget would allow (e.g. while the upstream's rate limit is spent).
+        """
+        self._start_call()
+        started = time.monotonic()
+        stops = {}  # future -> the event that stops it
+        stop = threading.Event()
+        primary = executor.submit(fn, timeout, stop)
+        stops[primary] = stop
+        done, _ = wait([primary], timeout=min(self.delay(), timeout))
+        remaining = timeout - (time.monotonic() - started)
+        if not done and self._should_hedge(remaining, can_hedge):
+            stop = threading.Event()
+            stops[executor.submit(fn, remaining, stop)] = stop
+        error = None
+        pending = set(stops)
+        try:
+            # Each call is bounded by its own timeout; the extra second covers its cleanup
+            while pending:
+                done, pending = wait(pending, timeout=max(0.0, started + timeout + 1.0 - time.monotonic()),
+                                     return_when=FIRST_COMPLETED)
+                if not done:
+                    raise TimeoutError("Hedged call outlived its timeout")
+                for future in done:
+                    if future.exception() is None:
+                        self._finish(started, len(stops) > 1, future is not primary)
+                        return future.result()
+                    if future is primary or error is None:
+                        error = future.exception()
+            raise error
+        finally:
+            for stop in stops.values():
+                stop.set()
+
+    async def call_async(self, fn, timeout, can_hedge=None):
+        """Async counterpart of call: fn(timeout) is awaited, and the losing task is cancelled"""
+        self._start_call()
+        started = time.monotonic()
+        primary = asyncio.ensure_future(fn(timeout))
+        tasks = {primary}
+        done, _ = await asyncio.wait(tasks, timeout=min(self.delay(), timeout))
+        remaining = timeout - (time.monotonic() - started)
+        hedged = not done and self._should_hedge(remaining, can_hedge)
+        if hedged:
+            tasks.add(asyncio.ensure_future(fn(remaining)))
+        error = None
+        try:
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if not task.cancelled() and task.exception() is None:
+                        self._finish(started, hedged, task is not primary)
+                        return task.result()
+                    if task is primary or error is None:
+                        error = asyncio.CancelledError() if task.cancelled() else task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def _should_hedge(self, remaining, can_hedge):
+        if remaining < self.min_hedge_time:
+            return False
+        if can_hedge is not None and not can_hedge():
+            with self._lock:
+                self._skipped += 1
+            return False
+        return self._take_hedge()
+
+    def stats(self):
+        delay = self.delay()
+        with self._lock:
+            latencies = sorted(self._latencies)
+            calls, hedged = self._calls, self._hedged
+            stats = {
+                "calls": calls,
+                "hedged": hedged,
+                "hedge_wins": self._hedge_wins,
+                "skipped": self._skipped,
+                "hedge_rate": round(hedged / calls, 3) if calls else 0.0,
+            }
+        stats["delay"] = round(delay, 3)
+        if latencies:
+            stats["p50"] = round(latencies[len(latencies) // 2], 3)
+            stats["p99"] = round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))], 3)
+        return stats
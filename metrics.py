@@ -0,0 +1,310 @@
+"""
+In-process metrics for WanderWise, exposed in the Prometheus text format at /metrics
+
+Each gunicorn worker keeps its own counters; Prometheus sums them across scrapes of
+every worker (or scrape through a single-worker sidecar). Stage timings answer where a
+slow /api/recommendations spent its time; upstream status feeds the richer /health.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+# Upstream calls range from a few milliseconds (cache, city index) to the 25s request deadline
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 15.0, 20.0, 30.0)
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key, value):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    """A monotonically increasing count"""
+
+    type_name = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    """A value that goes up and down"""
+
+    type_name = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track(self, **labels):
+        """Count the with-block as in progress while it runs, even if it raises or is cancelled"""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    """Observations counted into cumulative buckets, with their sum and count"""
+
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][i] += 1
+                    break
+            state["sum"] += value
+            state["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall-clock duration of the with-block, even if it raises"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def snapshot(self, **labels):
+        """{"count", "sum", "buckets": {upper bound: cumulative count}} for one label set"""
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            if state is None:
+                return {"count": 0, "sum": 0.0, "buckets": {bound: 0 for bound in self.buckets}}
+            counts, total, count = list(state["counts"]), state["sum"], state["count"]
+        cumulative, running = {}, 0
+        for bound, n in zip(self.buckets, counts):
+            running += n
+            cumulative[bound] = running
+        return {"count": count, "sum": total, "buckets": cumulative}
+
+    def _render_sample(self, key, state):
+        lines, running = [], 0
+        for bound, n in zip(self.buckets, state["counts"]):
+            running += n
+            labels = _format_labels(self.labelnames, key, [("le", _format_value(bound))])
+            lines.append(f"{self.name}_bucket{labels} {running}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(state['sum'])}")
+        lines.append(f"{self.name}_count{labels} {state['count']}")
+        return lines
+
+
+class Registry:
+    """The set of metrics rendered at /metrics, plus collectors sampled at scrape time"""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collect):
+        """collect() returns Gauges filled in from live state (cache, pools) at scrape time"""
+        self._collectors.append(collect)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collect in self._collectors:
+            for metric in collect():
+                lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class UpstreamHealth:
+    """Last success/failure per upstream, reported by /health"""
+
+    # This many failures in a row and the upstream is reported as down rather than degraded
+    DOWN_AFTER = 3
+
+    def __init__(self, upstreams):
+        self._lock = threading.Lock()
+        self._state = {name: self._new_state() for name in upstreams}
+
+    @staticmethod
+    def _new_state():
+        return {"last_success": None, "last_failure": None, "last_error": None, "consecutive_failures": 0}
+
+    def success(self, upstream):
+        with self._lock:
+            state = self._state.setdefault(upstream, self._new_state())
+            state.update(last_success=time.time(), consecutive_failures=0)
+
+    def failure(self, upstream, error):
+        with self._lock:
+            state = self._state.setdefault(upstream, self._new_state())
+            state.update(last_failure=time.time(), last_error=str(error)[:200],
+                         consecutive_failures=state["consecutive_failures"] + 1)
+
+    def status(self):
+        """Per-upstream status: unknown (no calls yet), ok, degraded or down"""
+        with self._lock:
+            report = {name: dict(state) for name, state in self._state.items()}
+        for state in report.values():
+            if state["last_success"] is None and state["last_failure"] is None:
+                state["status"] = "unknown"
+            elif state["consecutive_failures"] >= self.DOWN_AFTER:
+                state["status"] = "down"
+            elif state["consecutive_failures"]:
+                state["status"] = "degraded"
+            else:
+                state["status"] = "ok"
+        return report
+
+
+registry = Registry()
+
+STAGE_SECONDS = registry.histogram(
+    "wanderwise_stage_seconds",
+    "Time spent in each stage of a recommendations request",
+    ["stage"],
+)
+REQUEST_SECONDS = registry.histogram(
+    "wanderwise_request_seconds",
+    "End-to-end request latency by endpoint",
+    ["endpoint", "status"],
+)
+UPSTREAM_RETRIES = registry.counter(
+    "wanderwise_upstream_retries_total",
+    "Upstream calls retried after a failed attempt",
+    ["upstream"],
+)
+UPSTREAM_ERRORS = registry.counter(
+    "wanderwise_upstream_errors_total",
+    "Upstream calls that failed after all retries",
+    ["upstream"],
+)
+UPSTREAM_TIMEOUTS = registry.counter(
+    "wanderwise_upstream_timeouts_total",
+    "Upstream calls abandoned at the request deadline",
+    ["upstream"],
+)
+UPSTREAM_IN_FLIGHT = registry.gauge(
+    "wanderwise_upstream_in_flight",
+    "Upstream attempts currently holding a connection or stream open",
+    ["upstream"],
+)
+UPSTREAM_OVERRUN_SECONDS = registry.histogram(
+    "wanderwise_upstream_overrun_seconds",
+    "How long upstream calls abandoned at the request deadline kept running past it",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+RESPONSE_BYTES = registry.histogram(
+    "wanderwise_response_bytes",
+    "Bytes on the wire per JSON response body, by content-coding",
+    ["endpoint", "encoding"],
+    buckets=(512, 1024, 2048, 4096, 8192, 16384, 32768, 65536, 131072),
+)
+FALLBACKS = registry.counter(
+    "wanderwise_fallbacks_total",
+    "Responses that served fallback content instead of upstream data",
+    ["upstream", "reason"],
+)
+GPT_TOKENS = registry.counter(
+    "wanderwise_gpt_tokens_total",
+    "OpenAI token usage reported by completed GPT calls",
+    ["kind"],
+)
+GPT_CALL_SECONDS = registry.histogram(
+    "wanderwise_gpt_call_seconds",
+    "Hedged-mode GPT calls from the first request to the answer, by outcome (single, primary or hedge won)",
+    ["outcome"],
+)
+GPT_OUTPUT_REPAIRS = registry.counter(
+    "wanderwise_gpt_output_repairs_total",
+    "GPT replies accepted after repairing malformed JSON or dropping fields that failed the schema",
+    ["kind"],
+)
+WARM_REFRESHES = registry.counter(
+    "wanderwise_cache_warm_refreshes_total",
+    "Cache entries the background warmer refreshed (ok), failed to refresh, or held off on (busy, skipped)",
+    ["source", "result"],
+)
+
+upstream_health = UpstreamHealth(["gpt", "qloo"])
+
+def record_token_usage(usage):
+    """Count prompt/completion tokens from an OpenAI usage object (absent on some responses)"""
+    if usage is None:
+        return
+    GPT_TOKENS.inc(getattr(usage, "prompt_tokens", 0) or 0, kind="prompt")
+    GPT_TOKENS.inc(getattr(usage, "completion_tokens", 0) or 0, kind="completion")
@@ -0,0 +1,146 @@
+"""
+Shared HTTP client for the Qloo Taste AI API
+"""
+
+import threading
+from contextlib import contextmanager
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class PoolTracker:
+    """Counts requests in flight through a client, against the size of its connection pool
+
+    This is request concurrency, not a reading of the pool itself: a request in flight may
+    still be connecting or (with pool_block) waiting for a connection. QlooClient adds
+    what its urllib3 pool actually holds (connection_stats).
+    """
+
+    def __init__(self, pool_size):
+        self.pool_size = pool_size
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._peak_in_flight = 0
+        self._requests = 0
+
+    @contextmanager
+    def track(self):
+        with self._lock:
+            self._in_flight += 1
+            self._requests += 1
+            self._peak_in_flight = max(self._peak_in_flight, self._in_flight)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def stats(self):
+        """Requests in flight now and at peak, and in flight as a fraction of the pool size"""
+        with self._lock:
+            return {
+                "pool_size": self.pool_size,
+                "in_flight": self._in_flight,
+                "peak_in_flight": self._peak_in_flight,
+                "in_flight_ratio": round(self._in_flight / self.pool_size, 3) if self.pool_size else 0.0,
+                "requests": self._requests,
+            }
+
+
+class QlooClient:
+    """Qloo API client owning one keep-alive connection pool shared by every request thread"""
+
+    def __init__(self, api_key, base_url, pool_size=16, pool_block=False, connect_timeout=3.05):
+        self.base_url = base_url.rstrip("/")
+        self.pool = PoolTracker(pool_size)
+        self.connect_timeout = connect_timeout
+
+        # Built once - every call reuses the same auth headers and warm connections
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json",
+            "Connection": "keep-alive",
+        })
+        # pool_maxsize caps the connections kept open to each host; with pool_block
+        # set, callers wait for a free connection instead of opening extra ones
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, pool_block=pool_block, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def get(self, path, params=None, timeout=20):
+        """GET a Qloo endpoint and return the decoded JSON body, raising on HTTP errors
+        
+        timeout bounds the connect and every socket read, so a call given the time left
+        before a deadline gives up at the socket instead of outliving the request.
+        """
+        with self.pool.track():
+            response = self.session.get(f"{self.base_url}{path}", params=params,
+                                        timeout=(min(self.connect_timeout, timeout), timeout))
+            response.raise_for_status()
+            return response.json()
+
+    def search(self, query, category="cities", timeout=20):
+        """Search Qloo entities, e.g. to turn user text into a city entity id"""
+        return self.get("/search", {"query": query, "category": category}, timeout=timeout)
+
+    def recommendations(self, entity_id, category, limit=10, timeout=20):
+        """Get Qloo recommendations in a category for an entity"""
+        return self.get("/recommendations", {"entity_id": entity_id, "category": category, "limit": limit}, timeout=timeout)
+
+    def connection_stats(self):
+        """Connections urllib3 has opened to Qloo, and how many sit idle in the pool right now"""
+        opened = idle = 0
+        pools = self.session.get_adapter(self.base_url).poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            opened += pool.num_connections
+            if pool.pool is not None:
+                # Free slots hold None; a connection returned to the pool waits here, idle
+                idle += sum(1 for conn in list(pool.pool.queue) if conn is not None)
+        return {"connections_opened": opened, "connections_idle": idle}
+
+    def pool_stats(self):
+        """Requests in flight against the pool size, and the connections the pool holds"""
+        return dict(self.pool.stats(), **self.connection_stats())
+
+
+class AsyncQlooClient:
+    """Async Qloo API client for the ASGI serving mode, pooling keep-alive connections on one event loop"""
+
+    def __init__(self, api_key, base_url, pool_size=100, connect_timeout=3.05):
+        self.pool = PoolTracker(pool_size)
+        self.connect_timeout = connect_timeout
+        self.client = httpx.AsyncClient(
+            base_url=base_url.rstrip("/"),
+            headers={
+                "Authorization": f"Bearer {api_key}",
+                "Content-Type": "application/json",
+            },
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            timeout=20,
+        )
+
+    async def get(self, path, params=None, timeout=20):
+        """GET a Qloo endpoint and return the decoded JSON body, raising on HTTP errors"""
+        with self.pool.track():
+            response = await self.client.get(path, params=params,
+                                             timeout=httpx.Timeout(timeout, connect=min(self.connect_timeout, timeout)))
+            response.raise_for_status()
+            return response.json()
+
+    async def search(self, query, category="cities", timeout=20):
+        return await self.get("/search", {"query": query, "category": category}, timeout=timeout)
+
+    async def recommendations(self, entity_id, category, limit=10, timeout=20):
+        return await self.get("/recommendations", {"entity_id": entity_id, "category": category, "limit": limit}, timeout=timeout)
+
+    def pool_stats(self):
+        return self.pool.stats()
+
+    async def aclose(self):
+        await self.client.aclose()
@@ -0,0 +1,274 @@
+"""
+Upstream rate limiting and request admission control
+
+Each upstream (Qloo, OpenAI) gets a token bucket refilled at `rate` calls per second
+and holding at most `burst`. With a shared store the bucket is a row in a small SQLite
+file that every gunicorn worker on the host updates in one transaction, so the quota
+is shared instead of multiplied by the worker count. A call that finds the bucket empty
+reserves the next free token and waits for it, which queues callers in order across
+processes; when the wait would be longer than max_wait, or too many calls in this
+worker are already waiting, it fails fast with RateLimitExceeded and is answered with
+a fallback, like an open circuit.
+
+AdmissionController bounds how many requests a worker lets fetch from upstreams at
+once: a few more wait briefly for a slot, and the rest are turned away to the fallback.
+"""
+
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+
+from resilience import RateLimitExceeded
+
+
+def _reserve(tokens, rate, max_wait):
+    """(tokens left, seconds to wait) after reserving one token, or (tokens, None) if the wait exceeds max_wait"""
+    wait = max(0.0, (1.0 - tokens) / rate)
+    if wait > max_wait:
+        return tokens, None
+    return tokens - 1.0, wait
+
+
+def _refill(tokens, updated_at, rate, burst, now):
+    return min(float(burst), tokens + max(0.0, now - updated_at) * rate)
+
+
+class MemoryBucketStore:
+    """Token buckets in this process only (each worker gets the full rate)"""
+
+    blocking = False  # take() only holds a lock for a moment
+
+    def __init__(self):
+        self._buckets = {}  # name -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    def take(self, name, rate, burst, max_wait):
+        """Reserve one token: seconds until it is ours, or None if that is longer than max_wait"""
+        now = time.time()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(name, (burst, now))
+            tokens, wait = _reserve(_refill(tokens, updated_at, rate, burst, now), rate, max_wait)
+            self._buckets[name] = (tokens, now)
+        return wait
+
+    def tokens(self, name, rate, burst):
+        """Tokens available now (negative while calls are queued for them)"""
+        now = time.time()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(name, (burst, now))
+        return _refill(tokens, updated_at, rate, burst, now)
+
+
+class SQLiteBucketStore:
+    """Token buckets in a SQLite file shared by every worker on the same host"""
+
+    blocking = True  # take() may wait up to the busy timeout for another worker's write lock
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+
+    def _connect(self):
+        # sqlite3 connections can't be shared between threads, so keep one per thread. Nor
+        # between processes: a worker forked from a preloaded master opens its own.
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def take(self, name, rate, burst, max_wait):
+        conn = self._connect()
+        # IMMEDIATE takes the write lock up front, so two workers can't both spend the last token
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            row = conn.execute("SELECT tokens, updated_at FROM buckets WHERE name = ?", (name,)).fetchone()
+            tokens = float(burst) if row is None else _refill(row[0], row[1], rate, burst, now)
+            tokens, wait = _reserve(tokens, rate, max_wait)
+            conn.execute("INSERT OR REPLACE INTO buckets (name, tokens, updated_at) VALUES (?, ?, ?)", (name, tokens, now))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+    def tokens(self, name, rate, burst):
+        row = self._connect().execute("SELECT tokens, updated_at FROM buckets WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return float(burst)
+        return _refill(row[0], row[1], rate, burst, time.time())
+
+
+class RateLimiter:
+    """Token bucket for one upstream; a rate of 0 (or less) disables it"""
+
+    def __init__(self, name, rate, burst, store=None, max_wait=2.0, max_queue=32):
+        self.name = name
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.store = store if store is not None else MemoryBucketStore()
+        self.max_wait = max_wait
+        # Calls in this worker that may wait for a token at once; more fail fast
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._delayed = 0
+        self._rejected = 0
+
+    @property
+    def enabled(self):
+        return self.rate > 0
+
+    def _reserve(self, max_wait):
+        """Seconds to wait for a reserved token; raises RateLimitExceeded when it can't be had in time"""
+        max_wait = self.max_wait if max_wait is None else min(self.max_wait, max_wait)
+        with self._lock:
+            full = self._queued >= self.max_queue
+        try:
+            wait = None if full else self.store.take(self.name, self.rate, self.burst, max(0.0, max_wait))
+        except sqlite3.Error:
+            # A broken shared store must not take the upstream down with it
+            wait = 0.0
+        with self._lock:
+            if wait is None:
+                self._rejected += 1
+            elif wait > 0:
+                self._delayed += 1
+                self._queued += 1
+        if wait is None:
+            raise RateLimitExceeded(self.name, 1.0 / self.rate)
+        return wait
+
+    def _done_waiting(self):
+        with self._lock:
+            self._queued -= 1
+
+    def acquire(self, max_wait=None):
+        """Take a token, sleeping up to max_wait (capped to the limiter's own) for one; returns seconds waited"""
+        if not self.enabled:
+            return 0.0
+        wait = self._reserve(max_wait)
+        if wait > 0:
+            try:
+                time.sleep(wait)
+            finally:
+                self._done_waiting()
+        return wait
+
+    async def acquire_async(self, max_wait=None):
+        """Async counterpart of acquire: waits without blocking the event loop"""
+        if not self.enabled:
+            return 0.0
+        if self.store.blocking:
+            # The shared store's write lock can be held by another worker: wait for it off the loop
+            wait = await asyncio.to_thread(self._reserve, max_wait)
+        else:
+            wait = self._reserve(max_wait)
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                self._done_waiting()
+        return wait
+
+    def available(self):
+        """Tokens in the bucket now (negative while calls are queued for them)"""
+        if not self.enabled:
+            return float(self.burst)
+        try:
+            return self.store.tokens(self.name, self.rate, self.burst)
+        except sqlite3.Error:
+            return float(self.burst)
+
+    def stats(self):
+        with self._lock:
+            stats = {"queued": self._queued, "delayed_calls": self._delayed, "rejected_calls": self._rejected}
+        return dict(stats, rate=self.rate, burst=self.burst, tokens=round(self.available(), 2))
+
+
+class AdmissionController:
+    """At most max_active requests fetching from upstreams at once; up to max_queue more wait queue_timeout for a slot"""
+
+    # How often a waiting coroutine checks for a free slot
+    POLL_INTERVAL = 0.02
+
+    def __init__(self, max_active=32, max_queue=64, queue_timeout=1.0):
+        self.max_active = max_active
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._cond = threading.Condition()
+        self._active = 0
+        self._queued = 0
+        self._admitted = 0
+        self._rejected = 0
+
+    def _enter(self):
+        """Take a slot if one is free (call with the condition held)"""
+        if self._active < self.max_active:
+            self._active += 1
+            self._admitted += 1
+            return True
+        return False
+
+    def acquire(self):
+        """Wait up to queue_timeout for a slot: True if admitted, False if turned away"""
+        with self._cond:
+            if self._enter():
+                return True
+            if self._queued >= self.max_queue:
+                self._rejected += 1
+                return False
+            self._queued += 1
+            try:
+                admitted = self._cond.wait_for(lambda: self._active < self.max_active, self.queue_timeout) and self._enter()
+            finally:
+                self._queued -= 1
+            if not admitted:
+                self._rejected += 1
+            return admitted
+
+    async def acquire_async(self):
+        """Async counterpart of acquire"""
+        with self._cond:
+            if self._enter():
+                return True
+            if self._queued >= self.max_queue:
+                self._rejected += 1
+                return False
+            self._queued += 1
+        give_up = time.monotonic() + self.queue_timeout
+        try:
+            while time.monotonic() < give_up:
+                await asyncio.sleep(self.POLL_INTERVAL)
+                with self._cond:
+                    if self._enter():
+                        return True
+            with self._cond:
+                self._rejected += 1
+            return False
+        finally:
+            with self._cond:
+                self._queued -= 1
+
+    def release(self):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "active": self._active,
+                "queued": self._queued,
+                "admitted": self._admitted,
+                "rejected": self._rejected,
+                "max_active": self.max_active,
+            }
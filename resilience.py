@@ -0,0 +1,254 @@
+"""
+Retry and circuit-breaker policy shared by every upstream call (Qloo and OpenAI)
+
+Retries back off exponentially with full jitter, only for errors worth retrying
+(timeouts, connection failures, 408/425/429/5xx), and never start an attempt the
+request deadline can't accommodate. A per-upstream circuit breaker fails calls
+immediately while an upstream keeps failing, so an outage costs a fallback rather
+than a worker tied up on doomed calls. A call turned away by the upstream's rate
+limiter (ratelimit.py) never reached it, so it counts neither way.
+"""
+
+import asyncio
+import random
+import sys
+import threading
+import time
+
+import httpx
+import requests
+
+RETRYABLE_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+# Statuses that mean the upstream is unusable for everyone, not just this request
+UNAVAILABLE_STATUSES = RETRYABLE_STATUSES | {401, 403}
+
+TRANSIENT_ERRORS = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    httpx.TransportError,
+    ConnectionError,
+    TimeoutError,
+)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit breaker is open"""
+
+    def __init__(self, name, retry_in):
+        super().__init__(f"{name} is unavailable (circuit open, retrying in {retry_in:.0f}s)")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class RateLimitExceeded(CircuitOpenError):
+    """Raised instead of calling an upstream whose rate limit is used up; callers treat it like an open circuit"""
+
+    def __init__(self, name, retry_in):
+        Exception.__init__(self, f"{name} is busy (rate limit reached, a call frees up in {retry_in:.1f}s)")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised instead of starting an attempt the request deadline leaves no time for"""
+
+
+def error_status(error):
+    """HTTP status carried by a requests, httpx or OpenAI error, if any"""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+def retry_after(error):
+    """Seconds the upstream asked us to wait (Retry-After header), if it said"""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+def is_transient(error):
+    if isinstance(error, TRANSIENT_ERRORS):
+        return True
+    # openai is imported on first use (startup.py); until then none of its errors can exist
+    openai = sys.modules.get("openai")
+    return openai is not None and isinstance(error, openai.APIConnectionError)  # includes APITimeoutError
+
+def is_retryable(error):
+    status = error_status(error)
+    if status is not None:
+        return status in RETRYABLE_STATUSES
+    return is_transient(error)
+
+def is_upstream_failure(error):
+    """Does this error say the upstream is down (rather than that this one request was bad)?"""
+    if isinstance(error, (DeadlineExceeded, RateLimitExceeded)):
+        return False
+    status = error_status(error)
+    if status is not None:
+        return status in UNAVAILABLE_STATUSES
+    return is_transient(error)
+
+
+class CircuitBreaker:
+    """Opens after failure_threshold consecutive upstream failures
+
+    While open, calls fail immediately with CircuitOpenError. After reset_timeout one
+    probe call is let through (half-open): success closes the circuit, failure re-opens it.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._rejections = 0
+        self._opens = 0
+
+    def check(self):
+        """Raise CircuitOpenError unless a call may go ahead now"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return
+            retry_in = self._opened_at + self.reset_timeout - time.monotonic()
+            if retry_in <= 0:
+                # Let this one call through as the probe; everyone else keeps failing fast.
+                # A probe that never reports back is replaced after another reset_timeout.
+                self._state = self.HALF_OPEN
+                self._opened_at = time.monotonic()
+                return
+            self._rejections += 1
+        raise CircuitOpenError(self.name, max(0.0, retry_in))
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self._opens += 1
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def record(self, error):
+        """Record the outcome of a call that raised: only upstream failures count against the circuit"""
+        if is_upstream_failure(error):
+            self.record_failure()
+        elif not isinstance(error, (DeadlineExceeded, RateLimitExceeded)):
+            # The upstream answered (a bad request or an unparseable reply) - it is up
+            self.record_success()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self._state,
+                "consecutive_failures": self._failures,
+                "times_opened": self._opens,
+                "rejected_calls": self._rejections,
+            }
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, bounded by attempts and the caller's deadline"""
+
+    def __init__(self, max_attempts=3, base_delay=0.25, max_delay=2.0, min_attempt_time=1.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # Don't start an attempt with less than this left before the deadline
+        self.min_attempt_time = min_attempt_time
+
+    def backoff(self, attempt):
+        """Delay before retry number `attempt` (1-based): uniform in [0, base * 2^(attempt-1)], capped"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def _attempt_timeout(self, attempt_timeout, deadline):
+        if deadline is None:
+            return attempt_timeout
+        remaining = deadline - time.monotonic()
+        if remaining < self.min_attempt_time:
+            raise DeadlineExceeded("Not enough time left before the request deadline")
+        return min(attempt_timeout, remaining)
+
+    def _retry_delay(self, error, attempt, deadline, retry_on):
+        """Seconds to wait before the next attempt, or None to give up and re-raise"""
+        if attempt >= self.max_attempts:
+            return None
+        if not (is_retryable(error) or isinstance(error, retry_on)):
+            return None
+        delay = max(self.backoff(attempt), min(retry_after(error) or 0, self.max_delay))
+        if deadline is not None and deadline - time.monotonic() < delay + self.min_attempt_time:
+            # The retry couldn't finish before the caller gives up on it
+            return None
+        return delay
+
+    def call(self, fn, attempt_timeout, deadline=None, breaker=None, retry_on=(), on_retry=None):
+        """Call fn(timeout) until it succeeds, the error isn't retryable, or attempts/time run out
+
+        timeout is attempt_timeout capped to the time left before deadline (a
+        time.monotonic() value). retry_on adds exception types worth retrying that
+        aren't upstream failures, such as an unparseable reply.
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            timeout = self._attempt_timeout(attempt_timeout, deadline)
+            if breaker is not None:
+                breaker.check()
+            try:
+                result = fn(timeout)
+            except Exception as e:
+                if breaker is not None:
+                    breaker.record(e)
+                delay = self._retry_delay(e, attempt, deadline, retry_on)
+                if delay is None:
+                    raise
+                if on_retry is not None:
+                    on_retry(e)
+                time.sleep(delay)
+                continue
+            if breaker is not None:
+                breaker.record_success()
+            return result
+
+    async def call_async(self, fn, attempt_timeout, deadline=None, breaker=None, retry_on=(), on_retry=None):
+        """Async counterpart of call: awaits fn(timeout) and sleeps without blocking the loop"""
+        attempt = 0
+        while True:
+            attempt += 1
+            timeout = self._attempt_timeout(attempt_timeout, deadline)
+            if breaker is not None:
+                breaker.check()
+            try:
+                result = await fn(timeout)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if breaker is not None:
+                    breaker.record(e)
+                delay = self._retry_delay(e, attempt, deadline, retry_on)
+                if delay is None:
+                    raise
+                if on_retry is not None:
+                    on_retry(e)
+                await asyncio.sleep(delay)
+                continue
+            if breaker is not None:
+                breaker.record_success()
+            return result
@@ -0,0 +1,217 @@
+"""
+Semantic cache for GPT recommendations: reuse a result whose preferences mean the same thing
+
+The exact-key response cache only matches preferences that normalize to the same
+words. Here each location/duration keeps the preference texts it has already answered
+as hashed n-gram vectors (computed locally, no embedding API), and a new request is
+served from the nearest one when their cosine similarity clears a threshold and the
+earlier preferences asked for every word the new ones do, so "vegetarian street food"
+is never answered with plain "street food". A word after "no", "not", "without" and
+the like counts as a different word, so "museums, no nightlife" doesn't match
+"nightlife, no museums". Lookups are one matrix-vector product per location. Entries expire by age, each location
+keeps a bounded number of them, and the least recently used locations are evicted
+beyond the overall size limit. Like MemoryCache, it lives in one worker.
+
+numpy is imported on first use, not with this module, so importing the app doesn't
+pay for it (app.warm_up imports it ahead of the first request).
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from cache import normalize_duration, normalize_location, normalize_preferences
+from startup import load_module
+
+DIM = 1024  # hashed feature buckets per vector
+NGRAM_WEIGHT = 0.2  # character trigrams (typos, word forms) count less than whole words
+
+# Words that pad a preference without changing it ("historical sites" asks for history)
+FILLER_WORDS = {
+    "activities", "best", "experiences", "good", "great", "lot", "lots", "options", "place",
+    "places", "site", "sites", "some", "spot", "spots", "stuff", "thing", "things", "t",
+}
+# Words that turn the next one around ("don't" is split into "don" and the filler "t")
+NEGATIONS = {"avoid", "don", "dont", "except", "never", "no", "non", "not", "without"}
+SUFFIXES = ("ically", "ical", "ies", "ing", "ic", "al", "es", "ed", "s", "y")
+
+def stem(word):
+    """Crude suffix stripping so 'history', 'historic' and 'historical' share a stem"""
+    for suffix in SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 4:
+            return word[:-len(suffix)]
+    return word
+
+def terms(preferences):
+    """Stemmed non-filler words of a preference text, negated ones marked with a leading '!'"""
+    result = []
+    negate = False
+    for word in normalize_preferences(preferences).split():
+        if word in NEGATIONS:
+            negate = True
+        elif word not in FILLER_WORDS:
+            result.append(("!" if negate else "") + stem(word))
+            negate = False
+    return result
+
+def _bucket(feature):
+    digest = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little")
+    # The sign bit keeps colliding features from only ever adding up
+    return digest % DIM, 1.0 if digest >> 63 else -1.0
+
+def embed(preferences):
+    """Unit vector of hashed word and character-trigram features (all zeros for no preferences)"""
+    np = load_module("numpy")
+    vector = np.zeros(DIM, dtype=np.float32)
+    for word in terms(preferences):
+        index, sign = _bucket("w:" + word)
+        vector[index] += sign
+        padded = f"#{word}#"
+        for i in range(len(padded) - 2):
+            index, sign = _bucket("c:" + padded[i:i + 3])
+            vector[index] += sign * NGRAM_WEIGHT
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class _Entries:
+    """Vectors and results for one location/duration, grown in place up to a fixed capacity"""
+
+    def __init__(self, size):
+        np = load_module("numpy")
+        self.vectors = np.zeros((size, DIM), dtype=np.float32)
+        self.created = np.full(size, -np.inf)  # -inf marks a free slot
+        self.values = [None] * size
+        self.terms = [frozenset()] * size
+
+    def __len__(self):
+        np = load_module("numpy")
+        return int(np.isfinite(self.created).sum())
+
+    def best(self, vector, wanted, oldest):
+        """(similarity, slot) of the closest entry created after oldest with all wanted terms, or (-1, None)"""
+        np = load_module("numpy")
+        similarities = self.vectors @ vector
+        similarities[self.created < oldest] = -1.0
+        for slot, held in enumerate(self.terms):
+            if not wanted <= held:
+                similarities[slot] = -1.0
+        slot = int(np.argmax(similarities))
+        if similarities[slot] < 0:
+            return -1.0, None
+        return float(similarities[slot]), slot
+
+    def put(self, vector, wanted, value, now, capacity, same_slot=None):
+        """Store an entry, reusing same_slot or a free slot, growing, or else replacing the oldest"""
+        np = load_module("numpy")
+        slot = same_slot
+        if slot is None:
+            free = np.flatnonzero(~np.isfinite(self.created))
+            if len(free):
+                slot = int(free[0])
+            elif len(self.created) < capacity:
+                slot = len(self.created)
+                grow = min(capacity, 2 * slot) - slot
+                self.vectors = np.vstack([self.vectors, np.zeros((grow, DIM), dtype=np.float32)])
+                self.created = np.concatenate([self.created, np.full(grow, -np.inf)])
+                self.values.extend([None] * grow)
+                self.terms.extend([frozenset()] * grow)
+            else:
+                slot = int(np.argmin(self.created))
+        self.vectors[slot] = vector
+        self.created[slot] = now
+        self.values[slot] = value
+        self.terms[slot] = wanted
+
+    def expire(self, oldest):
+        np = load_module("numpy")
+        expired = np.flatnonzero(self.created < oldest)
+        self.created[expired] = -np.inf
+        for slot in expired:
+            self.values[slot] = None
+            self.terms[slot] = frozenset()
+
+
+class SemanticCache:
+    """Nearest-neighbour cache of GPT results per (location, duration), matched on preferences"""
+
+    # Above this similarity a new entry replaces the old one instead of adding a near-duplicate
+    DUPLICATE_SIMILARITY = 0.999
+
+    def __init__(self, threshold=0.85, ttl=6 * 3600, max_entries=2048, max_per_location=64):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_per_location = max_per_location
+        self._locations = OrderedDict()  # least recently used first
+        self._size = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    @staticmethod
+    def _key(location, duration):
+        return normalize_location(location), normalize_duration(duration)
+
+    def get(self, location, preferences, duration):
+        """The cached result for the most similar earlier preferences covering all of these, or None"""
+        vector = embed(preferences)
+        if not vector.any():
+            return None  # nothing to compare - the exact-key cache covers empty preferences
+        key = self._key(location, duration)
+        with self._lock:
+            entries = self._locations.get(key)
+            similarity, slot = (-1.0, None) if entries is None else entries.best(vector, frozenset(terms(preferences)), time.time() - self.ttl)
+            if slot is None or similarity < self.threshold:
+                self._misses += 1
+                return None
+            self._locations.move_to_end(key)
+            self._hits += 1
+            return entries.values[slot]
+
+    def set(self, location, preferences, duration, value):
+        vector = embed(preferences)
+        if not vector.any():
+            return
+        wanted = frozenset(terms(preferences))
+        key = self._key(location, duration)
+        now = time.time()
+        with self._lock:
+            entries = self._locations.get(key)
+            if entries is None:
+                entries = self._locations[key] = _Entries(min(4, self.max_per_location))
+            self._locations.move_to_end(key)
+            before = len(entries)
+            entries.expire(now - self.ttl)
+            similarity, slot = entries.best(vector, wanted, now - self.ttl)
+            entries.put(vector, wanted, value, now, self.max_per_location,
+                        slot if similarity >= self.DUPLICATE_SIMILARITY else None)
+            self._size += len(entries) - before
+            while self._size > self.max_entries and len(self._locations) > 1:
+                _, evicted = self._locations.popitem(last=False)
+                self._size -= len(evicted)
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": self._size,
+                "locations": len(self._locations),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+def create_semantic_cache_from_env():
+    """Build the semantic cache described by SEMANTIC_CACHE_* environment variables (None if disabled)"""
+    if os.getenv("SEMANTIC_CACHE", "false").lower() in ("false", "0", "off", "none"):
+        return None
+    return SemanticCache(
+        threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.85)),
+        ttl=int(os.getenv("SEMANTIC_CACHE_TTL", os.getenv("CACHE_TTL_GPT", 6 * 3600))),
+        max_entries=int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", 2048)),
+        max_per_location=int(os.getenv("SEMANTIC_CACHE_MAX_PER_LOCATION", 64)),
+    )
@@ -0,0 +1,187 @@
+"""
+Serialized, compressed and validated JSON response bodies
+
+A recommendations response is a nested dict of several KB. It is serialized once,
+with orjson when that is installed or else the standard library, into a JSONBody. The
+JSONBody holds the bytes, a weak ETag, and the gzip and brotli encodings, each one
+compressed the first time a client accepts it. The ETag leaves out volatile members
+such as generated_at, so the same recommendations keep the same validator. Bodies of
+successful responses are kept in a small LRU. A repeated request then costs a lookup
+instead of a rebuild, serialization and compression pass. The ETag and encodings live
+in EncodedBody, which static_assets.Asset shares for files of any type.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import orjson
+except ImportError:  # optional: stdlib json is used instead
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # optional: only gzip is offered without it
+    brotli = None
+
+JSON_ENCODER = os.getenv("JSON_ENCODER", "orjson").lower()  # orjson (when installed) or json
+MIN_COMPRESS_SIZE = 1024  # smaller bodies go out as they are
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5  # brotli's higher levels cost far more CPU for a few percent
+
+
+def dumps(obj):
+    """Serialize to compact UTF-8 JSON bytes"""
+    if orjson is not None and JSON_ENCODER == "orjson":
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            pass  # e.g. integers beyond 64 bits - the stdlib copes
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def encoder_name():
+    """The JSON encoder dumps() uses"""
+    return "orjson" if orjson is not None and JSON_ENCODER == "orjson" else "json"
+
+
+def compress(body, encoding):
+    if encoding == "gzip":
+        # mtime=0 keeps the bytes identical every time the same body is compressed
+        return gzip.compress(body, GZIP_LEVEL, mtime=0)
+    if encoding == "br" and brotli is not None:
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return body
+
+
+def accepted_encodings(accept_encoding):
+    """{coding: q} from an Accept-Encoding header"""
+    accepted = {}
+    for item in (accept_encoding or "").split(","):
+        coding, _, params = item.strip().partition(";")
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding.strip().lower()] = q
+    return accepted
+
+
+def choose_encoding(accept_encoding, size):
+    """The best content-coding the client accepts for a body of this size: "br", "gzip" or "identity" """
+    if size < MIN_COMPRESS_SIZE:
+        return "identity"
+    accepted = accepted_encodings(accept_encoding)
+    offered = ["br", "gzip"] if brotli is not None else ["gzip"]
+    ranked = sorted(offered, key=lambda coding: accepted.get(coding, accepted.get("*", 0.0)), reverse=True)
+    best = ranked[0]
+    return best if accepted.get(best, accepted.get("*", 0.0)) > 0 else "identity"
+
+
+def etag_matches(if_none_match, etag):
+    """Does an If-None-Match header match this ETag? (weak comparison, as 304s use)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    return any((tag.strip()[2:] if tag.strip().startswith("W/") else tag.strip()) == opaque
+               for tag in if_none_match.split(","))
+
+
+def response_headers(body, encoding, cache_control):
+    """Headers for sending an EncodedBody in the given content-coding"""
+    headers = [("ETag", body.etag), ("Cache-Control", cache_control), ("Vary", "Accept-Encoding")]
+    if encoding != "identity":
+        headers.append(("Content-Encoding", encoding))
+    return headers
+
+
+class EncodedBody:
+    """Response bytes with their ETag and compressed encodings, each built on first use"""
+
+    def __init__(self, body, etag, encoded=None):
+        self.body = body
+        self.etag = etag
+        # encoded may carry content-codings compressed ahead of time, e.g. from a snapshot
+        self._encoded = dict(encoded or {}, identity=body)
+        self._lock = threading.Lock()
+
+    def encoded(self, encoding):
+        """The body in a content-coding from choose_encoding, compressed once and then reused"""
+        with self._lock:
+            data = self._encoded.get(encoding)
+        if data is None:
+            data = compress(self.body, encoding)
+            with self._lock:
+                self._encoded[encoding] = data
+        return data
+
+    def negotiate(self, accept_encoding, if_none_match=None):
+        """(not_modified, encoding, bytes) to send for a request with these headers"""
+        if etag_matches(if_none_match, self.etag):
+            return True, "identity", b""
+        encoding = choose_encoding(accept_encoding, len(self.body))
+        return False, encoding, self.encoded(encoding)
+
+
+class JSONBody(EncodedBody):
+    """Serialized JSON with its weak ETag and compressed encodings"""
+
+    @classmethod
+    def build(cls, payload, volatile=("generated_at",)):
+        """Serialize a dict; members named in volatile go at the end and are left out of the ETag"""
+        stable = {key: value for key, value in payload.items() if key not in volatile}
+        body = dumps(stable)
+        etag = 'W/"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+        extra = {key: payload[key] for key in volatile if key in payload}
+        if extra:
+            body = body[:-1] + (b"," if stable else b"") + dumps(extra)[1:]
+        return cls(body, etag)
+
+
+class BodyCache:
+    """Bounded LRU of JSONBody per request key, each reused for ttl seconds"""
+
+    def __init__(self, ttl=300, max_entries=256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                self._entries.pop(key, None)
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[1]
+
+    def set(self, key, body):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self._hits, "misses": self._misses}
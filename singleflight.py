@@ -0,0 +1,93 @@
+"""
+Single-flight request coalescing: concurrent identical upstream calls share one execution
+"""
+
+import asyncio
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Runs one call per key at a time; callers arriving meanwhile wait for and share its result"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._leaders = 0
+        self._coalesced = 0
+
+    def do(self, key, fn, *args):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._leaders += 1
+            else:
+                self._coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self):
+        with self._lock:
+            return {"in_flight": len(self._calls), "leaders": self._leaders, "coalesced": self._coalesced}
+
+
+class AsyncSingleFlight:
+    """Event-loop counterpart of SingleFlight for the ASGI serving mode"""
+
+    def __init__(self):
+        self._calls = {}
+        self._leaders = 0
+        self._coalesced = 0
+
+    async def do(self, key, fn, *args):
+        entry = self._calls.get(key)
+        if entry is None:
+            entry = self._calls[key] = {"task": asyncio.ensure_future(fn(*args)), "waiters": 0}
+            entry["task"].add_done_callback(lambda _: self._forget(key, entry))
+            self._leaders += 1
+        else:
+            self._coalesced += 1
+
+        # Shield the shared task so one waiter timing out doesn't cancel it for the
+        # others; only once every waiter has gone is the upstream call abandoned
+        entry["waiters"] += 1
+        try:
+            return await asyncio.shield(entry["task"])
+        finally:
+            entry["waiters"] -= 1
+            if entry["waiters"] == 0 and not entry["task"].done():
+                # Forget it now rather than when the cancellation lands: a caller arriving
+                # in between must start a new call, not share the cancelled one
+                self._forget(key, entry)
+                entry["task"].cancel()
+
+    def _forget(self, key, entry):
+        # A cancelled call finishing late must not drop the newer call under its key
+        if self._calls.get(key) is entry:
+            del self._calls[key]
+
+    def stats(self):
+        return {"in_flight": len(self._calls), "leaders": self._leaders, "coalesced": self._coalesced}
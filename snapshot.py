@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+Precomputed recommendation snapshots, served without any upstream call
+
+Most traffic asks about a few hundred well-known destinations with no particular
+preferences. `python snapshot.py build` runs the normal recommendation pipeline once for
+each seed city and duration bucket, then writes every successful response to a single
+file. Each response is stored serialized and gzipped, and found through a sorted index
+of key hashes. Workers memory-map the file, so a lookup is a binary search over the
+index plus a slice of the mapping. No JSON or gzip work happens per request, and the
+operating system shares the pages between all workers.
+
+The build writes to a temporary file and renames it into place. Each worker notices a
+new file within SNAPSHOT_CHECK_INTERVAL seconds and maps it in. Requests already
+holding the old mapping finish with it, so a snapshot is swapped without a restart.
+
+Usage:
+    python snapshot.py build --output recommendations.snapshot
+    python snapshot.py build --cities city_seeds.json --categories restaurants --categories restaurants,hotels
+    python snapshot.py info recommendations.snapshot
+"""
+
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from cache import STOPWORDS, make_key, normalize_duration, normalize_location
+from city_index import name_forms
+from serialization import JSONBody
+
+MAGIC = b"WWSNAP01"
+HEADER = struct.Struct("<8sIQI")    # magic, index records, index offset, metadata length
+RECORD = struct.Struct("<QQHQHII")  # key hash, key offset, key length, blob offset, ETag, body and gzip lengths
+
+# The duration options offered by the trip form
+DURATION_BUCKETS = ["Weekend getaway (2-3 days)", "Short trip (4-7 days)", "Medium trip (1-2 weeks)", "Long trip (2+ weeks)"]
+
+# Preferences made only of these words (and stopwords), between spaces and plain punctuation, ask for nothing in particular
+GENERIC_PREFERENCE_WORDS = {
+    "all", "any", "anything", "attractions", "best", "classic", "do", "everything", "explore", "first", "general",
+    "highlights", "main", "must", "n", "no", "none", "popular", "preference", "preferences", "recommendations",
+    "see", "sights", "sightseeing", "things", "time", "top", "tourist", "travel", "trip", "visit", "visiting",
+}
+
+
+GENERIC_SEPARATORS = re.compile(r"[\s,.;:!?/&+'\"()-]+")
+
+
+def is_generic_preferences(preferences):
+    """Are these preferences empty or generic enough that the snapshot's answer fits them?
+
+    Judged on the raw text: anything else in it, such as non-Latin words, emoji or
+    digits, asks for something the snapshot doesn't know about.
+    """
+    text = "" if preferences is None else str(preferences).strip().casefold()
+    if not text:
+        return True
+    words = [word for word in GENERIC_SEPARATORS.split(text) if word]
+    return (any(word in GENERIC_PREFERENCE_WORDS for word in words)
+            and all(word in GENERIC_PREFERENCE_WORDS or word in STOPWORDS for word in words))
+
+
+def snapshot_key(location, duration, categories):
+    return make_key("snapshot", normalize_location(location), normalize_duration(duration), ",".join(categories))
+
+
+def key_hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little")
+
+
+def write_snapshot(path, entries, meta=None):
+    """Write (keys, JSONBody) entries to a snapshot file and atomically replace path with it
+
+    Each body is stored once, under every key in its list; a key already written by an
+    earlier entry is skipped. Returns the number of keys written.
+    """
+    meta = json.dumps(dict(meta or {}, built_at=time.time())).encode()
+    records, seen = [], set()
+    fd, temp_path = tempfile.mkstemp(prefix=".snapshot-", dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(HEADER.pack(MAGIC, 0, 0, 0) + meta)
+            for keys, body in entries:
+                keys = [key for key in keys if key not in seen]
+                if not keys:
+                    continue
+                etag, gzipped = body.etag.encode(), body.encoded("gzip")
+                blob_offset = f.tell()
+                f.write(etag + body.body + gzipped)
+                for key in keys:
+                    seen.add(key)
+                    encoded_key = key.encode()
+                    records.append((key_hash(key), f.tell(), len(encoded_key), blob_offset, len(etag), len(body.body), len(gzipped)))
+                    f.write(encoded_key)
+            records.sort()
+            index_offset = f.tell()
+            f.write(b"".join(RECORD.pack(*record) for record in records))
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, len(records), index_offset, len(meta)))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+    return len(records)
+
+
+class Snapshot:
+    """One snapshot file, memory-mapped read-only"""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.records, self._index, meta_length = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or self._index + self.records * RECORD.size > len(self._map):
+            raise ValueError(f"{path} is not a complete recommendations snapshot")
+        self.meta = json.loads(self._map[HEADER.size:HEADER.size + meta_length])
+        self.built_at = self.meta.get("built_at", stat.st_mtime)
+        # Tells a replaced file apart from the one already mapped
+        self.identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def __len__(self):
+        return self.records
+
+    def _record(self, position):
+        return RECORD.unpack_from(self._map, self._index + position * RECORD.size)
+
+    def get(self, key):
+        """The stored JSONBody for a key (with its gzip encoding ready), or None"""
+        target = key_hash(key)
+        low, high = 0, self.records
+        while low < high:
+            middle = (low + high) // 2
+            if self._record(middle)[0] < target:
+                low = middle + 1
+            else:
+                high = middle
+        encoded_key = key.encode()
+        # Every record with this hash, in case two keys share one
+        for position in range(low, self.records):
+            hashed, key_offset, key_length, blob, etag_length, body_length, gzip_length = self._record(position)
+            if hashed != target:
+                break
+            if self._map[key_offset:key_offset + key_length] != encoded_key:
+                continue
+            body_start = blob + etag_length
+            gzip_start = body_start + body_length
+            return JSONBody(self._map[body_start:gzip_start], self._map[blob:body_start].decode(),
+                            encoded={"gzip": self._map[gzip_start:gzip_start + gzip_length]})
+        return None
+
+
+class SnapshotStore:
+    """The snapshot at a path, mapped in again whenever the file is replaced
+
+    The path is checked at most every check_interval seconds, by whichever request
+    comes first. A missing file serves nothing. An unreadable one is reported and
+    ignored, and the previous snapshot keeps serving. Snapshots older than max_age
+    seconds are not served (0 disables the limit).
+    """
+
+    def __init__(self, path, max_age=0, check_interval=5):
+        self.path = path
+        self.max_age = max_age
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._checked = time.monotonic()
+        self._lock = threading.Lock()  # held by the request re-checking the file
+        self._stats_lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._loads = 0
+        self._error = None
+        self.reload()
+
+    def reload(self):
+        """Map the file in if it changed since the last load; True if a new snapshot was loaded"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self._snapshot = None
+            return False
+        current = self._snapshot
+        if current is not None and current.identity == (stat.st_ino, stat.st_mtime_ns, stat.st_size):
+            return False
+        try:
+            snapshot = Snapshot(self.path)
+        except (OSError, ValueError, struct.error) as e:
+            self._error = str(e)
+            return False
+        self._snapshot, self._error = snapshot, None
+        self._loads += 1
+        return True
+
+    def current(self):
+        """The snapshot to serve from, or None"""
+        if time.monotonic() - self._checked >= self.check_interval and self._lock.acquire(blocking=False):
+            try:
+                self._checked = time.monotonic()
+                self.reload()
+            finally:
+                self._lock.release()
+        snapshot = self._snapshot
+        if snapshot is None or (self.max_age and time.time() - snapshot.built_at > self.max_age):
+            return None
+        return snapshot
+
+    def get(self, location, duration, categories):
+        """The precomputed response for a trip with generic preferences, or None"""
+        snapshot = self.current()
+        body = snapshot.get(snapshot_key(location, duration, categories)) if snapshot is not None else None
+        with self._stats_lock:
+            if body is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+        return body
+
+    def stats(self):
+        snapshot = self._snapshot
+        with self._stats_lock:
+            stats = {"path": self.path, "entries": len(snapshot) if snapshot is not None else 0,
+                     "hits": self._hits, "misses": self._misses, "loads": self._loads}
+        if snapshot is not None:
+            stats["built_at"] = datetime.fromtimestamp(snapshot.built_at).isoformat()
+            stats["age"] = round(time.time() - snapshot.built_at)
+            stats["stale"] = bool(self.max_age and stats["age"] > self.max_age)
+        if self._error:
+            stats["error"] = self._error
+        return stats
+
+
+def trip_keys(city, duration, categories, taken):
+    """Keys a built trip is stored under: every name form of the city not already claimed by an earlier city"""
+    forms = [form for form in sorted(name_forms(city), key=len, reverse=True) if (form, duration, categories) not in taken]
+    taken.update((form, duration, categories) for form in forms)
+    return [snapshot_key(form, duration, categories) for form in forms]
+
+
+def build(cities, durations, category_sets, output, concurrency=4):
+    """Run the live pipeline for every city x duration x category set and write the snapshot"""
+    import app  # the build goes through the app's own caches, rate limits, retries and fallbacks
+
+    for categories in category_sets:
+        _, error = app.parse_categories(categories)
+        if error:
+            print(error, file=sys.stderr)
+            return 2
+    trips = [(city, duration, categories) for city in cities for duration in durations for categories in category_sets]
+
+    def fetch(trip):
+        city, duration, categories = trip
+        combined = app.fetch_recommendations(city, "", duration, categories)
+        # Fallback content is never frozen into a snapshot; the live path retries it
+        return None if app.is_degraded(combined) else JSONBody.build(combined)
+
+    entries, taken, failed = [], set(), []
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for count, (trip, body) in enumerate(zip(trips, pool.map(fetch, trips)), 1):
+            city, duration, categories = trip
+            if body is None:
+                failed.append(trip)
+            else:
+                entries.append((trip_keys(city, duration, tuple(categories), taken), body))
+            print(f"[{count}/{len(trips)}] {'skipped' if body is None else 'ok'}: {city} / {duration} / {','.join(categories)}",
+                  file=sys.stderr)
+    if not entries:
+        print("Nothing to write - every trip fell back; the existing snapshot is left as it is", file=sys.stderr)
+        return 1
+    meta = {"cities": len(cities), "durations": durations, "categories": [",".join(c) for c in category_sets],
+            "trips": len(entries), "failed": len(failed)}
+    keys = write_snapshot(output, entries, meta)
+    print(f"Wrote {output}: {len(entries)} trips under {keys} keys, {len(failed)} skipped, "
+          f"{os.path.getsize(output)} bytes in {time.monotonic() - started:.1f}s", file=sys.stderr)
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_command = commands.add_parser("build", help="precompute recommendations into a snapshot file")
+    build_command.add_argument("--output", default=os.getenv("SNAPSHOT_PATH") or "recommendations.snapshot")
+    build_command.add_argument("--cities", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "city_seeds.json"),
+                               help="JSON list of city names")
+    build_command.add_argument("--durations", nargs="+", default=DURATION_BUCKETS)
+    build_command.add_argument("--categories", action="append",
+                               help="comma-separated Qloo categories; repeat for several sets (default: restaurants)")
+    build_command.add_argument("--limit", type=int, help="only the first N cities")
+    build_command.add_argument("--concurrency", type=int, default=4, help="trips fetched at once")
+    info_command = commands.add_parser("info", help="describe a snapshot file")
+    info_command.add_argument("path")
+    args = parser.parse_args(argv)
+
+    if args.command == "info":
+        snapshot = Snapshot(args.path)
+        print(json.dumps(dict(snapshot.meta, keys=len(snapshot), bytes=os.path.getsize(args.path)), indent=2))
+        return 0
+    with open(args.cities) as f:
+        cities = json.load(f)[:args.limit]
+    category_sets = [[c.strip().lower() for c in value.split(",") if c.strip()] for value in args.categories or ["restaurants"]]
+    return build(cities, args.durations, category_sets, args.output, args.concurrency)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
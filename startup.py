@@ -0,0 +1,129 @@
+"""
+Worker startup: lazy imports and clients, fork safety and startup timings
+
+Importing openai is more than half of what it costs to import the app (about 0.8s of
+1.5s). Its client, the Qloo session and the upstream thread pools also hold sockets and
+threads that must not be shared across a fork. app.py uses this module to:
+- import heavy modules on first use (load_module)
+- build clients and pools on first use in each process (PerProcess). A gunicorn
+  --preload master that imported the app never hands its connections or pool threads
+  to the workers it forks.
+- record how long importing the app and building each component took (timings), for
+  /health and /metrics
+
+gunicorn.conf.py warms each worker in the background right after it forks, so the first
+request doesn't pay for any of this either.
+"""
+
+import importlib
+import os
+import sys
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+
+class StartupTimings:
+    """Seconds spent in each startup phase of this process, and of the preloaded parent it was forked from"""
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.parent_phases = {}
+        self._phases = {}
+        self._lock = threading.Lock()
+
+    def record(self, phase, seconds):
+        with self._lock:
+            self._phases[phase] = round(self._phases.get(phase, 0.0) + seconds, 4)
+
+    @contextmanager
+    def time(self, phase):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(phase, time.perf_counter() - started)
+
+    def phases(self):
+        with self._lock:
+            return dict(self._phases)
+
+    @property
+    def preloaded(self):
+        return bool(self.parent_phases)
+
+    def _after_fork(self):
+        # Phases timed so far happened once in the parent, before this worker existed
+        self._lock = threading.Lock()
+        self.pid = os.getpid()
+        self.parent_phases, self._phases = self._phases, {}
+
+    def stats(self):
+        stats = {"pid": self.pid, "preloaded": self.preloaded, "seconds": self.phases()}
+        if self.preloaded:
+            stats["parent_seconds"] = dict(self.parent_phases)
+        return stats
+
+
+timings = StartupTimings()
+
+
+def load_module(name):
+    """Import a module the first time it is needed, timing the import"""
+    module = sys.modules.get(name)
+    if module is None:
+        with timings.time(f"import_{name}"):
+            module = importlib.import_module(name)
+    return module
+
+
+class PerProcess:
+    """A client or pool built on first use, once per process, and used through this proxy
+
+    Attribute access is passed through to the built object, so it stands in wherever the
+    object itself would be used. The proxy's own names (instance, built and underscored
+    ones) are chosen not to hide any of the object's. A forked child starts without the
+    object, and builds its own on first use.
+    """
+
+    _instances = weakref.WeakSet()
+
+    def __init__(self, name, factory):
+        self._name = name
+        self._factory = factory
+        self._value = None
+        self._lock = threading.Lock()
+        PerProcess._instances.add(self)
+
+    @property
+    def built(self):
+        return self._value is not None
+
+    def instance(self):
+        """The object, built now if this process hasn't built it yet"""
+        value = self._value
+        if value is None:
+            with self._lock:
+                value = self._value
+                if value is None:
+                    with timings.time(self._name):
+                        value = self._value = self._factory()
+        return value
+
+    def __getattr__(self, name):
+        return getattr(self.instance(), name)
+
+    def _after_fork(self):
+        # The parent's object (sockets, pool threads) stays behind, unused
+        self._value = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def _reset_all_after_fork(cls):
+        timings._after_fork()
+        for instance in list(cls._instances):
+            instance._after_fork()
+
+
+os.register_at_fork(after_in_child=PerProcess._reset_all_after_fork)
@@ -0,0 +1,566 @@
+// Recent results, kept in localStorage and keyed on the normalized search. A repeat
+// search renders from here straight away. Within the server's max-age nothing is sent at
+// all; after that the copy is still shown, and revalidated in the background with its
+// ETag (a 304 costs the server no upstream work). Fallback results are never kept.
+const RESULT_CACHE = {
+    storageKey: 'wanderwise:results:v1',
+    ttl: 6 * 60 * 60 * 1000,        // results older than this are searched again
+    defaultMaxAge: 5 * 60 * 1000,   // fresh period for streamed results, which carry no Cache-Control
+    maxEntries: 20,
+    maxChars: 1024 * 1024           // about 2MB of localStorage's usual 5MB
+};
+let currentSearchKey = null;
+
+function searchKey(location, duration, preferences) {
+    // Coarser keys could mix up searches the server tells apart, so fold only what it folds
+    const place = location.trim().toLowerCase().replace(/\s+/g, ' ').replace(/\s*,\s*/g, ', ');
+    const text = preferences.trim().toLowerCase().replace(/\s+/g, ' ');
+    const words = text.match(/[\p{L}\p{N}_$]+/gu) || [];
+    return [place, duration.trim().toLowerCase(), words.length ? words.join(' ') : text].join('|');
+}
+
+function loadResults() {
+    try {
+        return JSON.parse(localStorage.getItem(RESULT_CACHE.storageKey)) || {};
+    } catch (error) {
+        return {};  // storage disabled or unreadable - run without the cache
+    }
+}
+
+function saveResults(entries) {
+    const now = Date.now();
+    // Expired entries go first, then the least recently used until under both limits
+    const keys = Object.keys(entries)
+        .filter(key => now - entries[key].storedAt < RESULT_CACHE.ttl)
+        .sort((a, b) => entries[b].usedAt - entries[a].usedAt);
+    let kept = keys.slice(0, RESULT_CACHE.maxEntries);
+    while (kept.length) {
+        const serialized = JSON.stringify(Object.fromEntries(kept.map(key => [key, entries[key]])));
+        if (serialized.length <= RESULT_CACHE.maxChars) {
+            try {
+                localStorage.setItem(RESULT_CACHE.storageKey, serialized);
+                return;
+            } catch (error) {
+                // Over quota (other data shares it) - drop the oldest and try again
+            }
+        }
+        kept = kept.slice(0, -1);
+    }
+    try {
+        localStorage.removeItem(RESULT_CACHE.storageKey);
+    } catch (error) {
+        // storage disabled
+    }
+}
+
+function getCachedResult(key) {
+    const entries = loadResults();
+    const entry = entries[key];
+    const now = Date.now();
+    if (!entry || now - entry.storedAt >= RESULT_CACHE.ttl) {
+        return null;
+    }
+    entry.usedAt = now;
+    saveResults(entries);
+    return { data: entry.data, etag: entry.etag, fresh: now < entry.freshUntil };
+}
+
+function cacheResult(key, data, etag, maxAge) {
+    const entries = loadResults();
+    const now = Date.now();
+    entries[key] = { data: data, etag: etag, storedAt: now, usedAt: now, freshUntil: now + maxAge };
+    saveResults(entries);
+}
+
+function refreshCachedResult(key, maxAge) {
+    // The server confirmed the copy (304): it counts as new again
+    const entries = loadResults();
+    const entry = entries[key];
+    if (entry) {
+        const now = Date.now();
+        Object.assign(entry, { storedAt: now, usedAt: now, freshUntil: now + maxAge });
+        saveResults(entries);
+    }
+}
+
+function responseMaxAge(response) {
+    const match = /max-age=(\d+)/.exec(response.headers.get('Cache-Control') || '');
+    return match ? Number(match[1]) * 1000 : RESULT_CACHE.defaultMaxAge;
+}
+
+function isCacheable(data) {
+    // Mirrors the server's is_degraded(): anything carrying an error is fallback content,
+    // and so is a stream whose GPT part broke off after some sections had arrived
+    if (data.gpt_error) {
+        return false;
+    }
+    const parts = [data.gpt_recommendations].concat(Object.values(data.qloo_recommendations || {}));
+    return parts.every(part => part && typeof part === 'object' && !part.error);
+}
+
+async function revalidateResult(key, search, cached) {
+    const headers = cached.etag ? { 'If-None-Match': cached.etag } : {};
+    try {
+        // The GET form of the endpoint is the one that answers with ETags and 304s
+        const response = await fetch(`/api/recommendations?${new URLSearchParams(search)}`, {
+            headers: headers,
+            cache: 'no-store'
+        });
+        if (response.status === 304) {
+            refreshCachedResult(key, responseMaxAge(response));
+            return;
+        }
+        if (!response.ok) {
+            return;
+        }
+        const data = await response.json();
+        const etag = response.headers.get('ETag');
+        // A fallback answer doesn't replace a good copy; the next search tries again
+        if (!isCacheable(data) || /no-store/.test(response.headers.get('Cache-Control') || '')) {
+            return;
+        }
+        cacheResult(key, data, etag, responseMaxAge(response));
+        if (currentSearchKey === key && etag !== cached.etag) {
+            displayResults(data, search.location, false);
+        }
+    } catch (error) {
+        // Offline or the server is unreachable - the cached copy stays on screen
+    }
+}
+
+document.getElementById('recommendationForm').addEventListener('submit', async function(e) {
+    e.preventDefault();
+
+    const submitBtn = document.getElementById('submitBtn');
+    const loading = document.getElementById('loading');
+    const resultsSection = document.getElementById('resultsSection');
+
+    // Get form data
+    const formData = new FormData(this);
+    const location = formData.get('location');
+    const duration = formData.get('duration');
+    const budget = formData.get('budget');
+    const preferences = formData.get('preferences');
+
+    // Combine preferences with budget
+    let fullPreferences = preferences;
+    if (budget) {
+        fullPreferences = (preferences ? preferences + '. ' : '') + `Budget preference: ${budget}`;
+    }
+
+    const search = { location: location, duration: duration, preferences: fullPreferences };
+    const key = searchKey(location, duration, fullPreferences);
+    currentSearchKey = key;
+    const cached = getCachedResult(key);
+    if (cached) {
+        displayResults(cached.data, location);
+        if (!cached.fresh) {
+            revalidateResult(key, search, cached);
+        }
+        return;
+    }
+
+    // Show loading
+    submitBtn.disabled = true;
+    loading.style.display = 'block';
+    resultsSection.style.display = 'none';
+
+    try {
+        const requestBody = JSON.stringify(search);
+
+        // Stream sections as they arrive; fall back to the single JSON response
+        // on browsers that can't read a response body incrementally
+        if (window.ReadableStream && window.TextDecoder) {
+            const response = await fetch('/api/recommendations/stream', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: requestBody
+            });
+
+            if (!response.ok || !response.body) {
+                const data = await response.json();
+                throw new Error(data.error || 'Failed to get recommendations');
+            }
+
+            const data = await readRecommendationStream(response, location, () => {
+                loading.style.display = 'none';
+            });
+            // Only a stream that got to its end event is complete
+            if (data.generated_at && isCacheable(data)) {
+                cacheResult(key, data, null, RESULT_CACHE.defaultMaxAge);
+            }
+        } else {
+            const response = await fetch('/api/recommendations', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: requestBody
+            });
+
+            const data = await response.json();
+
+            if (response.ok) {
+                displayResults(data, location);
+                if (isCacheable(data) && !/no-store/.test(response.headers.get('Cache-Control') || '')) {
+                    cacheResult(key, data, response.headers.get('ETag'), responseMaxAge(response));
+                }
+            } else {
+                throw new Error(data.error || 'Failed to get recommendations');
+            }
+        }
+
+    } catch (error) {
+        showError(error.message);
+    } finally {
+        submitBtn.disabled = false;
+        loading.style.display = 'none';
+    }
+});
+
+async function readRecommendationStream(response, location, onFirstContent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    const data = { gpt_recommendations: {}, qloo_recommendations: null };
+    let receivedSections = false;
+    let rendered = false;
+    let buffer = '';
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) {
+            break;
+        }
+        buffer += decoder.decode(value, { stream: true });
+
+        // Server-Sent Events frames are separated by a blank line
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const frame = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            const event = parseStreamEvent(frame);
+            if (!event) {
+                continue;
+            }
+
+            if (event.name === 'section') {
+                data.gpt_recommendations[event.data.name] = event.data.value;
+                receivedSections = true;
+            } else if (event.name === 'gpt_error') {
+                // Remember the failure even when sections are kept, so the partial result isn't cached
+                data.gpt_error = event.data.error || 'GPT recommendations are incomplete';
+                // Keep sections that already arrived rather than replacing them with an error
+                if (!receivedSections) {
+                    data.gpt_recommendations = event.data;
+                }
+            } else if (event.name === 'qloo') {
+                data.qloo_recommendations = event.data;
+            } else if (event.name === 'done') {
+                data.generated_at = event.data.generated_at;
+                continue;
+            }
+
+            displayResults(data, location, !rendered);
+            if (!rendered) {
+                rendered = true;
+                onFirstContent();
+            }
+        }
+    }
+    return data;
+}
+
+function parseStreamEvent(frame) {
+    let name = 'message';
+    let payload = '';
+    frame.split('\n').forEach(line => {
+        if (line.startsWith('event: ')) {
+            name = line.slice(7);
+        } else if (line.startsWith('data: ')) {
+            payload += line.slice(6);
+        }
+    });
+    return payload ? { name: name, data: JSON.parse(payload) } : null;
+}
+
+function displayResults(data, location, scroll = true) {
+    const resultsSection = document.getElementById('resultsSection');
+    const gptData = data.gpt_recommendations;
+
+    let html = '';
+
+    // Show error message if GPT failed, but don't return early
+    if (gptData.error) {
+        if (gptData.error.includes('AI recommendations temporarily unavailable') || gptData.error.includes('fallback')) {
+            html += `
+                <div class="partial-success-message">
+                    <i class="fas fa-info-circle"></i>
+                    <strong>Partial Results Available</strong>
+                    <p>Some AI recommendations are temporarily unavailable, but you still have access to restaurant recommendations below.</p>
+                    <p><small>Technical details: ${gptData.error}</small></p>
+                </div>
+            `;
+        } else if (gptData.error.includes('not found') || gptData.error.includes('Location')) {
+            html += `
+                <div class="error-message">
+                    <i class="fas fa-map-marker-alt"></i>
+                    <strong>Location Not Found</strong>
+                    <p>We couldn't find "${location}". Please check the spelling or try a different city name.</p>
+                    <p><small>Technical details: ${gptData.error}</small></p>
+                </div>
+            `;
+        } else {
+            html += `
+                <div class="error-message">
+                    <i class="fas fa-exclamation-triangle"></i>
+                    <strong>Service Temporarily Unavailable</strong>
+                    <p>We're experiencing high demand. Please try again in a few moments.</p>
+                    <p><small>Technical details: ${gptData.error}</small></p>
+                </div>
+            `;
+        }
+    } else {
+        // Show destination header only if GPT worked
+        html += `
+            <div class="destination-header">
+                <h2><i class="fas fa-map-marker-alt"></i> ${location}</h2>
+                <p>Your personalized travel guide</p>
+            </div>
+        `;
+
+        // Show destination info only if GPT worked
+        if (gptData.destination_info) {
+            html += `
+                <div class="destination-info">
+                    <div class="info-card">
+                        <h3><i class="fas fa-clock"></i> Best Time to Visit</h3>
+                        <p>${gptData.destination_info.best_time_to_visit || 'Information not available'}</p>
+                    </div>
+                    <div class="info-card">
+                        <h3><i class="fas fa-cloud-sun"></i> Weather Info</h3>
+                        <p>${gptData.destination_info.weather_info || 'Information not available'}</p>
+                    </div>
+                    <div class="info-card">
+                        <h3><i class="fas fa-landmark"></i> Cultural Highlights</h3>
+                        <p>${gptData.destination_info.cultural_highlights || 'Information not available'}</p>
+                    </div>
+                </div>
+            `;
+        }
+
+        // Show GPT food recommendations only if GPT worked
+        if (gptData.food_recommendations && gptData.food_recommendations.length > 0) {
+            html += `
+                <div class="recommendation-section">
+                    <h3><i class="fas fa-utensils"></i> Must-Try Food & Restaurants (${gptData.food_recommendations.length} recommendations)</h3>
+            `;
+
+            gptData.food_recommendations.forEach(food => {
+                html += `
+                    <div class="recommendation-item">
+                        <h4>${food.name}</h4>
+                        <p><strong>Cuisine:</strong> ${food.cuisine}</p>
+                        <p>${food.description}</p>
+                        <p><strong>Location:</strong> ${food.location}</p>
+                        <p><strong>Price Range:</strong> ${food.price_range}</p>
+                        <div class="tags">
+                            ${food.must_try_dishes ? food.must_try_dishes.map(dish => `<span class="tag">${dish}</span>`).join('') : ''}
+                        </div>
+                    </div>
+                `;
+            });
+
+            html += '</div>';
+        }
+
+        // Show other GPT recommendations only if GPT worked
+        if (gptData.experience_recommendations && gptData.experience_recommendations.length > 0) {
+            html += `
+                <div class="recommendation-section">
+                    <h3><i class="fas fa-star"></i> Unforgettable Experiences (${gptData.experience_recommendations.length} recommendations)</h3>
+            `;
+
+            gptData.experience_recommendations.forEach(exp => {
+                html += `
+                    <div class="recommendation-item">
+                        <h4>${exp.name}</h4>
+                        <p><strong>Category:</strong> ${exp.category}</p>
+                        <p>${exp.description}</p>
+                        <p><strong>Duration:</strong> ${exp.duration}</p>
+                        <p><strong>Best Time:</strong> ${exp.best_time}</p>
+                        <p><strong>Pro Tips:</strong> ${exp.tips}</p>
+                    </div>
+                `;
+            });
+
+            html += '</div>';
+        }
+
+        if (gptData.hidden_gems && gptData.hidden_gems.length > 0) {
+            html += `
+                <div class="recommendation-section">
+                    <h3><i class="fas fa-gem"></i> Hidden Gems (${gptData.hidden_gems.length} recommendations)</h3>
+            `;
+
+            gptData.hidden_gems.forEach(gem => {
+                html += `
+                    <div class="recommendation-item">
+                        <h4>${gem.name}</h4>
+                        <p><strong>Type:</strong> ${gem.type}</p>
+                        <p>${gem.description}</p>
+                        <p><strong>Location:</strong> ${gem.location}</p>
+                    </div>
+                `;
+            });
+
+            html += '</div>';
+        }
+
+        if (gptData.travel_tips && gptData.travel_tips.length > 0) {
+            html += `
+                <div class="tips-section">
+                    <h3><i class="fas fa-lightbulb"></i> Pro Travel Tips</h3>
+                    <ul class="tips-list">
+                        ${gptData.travel_tips.map(tip => `<li>${tip}</li>`).join('')}
+                    </ul>
+                </div>
+            `;
+        }
+    }
+
+    // Qloo Recommendations - ALWAYS show these (even if GPT failed)
+    if (data.qloo_recommendations) {
+        const qlooData = data.qloo_recommendations;
+
+        // Check for location not found error in Qloo data
+        if (qlooData.restaurants && qlooData.restaurants.error && qlooData.restaurants.error.includes('not found')) {
+            html += `
+                <div class="error-message">
+                    <i class="fas fa-map-marker-alt"></i>
+                    <strong>Location Not Found</strong>
+                    <p>We couldn't find "${location}". Please check the spelling or try a different city name.</p>
+                    <p><small>Technical details: ${qlooData.restaurants.error}</small></p>
+                </div>
+            `;
+        }
+        // Check for Qloo API errors (but still show GPT results)
+        else if (qlooData.restaurants && qlooData.restaurants.error) {
+            html += `
+                <div class="partial-success-message">
+                    <i class="fas fa-info-circle"></i>
+                    <strong>Restaurant Recommendations Unavailable</strong>
+                    <p>AI recommendations are available above, but restaurant data is temporarily unavailable.</p>
+                    <p><small>Technical details: ${qlooData.restaurants.error}</small></p>
+                </div>
+            `;
+        }
+        // Restaurants from Qloo
+        else if (qlooData.restaurants && !qlooData.restaurants.error && qlooData.restaurants.results && qlooData.restaurants.results.length > 0) {
+            html += `
+                <div class="recommendation-section">
+                    <h3><i class="fas fa-star"></i> Qloo AI Restaurant Recommendations (${qlooData.restaurants.results.length} recommendations)</h3>
+            `;
+
+            qlooData.restaurants.results.forEach(restaurant => {
+                html += `
+                    <div class="recommendation-item">
+                        <h4>${restaurant.name || 'Restaurant'}</h4>
+                        <p><strong>Category:</strong> ${restaurant.category || 'Restaurant'}</p>
+                        <p><strong>Location:</strong> ${restaurant.location || 'Location not specified'}</p>
+                        ${restaurant.description ? `<p>${restaurant.description}</p>` : ''}
+                        ${restaurant.rating ? `<p><strong>Rating:</strong> ${restaurant.rating}</p>` : ''}
+                    </div>
+                `;
+            });
+
+            html += '</div>';
+        }
+    }
+
+    resultsSection.innerHTML = html;
+    resultsSection.style.display = 'block';
+
+    // Smooth scroll to results (only on first render while streaming)
+    if (scroll) {
+        resultsSection.scrollIntoView({ behavior: 'smooth' });
+    }
+}
+
+function showError(message) {
+    const resultsSection = document.getElementById('resultsSection');
+
+    // Check if it's an AI recommendations issue (which is actually a partial success)
+    if (message.includes('AI recommendations temporarily unavailable') || message.includes('fallback')) {
+        resultsSection.innerHTML = `
+            <div class="partial-success-message">
+                <i class="fas fa-info-circle"></i>
+                <strong>Partial Results Available</strong>
+                <p>Some AI recommendations are temporarily unavailable, but you still have access to restaurant recommendations below.</p>
+                <p><small>Technical details: ${message}</small></p>
+            </div>
+        `;
+    } else {
+        resultsSection.innerHTML = `
+            <div class="error-message">
+                <i class="fas fa-exclamation-triangle"></i>
+                <strong>Service Temporarily Unavailable</strong>
+                <p>We're experiencing high demand. Please try again in a few moments.</p>
+                <p><small>Technical details: ${message}</small></p>
+            </div>
+        `;
+    }
+    resultsSection.style.display = 'block';
+    resultsSection.scrollIntoView({ behavior: 'smooth' });
+}
+
+// Location typeahead, served from the server's local city index. Requests go out
+// only once typing pauses, a newer query aborts an older one, and prefixes already
+// seen are answered from memory.
+(function() {
+    const input = document.getElementById('location');
+    const list = document.getElementById('locationSuggestions');
+    const suggestions = new Map();
+    let timer = null;
+    let controller = null;
+
+    function render(results) {
+        list.replaceChildren(...results.map(city => {
+            const option = document.createElement('option');
+            option.value = city.name;
+            return option;
+        }));
+    }
+
+    async function suggest(query) {
+        if (suggestions.has(query)) {
+            render(suggestions.get(query));
+            return;
+        }
+        if (controller) controller.abort();
+        controller = new AbortController();
+        try {
+            const response = await fetch(`/api/qloo-search?mode=autocomplete&q=${encodeURIComponent(query)}`, {
+                signal: controller.signal
+            });
+            if (!response.ok) return;
+            const results = (await response.json()).results || [];
+            suggestions.set(query, results);
+            if (input.value.trim() === query) render(results);
+        } catch (error) {
+            // Superseded by a newer query, or offline - suggestions are optional
+        }
+    }
+
+    input.addEventListener('input', () => {
+        clearTimeout(timer);
+        const query = input.value.trim();
+        if (query.length < 2) {
+            render([]);
+            return;
+        }
+        timer = setTimeout(() => suggest(query), 150);
+    });
+})();
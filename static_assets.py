@@ -0,0 +1,66 @@
+"""
+Fingerprinted static assets and the pre-rendered page shell
+
+The page's stylesheet and script live in static/. Each file is read once at startup and
+served from /assets/ under a name carrying a hash of its content (app.1f3c9a2b7d.css).
+A changed file gets a new URL, so browsers may keep every version for a year without
+asking again. The shell (templates/index.html) is rendered once too, linking to those
+names. Browsers revalidate it on every visit, which a matching ETag answers with an
+empty 304, and pick up a deploy's new assets straight away. Every file is gzipped once
+up front, so serving one is a dict lookup.
+"""
+
+import hashlib
+import mimetypes
+import os
+
+from serialization import EncodedBody
+
+IMMUTABLE = "public, max-age=31536000, immutable"  # fingerprinted URLs never change content
+REVALIDATE = "no-cache"  # may be stored, but checked with the server before each use
+
+
+class Asset(EncodedBody):
+    """A static file's bytes, strong ETag and compressed encodings"""
+
+    def __init__(self, name, body, mimetype=None):
+        digest = hashlib.blake2b(body, digest_size=8).hexdigest()
+        super().__init__(body, f'"{digest}"')
+        self.name = name
+        self.mimetype = mimetype or mimetypes.guess_type(name)[0] or "application/octet-stream"
+        stem, extension = os.path.splitext(name)
+        self.fingerprinted = f"{stem}.{digest[:10]}{extension}"
+        self.encoded("gzip")
+
+
+class StaticAssets:
+    """Every file in a directory, served under names that change with their content"""
+
+    def __init__(self, directory, prefix="/assets/"):
+        self.directory = directory
+        self.prefix = prefix
+        self._assets = {}
+        self._fingerprinted = {}
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if not os.path.isfile(path) or name.startswith("."):
+                continue
+            with open(path, "rb") as f:
+                asset = Asset(name, f.read())
+            self._assets[name] = asset
+            self._fingerprinted[asset.fingerprinted] = asset
+
+    def url(self, name):
+        """The fingerprinted URL of a file (for templates)"""
+        return self.prefix + self._assets[name].fingerprinted
+
+    def lookup(self, requested):
+        """(Asset, Cache-Control) for a requested fingerprinted name, or (None, None)"""
+        asset = self._fingerprinted.get(requested)
+        if asset is not None:
+            return asset, IMMUTABLE
+        # A page from before a deploy asks for an older version: send the current file,
+        # but don't let it be cached under the old name
+        stem, extension = os.path.splitext(requested)
+        asset = self._assets.get(stem.rpartition(".")[0] + extension)
+        return (asset, REVALIDATE) if asset is not None else (None, None)
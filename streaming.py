@@ -0,0 +1,86 @@
+"""
+Helpers for streaming recommendations to the browser as Server-Sent Events
+"""
+
+import json
+
+
+def sse_event(event, data):
+    """Format one Server-Sent Event frame with a JSON payload"""
+    return sse_frame(event, json.dumps(data))
+
+def sse_frame(event, payload_json):
+    """Format one Server-Sent Event frame from already-serialized JSON"""
+    return f"event: {event}\ndata: {payload_json}\n\n"
+
+
+class SectionStreamParser:
+    """Incrementally extracts completed top-level sections from a JSON object streamed in chunks
+
+    Feeding '{"destination_info": {...}, "food_reco' yields ("destination_info", {...})
+    as soon as that value closes, without waiting for the rest of the object. Anything
+    before the opening brace (such as a ```json fence) is ignored.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._key_start = None
+        self._key_end = None
+        self._value_start = None
+        self.sections = {}
+        self.complete = False
+
+    def feed(self, chunk):
+        """Consume the next chunk of text, returning any (name, value) sections it completed"""
+        self.text += chunk
+        completed = []
+        text = self.text
+        while self._pos < len(text) and not self.complete:
+            ch = text[self._pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._value_start is None:
+                        self._key_end = self._pos
+            elif ch == '"':
+                if self._depth >= 1:
+                    self._in_string = True
+                    if self._depth == 1 and self._value_start is None:
+                        self._key_start = self._pos
+            elif ch in "{[":
+                if self._depth > 0 or ch == "{":
+                    self._depth += 1
+            elif ch in "}]":
+                if self._depth > 0:
+                    self._depth -= 1
+                    if self._depth == 0:
+                        self._finish_section(completed)
+                        self.complete = True
+            elif self._depth == 1:
+                if ch == ":" and self._key_end is not None and self._value_start is None:
+                    self._value_start = self._pos + 1
+                elif ch == ",":
+                    self._finish_section(completed)
+            self._pos += 1
+        return completed
+
+    def _finish_section(self, completed):
+        """Decode the key/value pair that just closed at the top level"""
+        if self._key_end is not None and self._value_start is not None:
+            try:
+                name = json.loads(self.text[self._key_start:self._key_end + 1])
+                value = json.loads(self.text[self._value_start:self._pos])
+            except ValueError:
+                pass
+            else:
+                self.sections[name] = value
+                completed.append((name, value))
+        self._key_start = self._key_end = self._value_start = None
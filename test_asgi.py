@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Tests for the ASGI entry point: async handlers for upstream-bound routes, Flask for the rest
+"""
+
+import asyncio
+import os
+import tempfile
+
+import httpx
+import pytest
+
+# The app reads its settings at import: keep it off shared files and real upstreams
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("CITY_INDEX_PATH", os.path.join(tempfile.mkdtemp(), "city_index.json"))
+os.environ.setdefault("RATE_LIMIT_PATH", "")
+os.environ.setdefault("SNAPSHOT_PATH", "")
+os.environ.setdefault("CACHE_BACKEND", "memory")
+
+import app
+import asgi
+from serialization import BodyCache
+
+GPT_RESULT = {"destination_info": {"best_time_to_visit": "Autumn"}, "travel_tips": ["Carry cash"]}
+CITY = {"id": "city-2", "name": "Kyoto"}
+
+def call(method, path, **kwargs):
+    """One request through asgi.application, returning the httpx response"""
+    async def run():
+        transport = httpx.ASGITransport(app=asgi.application)
+        async with httpx.AsyncClient(transport=transport, base_url="http://wanderwise.test") as client:
+            return await client.request(method, path, **kwargs)
+    return asyncio.run(run())
+
+@pytest.fixture
+def upstreams(monkeypatch):
+    """Stubbed async recommender calls, so nothing leaves the process"""
+    async def gpt(location, preferences, duration, deadline=None):
+        return GPT_RESULT
+
+    async def resolve(location, deadline=None):
+        return CITY, None
+
+    async def category(location, city, category, deadline=None):
+        return {"results": [f"{category} in {city['name']}"]}
+
+    monkeypatch.setattr(app.recommender, "has_cached_recommendations", lambda *args: False)
+    monkeypatch.setattr(app.recommender, "get_cached_qloo_recommendations", lambda location, category: None)
+    monkeypatch.setattr(app.recommender, "get_gpt_recommendations_async", gpt)
+    monkeypatch.setattr(app.recommender, "resolve_qloo_city_async", resolve)
+    monkeypatch.setattr(app.recommender, "get_qloo_category_async", category)
+    # Each test's client runs on its own event loop: don't keep one loop's client for the next
+    monkeypatch.setattr(app.recommender, "async_qloo_client", None)
+    # A fresh response cache, so one test's body isn't served to the next
+    bodies = BodyCache()
+    monkeypatch.setattr(app, "response_bodies", bodies)
+    monkeypatch.setattr(asgi, "response_bodies", bodies)
+
+def test_post_merges_gpt_and_qloo(upstreams):
+    response = call("POST", "/api/recommendations", json={"location": "Kyoto", "categories": ["restaurants", "hotels"]})
+    assert response.status_code == 200 and response.headers["content-type"] == "application/json"
+    combined = response.json()
+    assert combined["gpt_recommendations"] == GPT_RESULT
+    assert combined["qloo_recommendations"] == {"restaurants": {"results": ["restaurants in Kyoto"]},
+                                                "hotels": {"results": ["hotels in Kyoto"]}}
+
+def test_get_reads_the_query_string(upstreams):
+    response = call("GET", "/api/recommendations", params={"location": "Kyoto", "categories": "hotels"})
+    assert response.status_code == 200
+    assert response.json()["qloo_recommendations"] == {"hotels": {"results": ["hotels in Kyoto"]}}
+
+@pytest.mark.parametrize("body, error", [
+    ({"location": "Kyoto", "duration": 5}, "'duration' must be a string"),
+    ({"location": {"city": "Kyoto"}}, "'location' must be a string"),
+    ([1], "Request body must be a JSON object"),
+    ("Kyoto", "Request body must be a JSON object"),
+    ({"preferences": "food"}, "Location is required"),
+    ({"location": "Kyoto", "categories": 3}, "'categories' must be a list of Qloo categories"),
+])
+def test_bad_requests_are_a_json_400(upstreams, body, error):
+    response = call("POST", "/api/recommendations", json=body)
+    assert response.status_code == 400 and response.json() == {"error": error}
+
+@pytest.mark.parametrize("helper", ["record_demand", "snapshot_body"])
+def test_a_failing_helper_is_a_json_500(upstreams, monkeypatch, helper):
+    def fail(*args):
+        raise RuntimeError("store is down")
+
+    monkeypatch.setattr(asgi, helper, fail)
+    response = call("POST", "/api/recommendations", json={"location": "Kyoto"})
+    assert response.status_code == 500 and response.headers["content-type"] == "application/json"
+    assert response.json()["gpt_recommendations"]["error"] == "Server temporarily unavailable: store is down"
+
+def test_a_failing_cache_check_is_a_json_500(upstreams, monkeypatch):
+    def fail(*args):
+        raise RuntimeError("cache is down")
+
+    monkeypatch.setattr(app.recommender, "has_cached_recommendations", fail)
+    response = call("GET", "/api/recommendations", params={"location": "Kyoto"})
+    assert response.status_code == 500
+    assert response.json()["gpt_recommendations"]["error"] == "Server temporarily unavailable: cache is down"
+    assert asgi.admission.stats()["active"] == 0
+
+def test_other_routes_are_served_by_flask():
+    response = call("GET", "/")
+    assert response.status_code == 200 and response.headers["etag"] == app.page_shell.etag
+    assert call("GET", "/", headers={"If-None-Match": app.page_shell.etag}).status_code == 304
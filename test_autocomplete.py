@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Tests for the location autocomplete prefix index
+"""
+
+import json
+import os
+import tempfile
+
+from autocomplete import PrefixIndex, build_prefix_index
+from city_index import CityIndex
+
+def test_prefix_matches_rank_name_starts_first_then_popularity():
+    index = PrefixIndex()
+    index.add("Auckland, New Zealand", popularity=5)
+    index.add("New Orleans, United States", popularity=1)
+    index.add("New York, United States", popularity=3)
+    names = [city["name"] for city in index.complete("new")]
+    assert names == ["New York, United States", "New Orleans, United States", "Auckland, New Zealand"]
+    assert [city["name"] for city in index.complete("NEW  y")] == ["New York, United States"]
+
+def test_later_words_complete_too():
+    index = PrefixIndex()
+    index.add("New York, United States")
+    assert index.complete("york") == [{"name": "New York, United States", "id": None}]
+    assert index.complete("zurich") == []
+    assert index.complete("  ") == []
+
+def test_limit_and_touch_popularity():
+    index = PrefixIndex()
+    for name in ("Santiago", "San Diego", "Santorini", "Sapporo"):
+        index.add(name)
+    assert len(index.complete("sa", limit=2)) == 2
+    index.touch("sapporo")
+    assert index.complete("sa")[0]["name"] == "Sapporo"
+
+def test_seeds_learn_qloo_ids_from_the_city_index():
+    """A seed like 'Tokyo, Japan' picks up the id Qloo returns for 'Tokyo' instead of duplicating it"""
+    with tempfile.TemporaryDirectory() as tmp:
+        seeds = os.path.join(tmp, "seeds.json")
+        with open(seeds, "w") as f:
+            json.dump(["Tokyo, Japan", "Toronto, Canada"], f)
+        city_index = CityIndex(os.path.join(tmp, "index.json"))
+        index = build_prefix_index(seeds, city_index)
+        assert [city["name"] for city in index.complete("to")] == ["Tokyo, Japan", "Toronto, Canada"]
+
+        city_index.add_search_results("tokio", [{"id": "Q-TOKYO", "name": "Tokyo"}, {"id": "Q-TOLEDO", "name": "Toledo"}])
+        assert index.complete("tok") == [{"name": "Tokyo, Japan", "id": "Q-TOKYO"}]
+        assert index.complete("tole") == [{"name": "Toledo", "id": "Q-TOLEDO"}]
+        assert len(index) == 3
+
+def test_missing_seed_file_gives_an_empty_index():
+    assert len(build_prefix_index("/nonexistent/seeds.json")) == 0
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Tests for the WanderWise response cache
+"""
+
+import os
+import tempfile
+import time
+
+from cache import (MemoryCache, ResponseCache, SQLiteCache, normalize_duration, normalize_location,
+                   normalize_preferences)
+
+def test_key_normalization():
+    """Equivalent requests should normalize to the same key parts"""
+    assert normalize_location("  Tokyo ,  Japan ") == normalize_location("tokyo, japan")
+    assert normalize_preferences("I love street food and history") == normalize_preferences("Street food, history")
+
+def test_preferences_keep_their_meaning():
+    """Word order, words in any script and punctuation-only text all stay apart from each other"""
+    assert normalize_preferences("I love museums, not nightlife") != normalize_preferences("I love nightlife, not museums")
+    assert normalize_preferences("寿司と寺が好き") not in ("", normalize_preferences("музеи и театры"))
+    assert normalize_preferences("музеи и театры") == normalize_preferences("Музеи  и театры")
+    assert normalize_preferences("!!!") == "!!!"
+    assert normalize_preferences("  ") == ""
+
+def test_normalization_accepts_any_json_value():
+    """Non-string fields don't crash key building"""
+    assert normalize_duration(5) == "5"
+    assert normalize_preferences(["Food", "art"]) == normalize_preferences("food art")
+    assert normalize_location(None) == ""
+
+def test_memory_cache_lru_and_ttl():
+    """The in-process backend evicts least recently used and expired entries"""
+    cache = MemoryCache(max_entries=2)
+    cache.set("a", {"v": 1}, ttl=60)
+    cache.set("b", {"v": 2}, ttl=60)
+    cache.get("a")
+    cache.set("c", {"v": 3}, ttl=60)
+    assert cache.get("b") is None
+    assert cache.get("a") == {"v": 1}
+
+    cache.set("d", {"v": 4}, ttl=0.01)
+    time.sleep(0.02)
+    assert cache.get("d") is None
+
+def test_sqlite_cache_shared_between_instances():
+    """Two backends on the same file (e.g. two workers) see each other's entries"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "cache.sqlite3")
+        SQLiteCache(path).set("gpt:tokyo", {"name": "Tokyo"}, ttl=60)
+        assert SQLiteCache(path).get("gpt:tokyo") == {"name": "Tokyo"}
+
+def test_hit_miss_counters():
+    """Hits and misses are counted per source"""
+    cache = ResponseCache(MemoryCache(), {"gpt": 60, "qloo": 60})
+    assert cache.get("gpt", "k") is None
+    cache.set("gpt", "k", {"ok": True})
+    assert cache.get("gpt", "k") == {"ok": True}
+    stats = cache.stats()["sources"]["gpt"]
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+
+def test_expires_in_reports_remaining_ttl():
+    """Both backends report how long an entry has left (None once it's gone)"""
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in (MemoryCache(), SQLiteCache(os.path.join(tmp, "cache.sqlite3"))):
+            backend.set("gpt:tokyo", {"ok": True}, 60)
+            assert 55 < backend.expires_in("gpt:tokyo") <= 60
+            assert backend.expires_in("gpt:paris") is None
+            backend.set("gpt:rome", {"ok": True}, -1)
+            assert backend.expires_in("gpt:rome") is None
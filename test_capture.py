@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Tests for the traffic capture log
+"""
+
+import json
+import os
+
+from capture import TrafficCapture, preferences_from_shape, preferences_shape, recommendations_shape
+
+def read_records(capture):
+    capture.flush()
+    with open(capture.path) as f:
+        return [json.loads(line) for line in f]
+
+def test_records_are_written_in_the_background(tmp_path):
+    capture = TrafficCapture(str(tmp_path))
+    shape = recommendations_shape("POST", " Tokyo ,Japan", "Street food; my email is bob@example.com", "3 days", ["restaurants"])
+    capture.record(dict(shape, type="request", status=200, seconds=0.5, bytes=2048))
+    capture.record({"type": "upstream", "upstream": "gpt", "stage": "gpt_completion", "seconds": 0.4, "ok": True})
+    records = read_records(capture)
+    assert [record["type"] for record in records] == ["request", "upstream"]
+    assert records[0]["location"] == "tokyo, japan" and "ts" in records[0]
+    assert "bob" not in json.dumps(records)  # preferences are only kept as a shape
+    assert capture.stats()["written"] == 2
+
+def test_preferences_replay_as_equal_or_distinct_text():
+    same = preferences_shape("Street food and history")
+    assert same == preferences_shape("Street FOOD, history")
+    assert same != preferences_shape("museums")
+    assert same != preferences_shape("history, street food")  # the same words in another order ask for something else
+    assert same["words"] == 3
+    assert preferences_from_shape(same) == preferences_from_shape(preferences_shape("street food history"))
+    generic = preferences_shape("Must-see highlights")
+    assert generic == {"generic": True, "text": "must see highlights"}
+    assert "hash" in preferences_shape("寿司") and "hash" in preferences_shape("anything 🍣")  # not logged as text
+    assert preferences_from_shape(preferences_shape("")) == ""
+
+def test_log_is_rotated(tmp_path):
+    capture = TrafficCapture(str(tmp_path), max_bytes=500, backups=2)
+    for batch in range(4):
+        for i in range(10):
+            capture.record({"type": "upstream", "upstream": "qloo", "seconds": i})
+        capture.flush()
+    assert os.path.exists(capture.path + ".1") and os.path.exists(capture.path + ".2")
+    assert not os.path.exists(capture.path + ".3")
+    assert capture.stats()["rotations"] == 4
+
+def test_full_queue_drops_instead_of_blocking(tmp_path):
+    capture = TrafficCapture(str(tmp_path), queue_size=2)
+    capture._pid = os.getpid()  # no writer draining the queue
+    for _ in range(5):
+        capture.record({"type": "upstream"})
+    stats = capture.stats()
+    assert stats["recorded"] == 2 and stats["dropped"] == 3
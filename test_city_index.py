@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Tests for the local city-resolution index
+"""
+
+import os
+import tempfile
+
+from city_index import CityIndex
+
+def test_lookup_exact_and_suggest_prefix_and_fuzzy():
+    """Cities resolve by name and alias only; a prefix or close misspelling is just a suggestion"""
+    index = CityIndex()
+    index.add_search_results("Tokyo, Japan", [{"id": "tokyo-id", "name": "Tokyo"}, {"id": "kyoto-id", "name": "Kyoto"}])
+    assert index.lookup("tokyo")["id"] == "tokyo-id"
+    assert index.lookup("Tokyo,  Japan")["id"] == "tokyo-id"
+    assert index.lookup("Kyo") is None and index.suggest("Kyo")["id"] == "kyoto-id"
+    assert index.lookup("Tokio") is None and index.suggest("Tokio")["id"] == "tokyo-id"
+    assert index.lookup("Lisbon") is None and index.suggest("Lisbon") is None
+
+def test_unindexed_city_is_not_taken_for_a_known_one():
+    """Real cities that look like known ones are left for Qloo to resolve"""
+    index = CityIndex()
+    index.add("limassol-id", "Limassol")
+    index.add("boston-id", "Boston")
+    assert index.lookup("Lima") is None
+    assert index.lookup("Bolton") is None
+
+def test_index_persists_to_disk():
+    """A new index on the same file (e.g. after a restart) sees saved cities"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "city_index.json")
+        CityIndex(path).add("paris-id", "Paris", aliases=["Paris, France"])
+        assert CityIndex(path).lookup("paris, france")["id"] == "paris-id"
+
+def test_qualifier_must_agree_with_the_known_city():
+    """A different country or region after the comma is a different city, not the one known by that name"""
+    index = CityIndex()
+    index.add("paris-id", "Paris", aliases=["Paris, France"])
+    index.add("san-jose-ca-id", "San Jose", aliases=["San Jose, California"])
+    assert index.lookup("Paris, Texas") is None
+    assert index.lookup("San Jose, Costa Rica") is None
+    assert index.lookup("Paris, France")["id"] == "paris-id"
+    assert index.lookup("Paris")["id"] == "paris-id"
+    assert index.lookup("San Jose, California")["id"] == "san-jose-ca-id"
+    assert index.lookup("Pariss, France") is None
+    assert index.suggest("Pariss, France")["id"] == "paris-id"  # typos are suggested when the country agrees
+    assert index.suggest("Pariss, Texas") is None
+
+def test_only_resolved_queries_become_aliases():
+    """A typeahead prefix or plain search teaches the cities found, not the text that found them"""
+    index = CityIndex()
+    index.add_search_results("Par", [{"id": "paramaribo-id", "name": "Paramaribo"}], alias=False)
+    index.add_search_results("City of Light", [{"id": "paris-id", "name": "Paris"}])
+    assert index.lookup("paramaribo")["aliases"] == []
+    assert index.lookup("city of light")["id"] == "paris-id"
+
+def test_background_save_batches_changes():
+    """With save_delay nothing is written on the caller's thread; one save then holds every change"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "city_index.json")
+        index = CityIndex(path, save_delay=60)
+        index.add("paris-id", "Paris")
+        index.add_search_results("Rome", [{"id": "rome-id", "name": "Rome"}])
+        assert not os.path.exists(path)
+        index.flush()
+        assert {city["id"] for city in CityIndex(path).cities()} == {"paris-id", "rome-id"}
+        index.add("oslo-id", "Oslo")
+        assert CityIndex(path).lookup("oslo") is None
+        index.flush()
+        assert CityIndex(path).lookup("oslo")["id"] == "oslo-id"
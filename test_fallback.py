@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+"""
+Tests for the precomputed fallback recommendations
+"""
+
+import json
+
+from fallback import GENERIC_FALLBACK, fallback_json, fallback_recommendations, fallback_response_body
+
+def test_serialized_fallback_matches_dict():
+    """The spliced JSON decodes to the same payload as the dict form"""
+    location = 'Reykjavík "north"'
+    assert json.loads(fallback_json(location, "GPT API error: boom")) == fallback_recommendations(location, "GPT API error: boom")
+
+def test_response_body_is_complete_json():
+    """The degraded response body carries location, error and the Qloo placeholder"""
+    body = json.loads(fallback_response_body("Lisbon", "Server temporarily unavailable", "2024-01-01T12:00:00"))
+    assert body["gpt_recommendations"]["destination_info"]["name"] == "Lisbon"
+    assert body["gpt_recommendations"]["error"] == "Server temporarily unavailable"
+    assert "error" in body["qloo_recommendations"]["restaurants"]
+
+def test_curated_city_overrides_generic_sections():
+    """Curated cities get their own sections; unknown cities get the generic payload"""
+    tokyo = fallback_recommendations("tokyo, japan", "error")
+    assert tokyo["food_recommendations"] != GENERIC_FALLBACK.sections["food_recommendations"]
+    assert tokyo["hidden_gems"] == GENERIC_FALLBACK.sections["hidden_gems"]
+    assert fallback_recommendations("Nowhere", "error")["food_recommendations"] == GENERIC_FALLBACK.sections["food_recommendations"]
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Tests for validating and repairing GPT's recommendation JSON
+"""
+
+import json
+
+import pytest
+
+from gpt_output import (RECOMMENDATION_SCHEMA, SECTIONS, SYSTEM_PROMPT, parse_json_object, repair_json,
+                        response_format, validate_recommendations)
+
+REPLY = {
+    "destination_info": {"name": "Lisbon", "best_time_to_visit": "Spring", "weather_info": "Mild",
+                         "cultural_highlights": "Fado"},
+    "food_recommendations": [{"name": "Time Out Market", "cuisine": "Portuguese", "description": "Food hall",
+                              "price_range": "$$", "must_try_dishes": ["Bifana"], "location": "Cais do Sodre"}],
+    "experience_recommendations": [{"name": "Tram 28", "category": "Sightseeing", "description": "Old tram",
+                                    "duration": "1 hour", "best_time": "Morning", "tips": "Board early"}],
+    "hidden_gems": [{"name": "LX Factory", "type": "Market", "description": "Old mill", "location": "Alcantara"}],
+    "travel_tips": ["Wear good shoes"],
+}
+
+def test_valid_reply_passes_unchanged():
+    obj, repaired = parse_json_object(json.dumps(REPLY))
+    result, problems = validate_recommendations(obj)
+    assert not repaired
+    assert problems == []
+    assert result == REPLY
+
+def test_fences_prose_and_trailing_commas_are_repaired():
+    content = 'Here you go:\n```json\n{"travel_tips": ["a", "b",], "hidden_gems": [],}\n```'
+    obj, repaired = parse_json_object(content)
+    assert repaired
+    assert obj == {"travel_tips": ["a", "b"], "hidden_gems": []}
+
+def test_truncated_reply_keeps_completed_members():
+    """A reply cut off by max_tokens closes after the last member that finished"""
+    content = json.dumps(REPLY)[:-40]
+    repaired = json.loads(repair_json(content))
+    assert repaired["destination_info"] == REPLY["destination_info"]
+    assert repaired["food_recommendations"] == REPLY["food_recommendations"]
+
+    with pytest.raises(ValueError):
+        repair_json('{"destination_info": {"na')
+
+def test_schema_problems_are_dropped_not_fatal():
+    """Nameless items and wrongly typed fields are dropped; missing sections come back empty"""
+    obj = {
+        "destination_info": {"best_time_to_visit": 2024},
+        "food_recommendations": [{"cuisine": "no name"}, {"name": "Cafe", "must_try_dishes": "Pastel de nata", "extra": 1}],
+    }
+    result, problems = validate_recommendations(obj, location="Lisbon")
+    assert result["destination_info"] == {"best_time_to_visit": "2024", "name": "Lisbon"}
+    assert result["food_recommendations"] == [{"name": "Cafe", "must_try_dishes": ["Pastel de nata"]}]
+    assert result["hidden_gems"] == [] and result["travel_tips"] == []
+    assert "food_recommendations item without a name" in problems
+    assert "hidden_gems missing" in problems
+
+def test_nothing_usable_raises():
+    with pytest.raises(ValueError):
+        validate_recommendations({"destination_info": {"name": "Lisbon"}})
+    with pytest.raises(ValueError):
+        parse_json_object("[1, 2]")
+
+def test_prompt_and_response_schema_cover_every_section():
+    for section in SECTIONS:
+        assert f'"{section}"' in SYSTEM_PROMPT
+    assert RECOMMENDATION_SCHEMA["required"] == list(SECTIONS)
+    assert response_format("json_schema")["json_schema"]["strict"] is True
+    assert response_format("json_object") == {"type": "json_object"}
+    assert response_format("text") is None
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Tests for hedged upstream calls
+"""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from hedging import HedgeCancelled, Hedger
+
+executor = ThreadPoolExecutor(max_workers=8)
+
+TIMEOUT = 5  # the primary request gets all of it, a hedge only what is left
+
+def racing_calls():
+    """fn(timeout, stop) whose primary request hangs until stopped, and whose hedge answers at once
+
+    The primary is told apart by its full timeout: with no hedging delay, the hedge may
+    start running before it.
+    """
+    calls, primary_stopped = [], threading.Event()
+
+    def fn(timeout, stop):
+        calls.append(timeout)
+        if timeout < TIMEOUT:
+            return "hedge"
+        stop.wait(TIMEOUT)
+        primary_stopped.set()
+        raise HedgeCancelled()
+    return fn, calls, primary_stopped
+
+def decision():
+    """can_hedge that allows the hedge and notes that the decision was made, and fn(timeout, stop) answering after it"""
+    decided = threading.Event()
+
+    def can_hedge():
+        decided.set()
+        return True
+
+    def fn(timeout, stop):
+        assert decided.wait(TIMEOUT)
+        return "ok"
+    return can_hedge, fn
+
+def test_fast_call_is_not_hedged():
+    hedger = Hedger(initial_delay=TIMEOUT)
+    calls = []
+    assert hedger.call(lambda timeout, stop: calls.append(timeout) or "ok", TIMEOUT, executor) == "ok"
+    assert calls == [TIMEOUT] and hedger.stats()["hedged"] == 0
+
+def test_slow_call_is_hedged_and_the_loser_stopped():
+    outcomes = []
+    hedger = Hedger(initial_delay=0, on_result=lambda seconds, outcome: outcomes.append(outcome))
+    fn, calls, primary_stopped = racing_calls()
+    assert hedger.call(fn, TIMEOUT, executor) == "hedge"
+    assert primary_stopped.wait(TIMEOUT)
+    assert sorted(calls)[0] < TIMEOUT  # the hedge only gets what is left of the timeout
+    assert outcomes == ["hedge"] and hedger.stats()["hedge_wins"] == 1
+
+def test_hedge_rate_is_capped_by_the_budget():
+    hedger = Hedger(initial_delay=0, max_rate=0.1)
+    for _ in range(20):
+        can_hedge, fn = decision()
+        assert hedger.call(fn, TIMEOUT, executor, can_hedge=can_hedge) == "ok"
+    stats = hedger.stats()
+    # One hedge up front, then one per ten calls
+    assert stats["hedged"] == 3 and stats["skipped"] == 17
+
+def test_primary_error_is_raised_when_both_fail():
+    hedger = Hedger(initial_delay=0)
+    can_hedge, answer = decision()
+    attempts = []
+
+    def fn(timeout, stop):
+        attempts.append(timeout)
+        if timeout < TIMEOUT:
+            raise ValueError("hedge failed")
+        answer(timeout, stop)
+        raise ValueError("primary failed")
+    with pytest.raises(ValueError, match="primary failed"):
+        hedger.call(fn, TIMEOUT, executor, can_hedge=can_hedge)
+    assert len(attempts) == 2
+
+def test_can_hedge_vetoes_a_hedge():
+    hedger = Hedger(initial_delay=0)
+    vetoed = threading.Event()
+    calls = []
+
+    def fn(timeout, stop):
+        calls.append(timeout)
+        assert vetoed.wait(TIMEOUT)
+        return "ok"
+    assert hedger.call(fn, TIMEOUT, executor, can_hedge=lambda: vetoed.set() or False) == "ok"
+    assert calls == [TIMEOUT] and hedger.stats()["skipped"] == 1
+
+def test_delay_follows_the_recent_latency_percentile():
+    hedger = Hedger(percentile=90, min_delay=0.0, min_samples=10)
+    assert hedger.delay() == hedger.initial_delay
+    for i in range(100):
+        hedger.record(i / 100)
+    assert hedger.delay() == pytest.approx(0.9)
+
+def test_async_hedge_cancels_the_losing_task():
+    hedger = Hedger(initial_delay=0)
+    cancelled = []
+
+    async def fn(timeout):
+        if timeout < TIMEOUT:
+            return "hedge"
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def run():
+        result = await hedger.call_async(fn, TIMEOUT)
+        await asyncio.sleep(0)
+        return result
+    assert asyncio.run(run()) == "hedge"
+    assert cancelled == [True]
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Tests for the in-process metrics and upstream health tracking
+"""
+
+import pytest
+
+from metrics import Counter, Gauge, Histogram, Registry, UpstreamHealth
+
+def test_counter_renders_per_label_set():
+    """Each label combination is its own sample in the exposition text"""
+    registry = Registry()
+    retries = registry.counter("retries_total", "Retries", ["upstream"])
+    retries.inc(upstream="gpt")
+    retries.inc(2, upstream="qloo")
+
+    text = registry.render()
+    assert "# TYPE retries_total counter" in text
+    assert 'retries_total{upstream="gpt"} 1' in text
+    assert 'retries_total{upstream="qloo"} 2' in text
+    assert retries.value(upstream="qloo") == 2
+
+def test_counter_rejects_wrong_labels():
+    """A typo in a label name fails loudly instead of silently creating a new series"""
+    retries = Counter("retries_total", "Retries", ["upstream"])
+    with pytest.raises(ValueError):
+        retries.inc(upstrem="gpt")
+
+def test_histogram_buckets_are_cumulative():
+    """Observations land in the first bucket that holds them and count towards every larger one"""
+    latency = Histogram("stage_seconds", "Stage latency", ["stage"], buckets=(0.1, 1.0))
+    latency.observe(0.05, stage="gpt")
+    latency.observe(0.5, stage="gpt")
+    latency.observe(5.0, stage="gpt")
+
+    snapshot = latency.snapshot(stage="gpt")
+    assert snapshot["count"] == 3
+    assert snapshot["sum"] == pytest.approx(5.55)
+    assert snapshot["buckets"] == {0.1: 1, 1.0: 2, float("inf"): 3}
+
+    text = "\n".join(latency.render())
+    assert 'stage_seconds_bucket{stage="gpt",le="+Inf"} 3' in text
+    assert 'stage_seconds_count{stage="gpt"} 3' in text
+
+def test_histogram_time_records_even_on_error():
+    """A stage that raises still shows up in the timings"""
+    latency = Histogram("stage_seconds", "Stage latency", ["stage"])
+    with pytest.raises(RuntimeError):
+        with latency.time(stage="qloo_search"):
+            raise RuntimeError("boom")
+    assert latency.snapshot(stage="qloo_search")["count"] == 1
+
+def test_collectors_are_sampled_at_render_time():
+    """Collector gauges reflect live state on every scrape"""
+    registry = Registry()
+    state = {"in_flight": 3}
+
+    def collect():
+        gauge = Gauge("pool_in_flight", "In flight")
+        gauge.set(state["in_flight"])
+        return [gauge]
+
+    registry.add_collector(collect)
+    assert "pool_in_flight 3" in registry.render()
+    state["in_flight"] = 0
+    assert "pool_in_flight 0" in registry.render()
+
+def test_upstream_health_status_transitions():
+    """Unknown until called, degraded after a failure, down after several, ok after a success"""
+    health = UpstreamHealth(["gpt"])
+    assert health.status()["gpt"]["status"] == "unknown"
+
+    health.failure("gpt", "timeout")
+    assert health.status()["gpt"]["status"] == "degraded"
+    for _ in range(UpstreamHealth.DOWN_AFTER):
+        health.failure("gpt", "timeout")
+    assert health.status()["gpt"]["status"] == "down"
+    assert health.status()["gpt"]["last_error"] == "timeout"
+
+    health.success("gpt")
+    assert health.status()["gpt"]["status"] == "ok"
+    assert health.status()["gpt"]["consecutive_failures"] == 0
+
+def test_gauge_track_counts_work_in_progress():
+    """An in-flight gauge goes back down however the tracked call ends"""
+    in_flight = Gauge("upstream_in_flight", "In flight", ["upstream"])
+    with in_flight.track(upstream="qloo"):
+        assert in_flight.value(upstream="qloo") == 1
+    with pytest.raises(TimeoutError):
+        with in_flight.track(upstream="qloo"):
+            raise TimeoutError()
+    assert in_flight.value(upstream="qloo") == 0
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Tests for the pooled Qloo client
+"""
+
+import threading
+
+from benchmarks.fake_upstreams import FakeUpstreamServer
+from qloo_client import PoolTracker, QlooClient
+
+def test_requests_reuse_one_keep_alive_connection():
+    server = FakeUpstreamServer(0).start()
+    try:
+        client = QlooClient("key", server.base_url, pool_size=4)
+        for _ in range(3):
+            assert client.search("Tokyo")["results"][0]["name"] == "Tokyo"
+        stats = client.pool_stats()
+        assert stats["requests"] == 3 and stats["in_flight"] == 0 and stats["in_flight_ratio"] == 0.0
+        assert stats["connections_opened"] == 1 and stats["connections_idle"] == 1
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_tracker_counts_requests_in_flight_against_the_pool_size():
+    tracker = PoolTracker(4)
+    inside, leave = threading.Event(), threading.Event()
+
+    def request():
+        with tracker.track():
+            inside.set()
+            leave.wait(5)
+
+    thread = threading.Thread(target=request)
+    thread.start()
+    assert inside.wait(5)
+    assert tracker.stats()["in_flight"] == 1 and tracker.stats()["in_flight_ratio"] == 0.25
+    leave.set()
+    thread.join()
+    stats = tracker.stats()
+    assert stats["in_flight"] == 0 and stats["peak_in_flight"] == 1 and stats["requests"] == 1
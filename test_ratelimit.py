@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Tests for the shared upstream rate limiter and request admission control
+"""
+
+import asyncio
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from ratelimit import AdmissionController, MemoryBucketStore, RateLimiter, SQLiteBucketStore
+from resilience import CircuitBreaker, CircuitOpenError, RateLimitExceeded
+
+def test_burst_then_calls_are_spaced_at_the_rate():
+    limiter = RateLimiter("Qloo", rate=20, burst=3, max_wait=1)
+    assert [limiter.acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    started = time.monotonic()
+    limiter.acquire()
+    limiter.acquire()
+    assert 0.08 <= time.monotonic() - started < 0.3
+    assert limiter.stats()["delayed_calls"] == 2
+
+def test_fails_fast_when_the_wait_would_be_too_long():
+    """An empty bucket with a long queue falls back at once instead of sleeping"""
+    limiter = RateLimiter("OpenAI", rate=1, burst=1, max_wait=0.5)
+    limiter.acquire()
+    started = time.monotonic()
+    with pytest.raises(RateLimitExceeded) as raised:
+        limiter.acquire()
+    assert time.monotonic() - started < 0.05
+    # Callers already fall back on CircuitOpenError
+    assert isinstance(raised.value, CircuitOpenError)
+    assert limiter.stats()["rejected_calls"] == 1
+
+def test_sqlite_buckets_are_shared_between_stores(tmp_path):
+    """Two workers (two stores on one file) draw from the same bucket"""
+    path = str(tmp_path / "buckets.sqlite3")
+    first = RateLimiter("Qloo", rate=0.5, burst=2, store=SQLiteBucketStore(path), max_wait=0)
+    second = RateLimiter("Qloo", rate=0.5, burst=2, store=SQLiteBucketStore(path), max_wait=0)
+    first.acquire()
+    second.acquire()
+    with pytest.raises(RateLimitExceeded):
+        first.acquire()
+    assert second.available() < 1
+
+def test_disabled_limiter_never_waits():
+    limiter = RateLimiter("Qloo", rate=0, burst=1, store=MemoryBucketStore())
+    assert all(limiter.acquire() == 0.0 for _ in range(100))
+
+def test_async_acquire_waits_for_its_reserved_token():
+    limiter = RateLimiter("OpenAI", rate=20, burst=1, max_wait=1)
+
+    async def run():
+        return await asyncio.gather(*(limiter.acquire_async() for _ in range(3)))
+    waits = asyncio.run(run())
+    assert waits[0] == 0.0 and 0 < waits[1] < waits[2] <= 0.11
+
+def test_async_acquire_waits_for_the_shared_store_off_the_event_loop(tmp_path):
+    """Another worker holding the bucket file's write lock mustn't stall every coroutine"""
+    path = str(tmp_path / "buckets.sqlite3")
+    limiter = RateLimiter("Qloo", rate=10, burst=5, store=SQLiteBucketStore(path))
+    other_worker = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    other_worker.execute("BEGIN IMMEDIATE")
+    threading.Timer(0.3, other_worker.execute, ["COMMIT"]).start()
+
+    async def run():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.ensure_future(tick())
+        assert await limiter.acquire_async() == 0.0
+        ticker.cancel()
+        return ticks
+    assert asyncio.run(run()) >= 10
+    other_worker.close()
+
+def test_rate_limited_calls_do_not_count_against_the_circuit():
+    breaker = CircuitBreaker("Qloo", failure_threshold=1)
+    breaker.record(RateLimitExceeded("Qloo", 1))
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.stats()["consecutive_failures"] == 0
+
+def test_admission_queues_briefly_then_turns_requests_away():
+    admission = AdmissionController(max_active=1, max_queue=1, queue_timeout=0.5)
+    assert admission.acquire()
+    threading.Timer(0.05, admission.release).start()
+    assert admission.acquire()  # queued until the first request finished
+
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(admission.acquire()))
+    waiter.start()
+    time.sleep(0.05)
+    assert admission.stats()["queued"] == 1
+    assert not admission.acquire()  # the queue is full - fall back straight away
+    waiter.join()
+    assert results == [False]  # nobody released in time
+    assert admission.stats()["rejected"] == 2
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Tests for the recommendations fan-out: GPT and Qloo in parallel, within the request deadline
+"""
+
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+
+import pytest
+
+# The app reads its settings at import: keep it off shared files and real upstreams
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("CITY_INDEX_PATH", os.path.join(tempfile.mkdtemp(), "city_index.json"))
+os.environ.setdefault("RATE_LIMIT_PATH", "")
+os.environ.setdefault("SNAPSHOT_PATH", "")
+os.environ.setdefault("CACHE_BACKEND", "memory")
+
+import app
+from city_index import CityIndex
+
+GPT_RESULT = {"destination_info": {"best_time_to_visit": "Spring"}, "travel_tips": ["Buy a transit pass"]}
+CITY = {"id": "city-1", "name": "Tokyo"}
+
+@pytest.fixture
+def upstreams(monkeypatch):
+    """Stubbed recommender calls; a test swaps in its own gpt/category functions"""
+    release = threading.Event()  # unblocks any call a test left hanging
+    stubs = {
+        "gpt": lambda location, preferences, duration, deadline: GPT_RESULT,
+        "category": lambda location, city, category, deadline: {"results": [f"{category} in {city['name']}"]},
+        "release": release,
+    }
+    monkeypatch.setattr(app.recommender, "get_gpt_recommendations", lambda *args: stubs["gpt"](*args))
+    monkeypatch.setattr(app.recommender, "get_cached_qloo_recommendations", lambda location, category: None)
+    monkeypatch.setattr(app.recommender, "resolve_qloo_city", lambda location, deadline: (CITY, None))
+    monkeypatch.setattr(app.recommender, "get_qloo_category", lambda *args: stubs["category"](*args))
+    yield stubs
+    release.set()
+
+def test_gpt_and_qloo_results_are_merged(upstreams):
+    combined = app.fetch_recommendations("Tokyo", "food", "Short trip (4-7 days)", ["restaurants", "hotels"])
+    assert combined["gpt_recommendations"] == GPT_RESULT
+    assert combined["qloo_recommendations"] == {"restaurants": {"results": ["restaurants in Tokyo"]},
+                                                "hotels": {"results": ["hotels in Tokyo"]}}
+    assert not app.is_degraded(combined) and "generated_at" in combined
+
+def test_gpt_and_qloo_run_at_the_same_time(upstreams):
+    """Each stub waits for the other to start, which only finishes if both are in flight together"""
+    gpt_started, qloo_started = threading.Event(), threading.Event()
+
+    def gpt(*args):
+        gpt_started.set()
+        assert qloo_started.wait(5)
+        return GPT_RESULT
+
+    def category(location, city, category, deadline):
+        qloo_started.set()
+        assert gpt_started.wait(5)
+        return {"results": [category]}
+
+    upstreams.update(gpt=gpt, category=category)
+    combined = app.fetch_recommendations("Tokyo", "", "", ["restaurants"])
+    assert combined["gpt_recommendations"] == GPT_RESULT
+    assert combined["qloo_recommendations"]["restaurants"] == {"results": ["restaurants"]}
+
+def test_slow_gpt_times_out_to_the_fallback(upstreams, monkeypatch):
+    monkeypatch.setattr(app, "GPT_TIMEOUT", 0.2)
+    upstreams["gpt"] = lambda *args: upstreams["release"].wait(10) and GPT_RESULT
+    combined = app.fetch_recommendations("Tokyo", "", "", ["restaurants"])
+    assert "AI recommendations temporarily unavailable" in combined["gpt_recommendations"]["error"]
+    # Qloo answered, so its part is kept
+    assert combined["qloo_recommendations"]["restaurants"] == {"results": ["restaurants in Tokyo"]}
+
+def test_slow_qloo_category_times_out_alone(upstreams, monkeypatch):
+    monkeypatch.setattr(app, "QLOO_CATEGORY_TIMEOUT", 0.2)
+
+    def category(location, city, category, deadline):
+        if category == "hotels":
+            upstreams["release"].wait(10)
+        return {"results": [category]}
+
+    upstreams["category"] = category
+    combined = app.fetch_recommendations("Tokyo", "", "", ["restaurants", "hotels"])
+    assert combined["gpt_recommendations"] == GPT_RESULT
+    assert combined["qloo_recommendations"]["restaurants"] == {"results": ["restaurants"]}
+    assert combined["qloo_recommendations"]["hotels"] == app.qloo_unavailable("hotels")
+
+def test_upstream_error_becomes_a_fallback(upstreams):
+    def gpt(*args):
+        raise RuntimeError("boom")
+
+    upstreams["gpt"] = gpt
+    combined = app.fetch_recommendations("Tokyo", "", "", ["restaurants"])
+    assert combined["gpt_recommendations"]["error"] == "GPT API error: boom"
+    assert app.is_degraded(combined)
+
+def test_wait_for_upstream_outcomes():
+    done = Future()
+    done.set_result("ok")
+    assert app.wait_for_upstream(done, time.monotonic() + 1) == ("ok", None, False)
+    failed = Future()
+    failed.set_exception(ValueError("bad"))
+    assert app.wait_for_upstream(failed, time.monotonic() + 1) == (None, "bad", False)
+    # Past its deadline a pending call is abandoned (and cancelled, since it never started)
+    pending = Future()
+    assert app.wait_for_upstream(pending, time.monotonic() - 1) == (None, None, True)
+    assert pending.cancelled()
+
+@pytest.mark.parametrize("body, error", [
+    ({"location": "Tokyo", "duration": 5}, "'duration' must be a string"),
+    ({"location": "Tokyo", "preferences": ["food", "art"]}, "'preferences' must be a string"),
+    ({"location": ["Tokyo"]}, "'location' must be a string"),
+    ([1], "Request body must be a JSON object"),
+])
+def test_malformed_fields_are_a_400(body, error):
+    client = app.app.test_client()
+    for path in ("/api/recommendations", "/api/recommendations/stream"):
+        response = client.post(path, json=body)
+        assert response.status_code == 400 and response.get_json() == {"error": error}
+
+def test_plan_batch_dedupes_and_groups(monkeypatch):
+    monkeypatch.setattr(app, "BATCH_GPT_MAX_TOKENS", 2 * app.GPT_TOKENS_PER_TRIP)  # two trips per completion
+    items = [
+        {"location": "Tokyo", "preferences": "food"},
+        {"location": " tokyo ", "preferences": "food"},  # the same trip
+        {"location": "Tokyo", "preferences": "art"},  # the same city, another trip
+        {"location": "Kyoto"},
+        {"location": "Osaka"},
+        {"location": ""},
+        {"location": "Nara", "duration": 5},
+        [1],
+    ]
+    qloo_locations, gpt_groups, item_refs = app.plan_batch(items)
+    assert qloo_locations == ["Tokyo", "Kyoto", "Osaka"]
+    assert gpt_groups == [[("Tokyo", "food", ""), ("Tokyo", "art", "")], [("Kyoto", "", ""), ("Osaka", "", "")]]
+    assert item_refs == [
+        (0, (0, 0)), (0, (0, 0)), (0, (0, 1)), (1, (1, 0)), (2, (1, 1)),
+        {"error": "Location is required"},
+        {"error": "'duration' must be a string"},
+        {"error": "Each item must be a JSON object"},
+    ]
+
+def test_run_bounded_limits_calls_in_flight():
+    """Each call waits for a partner: with a limit of 2 they run in pairs, never three at once"""
+    pair = threading.Barrier(2, timeout=5)
+    lock = threading.Lock()
+    in_flight = [0, 0]  # current, most seen
+
+    def call(n):
+        with lock:
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight)
+        pair.wait()
+        with lock:
+            in_flight[0] -= 1
+        if n == 3:
+            raise ValueError("bad")
+        return n
+
+    outcomes = app.run_bounded([(call, n) for n in range(4)], 2, time.monotonic() + 10)
+    assert outcomes == [(0, None, False), (1, None, False), (2, None, False), (None, "bad", False)]
+    assert in_flight[1] == 2
+
+def test_run_bounded_reports_unfinished_calls_as_timed_out():
+    calls = []
+    outcomes = app.run_bounded([(calls.append, n) for n in range(3)], 1, time.monotonic() - 1)
+    assert outcomes == [(None, None, True)] * 3
+    assert len(calls) <= 1  # nothing is started past the deadline
+
+@pytest.fixture
+def batch_upstreams(monkeypatch):
+    monkeypatch.setattr(app.recommender, "get_gpt_recommendations_multi",
+                        lambda trips, deadline: [dict(GPT_RESULT, trip=list(trip)) for trip in trips])
+    monkeypatch.setattr(app.recommender, "get_qloo_recommendations",
+                        lambda location, category, deadline: {"results": [f"{category} in {location}"]})
+
+def test_bad_batch_item_fails_alone(batch_upstreams):
+    items = [{"location": "Nara", "duration": 5}, {"location": "Kyoto", "duration": "Weekend"}, "Osaka"]
+    response = app.app.test_client().post("/api/recommendations/batch", json={"items": items})
+    assert response.status_code == 200
+    results = response.get_json()["results"]
+    assert results[0] == {"error": "'duration' must be a string"}
+    assert results[1]["location"] == "Kyoto"
+    assert results[1]["gpt_recommendations"] == dict(GPT_RESULT, trip=["Kyoto", "", "Weekend"])
+    assert results[1]["qloo_recommendations"] == {"restaurants": {"results": ["restaurants in Kyoto"]}}
+    assert results[2] == {"error": "Each item must be a JSON object"}
+
+@pytest.mark.parametrize("body, error", [
+    ([1], "Request body must be a JSON object"),
+    ({"items": []}, "'items' must be a non-empty list of {location, preferences, duration}"),
+])
+def test_bad_batch_body_is_a_400(body, error):
+    response = app.app.test_client().post("/api/recommendations/batch", json=body)
+    assert response.status_code == 400 and response.get_json() == {"error": error}
+
+@pytest.mark.parametrize("value, expected", [
+    (None, (["restaurants"], None)),
+    ("", (["restaurants"], None)),
+    ("hotels, Bars", (["hotels", "bars"], None)),
+    (["Hotels", "hotels ", "museums", " "], (["hotels", "museums"], None)),
+    ([" ", ""], (["restaurants"], None)),
+    (3, (None, "'categories' must be a list of Qloo categories")),
+])
+def test_parse_categories(value, expected):
+    assert app.parse_categories(value) == expected
+
+def test_parse_categories_names_the_unknown_ones():
+    categories, error = app.parse_categories(["hotels", "casinos", "zoos"])
+    assert categories is None and error.startswith("Unknown categories: casinos, zoos. Available: ")
+
+def test_city_is_resolved_once_for_all_categories(upstreams, monkeypatch):
+    resolved = []
+    monkeypatch.setattr(app.recommender, "resolve_qloo_city", lambda location, deadline: resolved.append(location) or (CITY, None))
+    cached = {"hotels": {"results": ["cached hotel"]}}
+    monkeypatch.setattr(app.recommender, "get_cached_qloo_recommendations", lambda location, category: cached.get(category))
+    outcomes = app.fetch_qloo_categories("Tokyo", ["restaurants", "hotels", "bars"], time.monotonic() + 5)
+    assert list(outcomes) == ["restaurants", "hotels", "bars"]
+    assert outcomes["hotels"] == ({"results": ["cached hotel"]}, None, False)
+    assert outcomes["bars"] == ({"results": ["bars in Tokyo"]}, None, False)
+    assert resolved == ["Tokyo"]
+
+    # Nothing to fetch, nothing to resolve
+    assert app.fetch_qloo_categories("Tokyo", ["hotels"], time.monotonic() + 5) == {"hotels": (cached["hotels"], None, False)}
+    assert resolved == ["Tokyo"]
+
+def test_failing_category_fails_alone(upstreams):
+    def category(location, city, category, deadline):
+        if category == "bars":
+            raise RuntimeError("boom")
+        return {"results": [category]}
+
+    upstreams["category"] = category
+    outcomes = app.fetch_qloo_categories("Tokyo", ["restaurants", "bars"], time.monotonic() + 5)
+    assert outcomes == {"restaurants": ({"results": ["restaurants"]}, None, False), "bars": (None, "boom", False)}
+    combined = app.combine_recommendations("Tokyo", (GPT_RESULT, None, False), outcomes)
+    assert combined["qloo_recommendations"] == {"restaurants": {"results": ["restaurants"]},
+                                                "bars": {"error": "Qloo API error: boom"}}
+
+def test_unresolved_city_answers_every_category(upstreams, monkeypatch):
+    not_found = {"error": "City 'Atlantis' not found"}
+    monkeypatch.setattr(app.recommender, "resolve_qloo_city", lambda location, deadline: (None, not_found))
+    outcomes = app.fetch_qloo_categories("Atlantis", ["restaurants", "hotels"], time.monotonic() + 5)
+    assert outcomes == {"restaurants": (not_found, None, False), "hotels": (not_found, None, False)}
+
+class FakeSearch:
+    """Qloo client stand-in answering /search from a dict of query -> results"""
+
+    def __init__(self, answers):
+        self.answers = answers
+        self.queries = []
+
+    def search(self, query, entity_type, timeout=None):
+        self.queries.append(query)
+        return {"results": self.answers.get(query, [])}
+
+def test_city_near_a_known_one_is_resolved_by_qloo():
+    index = CityIndex()
+    index.add("limassol-id", "Limassol")
+    qloo = FakeSearch({"Lima": [{"id": "lima-id", "name": "Lima"}]})
+    recommender = app.TravelRecommender(qloo, city_index=index)
+    assert recommender.resolve_qloo_city("Lima", time.monotonic() + 5) == ({"id": "lima-id", "name": "Lima"}, None)
+    assert qloo.queries == ["Lima"]
+
+    city, error = recommender.resolve_qloo_city("Limasol", time.monotonic() + 5)
+    assert city is None and error["suggestion"] == "Limassol" and "Did you mean 'Limassol'?" in error["error"]
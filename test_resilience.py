@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Tests for the upstream retry policy and circuit breaker
+"""
+
+import asyncio
+import time
+
+import pytest
+import requests
+
+from resilience import CircuitBreaker, CircuitOpenError, DeadlineExceeded, RetryPolicy
+
+def http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return requests.exceptions.HTTPError(f"{status} error", response=response)
+
+def failing(errors, result="ok"):
+    """fn(timeout) raising each of errors in turn, then returning result"""
+    calls = []
+
+    def fn(timeout):
+        calls.append(timeout)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return result
+    return fn, calls
+
+FAST = RetryPolicy(max_attempts=3, base_delay=0.001, max_delay=0.01, min_attempt_time=0.05)
+
+def test_retries_transient_errors_then_succeeds():
+    """Timeouts and 503s are retried until an attempt succeeds"""
+    fn, calls = failing([requests.exceptions.Timeout(), http_error(503)])
+    assert FAST.call(fn, 5) == "ok"
+    assert len(calls) == 3
+
+def test_retries_openai_connection_errors():
+    """OpenAI's connection errors and timeouts are transient too"""
+    import httpx
+    import openai
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    fn, calls = failing([openai.APIConnectionError(request=request), openai.APITimeoutError(request)])
+    assert FAST.call(fn, 5) == "ok"
+    assert len(calls) == 3
+
+def test_does_not_retry_auth_or_bad_request_errors():
+    """A 401 or 400 fails the same way every time - give up straight away"""
+    for status in (401, 400):
+        fn, calls = failing([http_error(status)])
+        with pytest.raises(requests.exceptions.HTTPError):
+            FAST.call(fn, 5)
+        assert len(calls) == 1
+
+def test_gives_up_after_max_attempts():
+    fn, calls = failing([http_error(502)] * 5)
+    with pytest.raises(requests.exceptions.HTTPError):
+        FAST.call(fn, 5)
+    assert len(calls) == 3
+
+def test_retry_on_adds_exception_types():
+    """Callers can opt into retrying errors that aren't upstream failures (e.g. unparseable JSON)"""
+    fn, calls = failing([ValueError("bad json")])
+    assert FAST.call(fn, 5, retry_on=(ValueError,)) == "ok"
+    assert len(calls) == 2
+
+def test_attempt_timeout_is_capped_to_the_deadline():
+    fn, calls = failing([])
+    FAST.call(fn, 15, deadline=time.monotonic() + 2)
+    assert calls[0] <= 2
+
+def test_no_attempt_starts_without_time_to_finish():
+    """Past (or too close to) the deadline, neither a first attempt nor a retry is made"""
+    fn, calls = failing([])
+    with pytest.raises(DeadlineExceeded):
+        FAST.call(fn, 5, deadline=time.monotonic() + 0.01)
+    assert calls == []
+
+    policy = RetryPolicy(max_attempts=3, base_delay=0.001, max_delay=0.01, min_attempt_time=0.2)
+    calls = []
+
+    def slow_timeout(timeout):
+        calls.append(timeout)
+        time.sleep(0.15)
+        raise requests.exceptions.Timeout()
+
+    # The first attempt fits, but after it only ~0.15s would be left for a retry
+    with pytest.raises(requests.exceptions.Timeout):
+        policy.call(slow_timeout, 5, deadline=time.monotonic() + 0.3)
+    assert len(calls) == 1
+
+def test_backoff_grows_and_is_capped():
+    policy = RetryPolicy(base_delay=0.25, max_delay=1.0)
+    for _ in range(50):
+        assert 0 <= policy.backoff(1) <= 0.25
+        assert 0 <= policy.backoff(10) <= 1.0
+
+def test_circuit_opens_after_consecutive_failures_and_fails_fast():
+    breaker = CircuitBreaker("Qloo", failure_threshold=2, reset_timeout=60)
+    for _ in range(2):
+        fn, _ = failing([http_error(500)] * 3)
+        with pytest.raises(requests.exceptions.HTTPError):
+            RetryPolicy(max_attempts=1).call(fn, 5, breaker=breaker)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    fn, calls = failing([])
+    with pytest.raises(CircuitOpenError):
+        FAST.call(fn, 5, breaker=breaker)
+    assert calls == []
+    assert breaker.stats()["rejected_calls"] == 1
+
+def test_request_errors_do_not_open_the_circuit():
+    """A 404 for one bad request says nothing about the upstream being down"""
+    breaker = CircuitBreaker("Qloo", failure_threshold=1)
+    fn, _ = failing([http_error(404)])
+    with pytest.raises(requests.exceptions.HTTPError):
+        FAST.call(fn, 5, breaker=breaker)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+def test_half_open_probe_closes_or_reopens_the_circuit():
+    breaker = CircuitBreaker("OpenAI", failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+
+    breaker.check()  # the probe is let through...
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.check()  # ...but nobody else while it is in flight
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    time.sleep(0.06)
+    breaker.check()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+def test_call_async_retries_without_blocking():
+    attempts = []
+
+    async def fn(timeout):
+        attempts.append(timeout)
+        if len(attempts) < 2:
+            raise requests.exceptions.ConnectionError()
+        return "ok"
+
+    assert asyncio.run(FAST.call_async(fn, 5)) == "ok"
+    assert len(attempts) == 2
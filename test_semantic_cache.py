@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Tests for the semantic (preference-similarity) GPT cache
+"""
+
+import time
+
+from semantic_cache import SemanticCache, create_semantic_cache_from_env, embed, terms
+
+def test_reworded_preferences_hit():
+    """Same interests in other words are served from the earlier result"""
+    cache = SemanticCache(threshold=0.85)
+    cache.set("Lisbon", "I love street food and history", "3 days", {"tips": "lisbon"})
+    assert cache.get("lisbon ", "street food, historical sites", "3 Days") == {"tips": "lisbon"}
+    assert cache.stats()["hits"] == 1
+
+def test_different_preferences_location_or_duration_miss():
+    cache = SemanticCache(threshold=0.85)
+    cache.set("Lisbon", "street food", "3 days", {"tips": "food"})
+    assert cache.get("Lisbon", "museums and art galleries", "3 days") is None
+    assert cache.get("Lisbon", "street food and nightlife", "3 days") is None
+    assert cache.get("Porto", "street food", "3 days") is None
+    assert cache.get("Lisbon", "street food", "1 week") is None
+
+def test_dietary_or_negation_difference_misses():
+    """Close wording is no hit when the earlier request didn't ask for everything this one does"""
+    cache = SemanticCache(threshold=0.85)
+    cache.set("Lisbon", "street food, markets, museums, art, wine bars", "3 days", {"tips": "any food"})
+    assert cache.get("Lisbon", "vegetarian street food, markets, museums, art, wine bars", "3 days") is None
+
+    cache.set("Lisbon", "museums and galleries, no nightlife", "3 days", {"tips": "quiet"})
+    assert cache.get("Lisbon", "nightlife and galleries, no museums", "3 days") is None
+    assert cache.get("Lisbon", "nightlife, don't want museums or galleries", "3 days") is None
+    assert cache.get("Lisbon", "galleries and museums, without nightlife", "3 days") == {"tips": "quiet"}
+    assert terms("museums, not nightlife") == ["museum", "!nightlife"]
+
+def test_empty_preferences_are_not_matched():
+    """With nothing to compare, leave it to the exact-key cache"""
+    cache = SemanticCache()
+    cache.set("Lisbon", "", "3 days", {"tips": "any"})
+    assert not embed("").any()
+    assert cache.get("Lisbon", "", "3 days") is None
+    assert cache.stats()["entries"] == 0
+
+def test_entries_expire_by_age():
+    cache = SemanticCache(ttl=0.05)
+    cache.set("Lisbon", "street food", "3 days", {"tips": "food"})
+    time.sleep(0.06)
+    assert cache.get("Lisbon", "street food", "3 days") is None
+
+def test_size_limits_evict_oldest_entries_and_locations():
+    cache = SemanticCache(max_entries=3, max_per_location=2)
+    for prefs in ("street food", "museums", "nightlife"):
+        cache.set("Lisbon", prefs, "3 days", {"prefs": prefs})
+    assert cache.get("Lisbon", "street food", "3 days") is None  # replaced by the newest
+    assert cache.get("Lisbon", "nightlife", "3 days") == {"prefs": "nightlife"}
+
+    cache.set("Porto", "wine", "3 days", {"prefs": "wine"})
+    cache.set("Rome", "history", "3 days", {"prefs": "history"})
+    assert cache.get("Lisbon", "nightlife", "3 days") is None  # least recently used location
+    assert cache.get("Rome", "history", "3 days") == {"prefs": "history"}
+    assert cache.stats()["entries"] <= 3
+
+def test_near_duplicates_replace_rather_than_accumulate():
+    cache = SemanticCache()
+    cache.set("Lisbon", "street food", "3 days", {"v": 1})
+    cache.set("Lisbon", "Street food!", "3 days", {"v": 2})
+    assert cache.stats()["entries"] == 1
+    assert cache.get("Lisbon", "street food", "3 days") == {"v": 2}
+
+def test_disabled_unless_configured(monkeypatch):
+    monkeypatch.delenv("SEMANTIC_CACHE", raising=False)
+    assert create_semantic_cache_from_env() is None
+    monkeypatch.setenv("SEMANTIC_CACHE", "true")
+    assert isinstance(create_semantic_cache_from_env(), SemanticCache)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Tests for serialized, compressed and ETagged JSON response bodies
+"""
+
+import gzip
+import json
+import time
+
+from serialization import BodyCache, EncodedBody, JSONBody, choose_encoding, dumps, etag_matches
+
+PAYLOAD = {
+    "gpt_recommendations": {"travel_tips": ["Buy a transit pass"] * 40, "name": "São Paulo"},
+    "qloo_recommendations": {"restaurants": {"results": {"entities": [{"name": "Café"}] * 20}}},
+    "generated_at": "2025-01-01T10:00:00",
+}
+
+def test_body_round_trips_with_timestamp_outside_the_etag():
+    body = JSONBody.build(PAYLOAD)
+    assert json.loads(body.body) == PAYLOAD
+    later = JSONBody.build(dict(PAYLOAD, generated_at="2025-01-01T11:00:00"))
+    assert later.etag == body.etag and later.body != body.body
+    changed = JSONBody.build(dict(PAYLOAD, gpt_recommendations={"travel_tips": []}))
+    assert changed.etag != body.etag
+    assert body.etag.startswith('W/"')
+
+def test_dumps_is_compact_utf8():
+    assert dumps({"name": "São Paulo", "n": [1, 2]}) == '{"name":"São Paulo","n":[1,2]}'.encode()
+
+def test_encoding_negotiation():
+    assert choose_encoding("gzip, deflate, br", 5000) in ("gzip", "br")
+    assert choose_encoding("gzip;q=0, identity", 5000) == "identity"
+    assert choose_encoding("*", 5000) in ("gzip", "br")
+    assert choose_encoding(None, 5000) == "identity"
+    assert choose_encoding("gzip", 100) == "identity"  # not worth compressing
+
+def test_gzip_encoding_is_built_once_and_decompresses():
+    body = JSONBody.build(PAYLOAD)
+    not_modified, encoding, data = body.negotiate("gzip")
+    assert not not_modified and encoding == "gzip"
+    assert len(data) < len(body.body) and gzip.decompress(data) == body.body
+    assert body.negotiate("gzip")[2] is data
+
+def test_if_none_match_gives_not_modified():
+    body = JSONBody.build(PAYLOAD)
+    assert body.negotiate("gzip", body.etag) == (True, "identity", b"")
+    assert etag_matches('"other", ' + body.etag[2:], body.etag)  # weak comparison
+    assert etag_matches("*", body.etag)
+    assert not etag_matches('W/"other"', body.etag)
+
+def test_encoded_body_serves_any_bytes():
+    """The ETag and encoding machinery doesn't care what the bytes are"""
+    body = EncodedBody(b"body { margin: 0; }\n" * 100, '"css-v1"', encoded={"gzip": b"precompressed"})
+    assert body.negotiate("gzip") == (False, "gzip", b"precompressed")
+    assert body.negotiate("identity")[2] is body.body
+    assert body.negotiate(None, '"css-v1"')[0]
+
+def test_body_cache_expires_and_evicts():
+    cache = BodyCache(ttl=0.05, max_entries=2)
+    for key in ("a", "b", "c"):
+        cache.set(key, JSONBody.build({"key": key}))
+    assert cache.get("a") is None
+    assert json.loads(cache.get("c").body) == {"key": "c"}
+    time.sleep(0.06)
+    assert cache.get("c") is None
+    assert cache.stats()["hits"] == 1
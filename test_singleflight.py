@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Tests for single-flight request coalescing
+"""
+
+import asyncio
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# The app reads its settings at import: keep it off shared files and real upstreams
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("CITY_INDEX_PATH", os.path.join(tempfile.mkdtemp(), "city_index.json"))
+os.environ.setdefault("RATE_LIMIT_PATH", "")
+os.environ.setdefault("SNAPSHOT_PATH", "")
+os.environ.setdefault("CACHE_BACKEND", "memory")
+
+import app
+from cache import MemoryCache, ResponseCache, SQLiteCache
+from singleflight import AsyncSingleFlight, SingleFlight
+
+def test_concurrent_calls_share_one_execution():
+    """Identical concurrent calls run the function once and all get its result"""
+    flight = SingleFlight()
+    calls = []
+    started = threading.Event()
+
+    def fetch():
+        calls.append(1)
+        started.set()
+        time.sleep(0.2)
+        return {"name": "Tokyo"}
+
+    with ThreadPoolExecutor(8) as executor:
+        leader = executor.submit(flight.do, "gpt:tokyo", fetch)
+        started.wait()
+        followers = [executor.submit(flight.do, "gpt:tokyo", fetch) for _ in range(7)]
+        results = [leader.result()] + [f.result() for f in followers]
+
+    assert len(calls) == 1
+    assert all(result == {"name": "Tokyo"} for result in results)
+    assert flight.stats()["coalesced"] == 7
+
+def test_async_waiters_share_one_task():
+    """Concurrent coroutines for the same key await a single upstream task"""
+    flight = AsyncSingleFlight()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "ok"
+
+    async def main():
+        return await asyncio.gather(*(flight.do("qloo:paris", fetch) for _ in range(5)))
+
+    assert asyncio.run(main()) == ["ok"] * 5
+    assert len(calls) == 1
+
+def test_async_caller_after_the_last_waiter_left_starts_a_new_call():
+    """An abandoned call is forgotten at once, not when its cancellation finally lands"""
+    flight = AsyncSingleFlight()
+    calls = []
+
+    async def main():
+        wound_down = asyncio.Event()
+
+        async def fetch():
+            calls.append(1)
+            if len(calls) == 1:
+                try:
+                    await asyncio.Event().wait()
+                except asyncio.CancelledError:
+                    await wound_down.wait()  # e.g. closing its connection
+                    raise
+            return "ok"
+
+        waiter = asyncio.ensure_future(flight.do("qloo:paris", fetch))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        result = await asyncio.wait_for(flight.do("qloo:paris", fetch), 5)
+        wound_down.set()
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(main()) == "ok"
+    assert len(calls) == 2 and flight.stats()["in_flight"] == 0
+
+class PeerGivesUp(ResponseCache):
+    """A shared cache whose other worker drops its lease, without a result, once we wait on it"""
+
+    def lease_held(self, key):
+        self.release_lease(key)
+        return super().lease_held(key)
+
+def test_worker_out_of_time_fetches_without_taking_the_peers_lease():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ResponseCache(SQLiteCache(os.path.join(tmp, "cache.sqlite3")), {"gpt": 60})
+        recommender = app.TravelRecommender(None, cache=cache)
+        assert cache.acquire_lease("gpt:tokyo", 30)  # another worker is fetching it
+        # Already at the deadline: no polling, and the peer's lease is left alone
+        result = recommender._fetch_and_store("gpt", "gpt:tokyo", time.monotonic(), lambda: {"name": "Tokyo"})
+        assert result == {"name": "Tokyo"} and cache.lease_held("gpt:tokyo")
+
+        async def fetch():
+            return {"name": "Kyoto"}
+
+        assert cache.acquire_lease("gpt:kyoto", 30)
+        result = asyncio.run(recommender._fetch_and_store_async("gpt", "gpt:kyoto", time.monotonic(), fetch))
+        assert result == {"name": "Kyoto"} and cache.lease_held("gpt:kyoto")
+
+def test_worker_takes_over_a_lease_the_peer_gave_up():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = PeerGivesUp(SQLiteCache(os.path.join(tmp, "cache.sqlite3")), {"gpt": 60})
+        recommender = app.TravelRecommender(None, cache=cache)
+        assert cache.acquire_lease("gpt:tokyo", 30)
+        held_while_fetching = []
+
+        def fetch():
+            held_while_fetching.append(cache.backend.lease_held("gpt:tokyo"))
+            return {"name": "Tokyo"}
+
+        assert recommender._fetch_and_store("gpt", "gpt:tokyo", None, fetch) == {"name": "Tokyo"}
+        assert held_while_fetching == [True] and recommender.peer_waits == 1
+        assert not cache.backend.lease_held("gpt:tokyo")
+        assert cache.peek("gpt:tokyo") == {"name": "Tokyo"}
+
+class LeaseHeldElsewhere(ResponseCache):
+    """A shared cache where the first lease request finds another worker's lease, once released"""
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.asked = threading.Event()
+        self.answer = threading.Event()
+        self.requests = 0
+
+    def acquire_lease(self, key, ttl):
+        self.requests += 1
+        if self.requests > 1:
+            return super().acquire_lease(key, ttl)
+        self.asked.set()
+        assert self.answer.wait(5)
+        return False
+
+def test_live_call_during_a_refresh_without_the_lease_still_gets_a_result():
+    cache = LeaseHeldElsewhere(MemoryCache(), {"gpt": 60})
+    recommender = app.TravelRecommender(None, cache=cache)
+    recommender._fetch_gpt_recommendations = lambda *args: {"name": "refreshed"}
+    recommender._remember_gpt_recommendations = lambda *args: None
+    key = recommender._gpt_cache_key("Tokyo", "food", "3 days")
+
+    with ThreadPoolExecutor(2) as executor:
+        refresh = executor.submit(recommender.refresh_gpt_recommendations, "Tokyo", "food", "3 days")
+        assert cache.asked.wait(5)  # the refresh is now in flight for the key
+        live = executor.submit(recommender._cached, "gpt", key, None, lambda: {"name": "Tokyo"})
+        try:
+            assert live.result(5) == {"name": "Tokyo"}
+        finally:
+            cache.answer.set()
+        assert refresh.result(5) is None  # skipped: another worker is refreshing it
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Tests for the precomputed recommendation snapshot store
+"""
+
+import gzip
+import json
+import os
+
+from serialization import JSONBody
+from snapshot import Snapshot, SnapshotStore, is_generic_preferences, snapshot_key, trip_keys, write_snapshot
+
+WEEKEND = "Weekend getaway (2-3 days)"
+
+def trip_body(city, tip="Buy a transit pass"):
+    return JSONBody.build({"gpt_recommendations": {"name": city, "travel_tips": [tip] * 80},
+                           "qloo_recommendations": {"restaurants": []}, "generated_at": "2025-01-01T10:00:00"})
+
+def write_trips(path, cities, tip="Buy a transit pass"):
+    taken = set()
+    entries = [(trip_keys(city, WEEKEND, ("restaurants",), taken), trip_body(city, tip)) for city in cities]
+    return write_snapshot(path, entries, {"cities": len(cities)})
+
+def test_lookup_by_any_name_form_with_gzip_ready(tmp_path):
+    path = str(tmp_path / "recommendations.snapshot")
+    assert write_trips(path, ["Paris, France", "Tokyo, Japan", "Paris, Texas"]) == 5  # "paris" goes to the first Paris
+    snapshot = Snapshot(path)
+    body = snapshot.get(snapshot_key("  PARIS ", WEEKEND, ["restaurants"]))
+    assert json.loads(body.body)["gpt_recommendations"]["name"] == "Paris, France"
+    assert body.etag == trip_body("Paris, France").etag
+    assert gzip.decompress(body.negotiate("gzip")[2]) == body.body
+    assert json.loads(snapshot.get(snapshot_key("Paris, Texas", WEEKEND, ["restaurants"])).body)["gpt_recommendations"]["name"] == "Paris, Texas"
+    assert snapshot.get(snapshot_key("Tokyo", "Long trip (2+ weeks)", ["restaurants"])) is None
+    assert snapshot.get(snapshot_key("Tokyo", WEEKEND, ["restaurants", "hotels"])) is None
+    assert snapshot.meta["cities"] == 3
+
+def test_generic_preferences():
+    assert is_generic_preferences("")
+    assert is_generic_preferences(None)
+    assert is_generic_preferences("Anything - the must-see highlights!")
+    assert not is_generic_preferences("street food and history")
+    # Text the word lists don't cover asks for something in particular
+    assert not is_generic_preferences("寿司と温泉")
+    assert not is_generic_preferences("everything 🍣")
+    assert not is_generic_preferences("?!")
+    assert not is_generic_preferences("I would love it")
+
+def test_replaced_file_is_swapped_in(tmp_path):
+    path = str(tmp_path / "recommendations.snapshot")
+    store = SnapshotStore(path, check_interval=0)
+    assert store.get("Tokyo", WEEKEND, ["restaurants"]) is None  # no file yet
+    write_trips(path, ["Tokyo, Japan"])
+    old = store.get("Tokyo", WEEKEND, ["restaurants"])
+    write_trips(path, ["Tokyo, Japan"], tip="Carry cash")
+    new = store.get("Tokyo", WEEKEND, ["restaurants"])
+    assert b"Carry cash" in new.body and new.etag != old.etag
+    assert b"Buy a transit pass" in old.body  # still readable after the swap
+    assert store.stats()["loads"] == 2 and store.stats()["hits"] == 2
+
+def test_unreadable_file_keeps_the_previous_snapshot(tmp_path):
+    path = str(tmp_path / "recommendations.snapshot")
+    write_trips(path, ["Tokyo, Japan"])
+    store = SnapshotStore(path, check_interval=0)
+    with open(path + ".new", "wb") as f:
+        f.write(b"not a snapshot at all")
+    os.replace(path + ".new", path)
+    assert store.get("Tokyo", WEEKEND, ["restaurants"]) is not None
+    assert "error" in store.stats()
+
+def test_stale_snapshot_is_not_served(tmp_path):
+    path = str(tmp_path / "recommendations.snapshot")
+    write_trips(path, ["Tokyo, Japan"])
+    store = SnapshotStore(path, max_age=60)
+    assert store.get("Tokyo", WEEKEND, ["restaurants"]) is not None
+    store.current().built_at -= 120
+    assert store.get("Tokyo", WEEKEND, ["restaurants"]) is None
+    assert store.stats()["stale"]
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Tests for lazy, per-process clients and startup timings
+"""
+
+import json
+import os
+import tempfile
+import threading
+
+from cache import SQLiteCache
+from startup import PerProcess, load_module, timings
+
+def in_child(fn):
+    """Run fn() in a forked child and return what it returned (JSON-encodable)"""
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.write(write_end, json.dumps(fn()).encode())
+        finally:
+            os._exit(0)
+    os.close(write_end)
+    with os.fdopen(read_end) as f:
+        result = f.read()
+    os.waitpid(pid, 0)
+    return json.loads(result)
+
+def test_built_on_first_use_and_only_once():
+    """Nothing is built until the proxy is used; concurrent first uses share one build"""
+    builds = []
+    client = PerProcess("test_client", lambda: builds.append(1) or {"pool": len(builds)})
+    assert not client.built and builds == []
+    threads = [threading.Thread(target=client.instance) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert builds == [1]
+    assert client.get("pool") == 1  # attributes come from the built object, even ones named like the proxy's
+    assert "test_client" in timings.phases()
+
+def test_forked_child_builds_its_own():
+    """A child starts without the parent's object, builds a new one, and reports the parent's phases apart"""
+    client = PerProcess("forked_client", lambda: {"pid": os.getpid()})
+    parent = client.instance()
+    timings.record("parent_phase", 0.5)
+
+    def child():
+        return client.built, client.instance()["pid"], timings.preloaded, timings.parent_phases.get("parent_phase"), \
+            "parent_phase" in timings.phases()
+
+    built, pid, preloaded, parent_seconds, own_phase = in_child(child)
+    assert not built
+    assert pid != parent["pid"]
+    assert preloaded and parent_seconds >= 0.5 and not own_phase
+    assert client.instance() is parent  # the parent keeps its own
+
+def test_sqlite_cache_reconnects_after_fork():
+    """A worker forked from a process with an open cache connection opens its own"""
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = SQLiteCache(os.path.join(tmp, "cache.sqlite3"))
+        cache.set("gpt:tokyo", {"name": "Tokyo"}, ttl=60)
+        parent_connection = id(cache._connect())
+
+        def child():
+            cache.set("gpt:kyoto", {"name": "Kyoto"}, ttl=60)
+            return id(cache._connect()) != parent_connection, cache.get("gpt:tokyo")
+
+        assert in_child(child) == [True, {"name": "Tokyo"}]
+        assert cache.get("gpt:kyoto") == {"name": "Kyoto"}
+
+def test_load_module_imports_once():
+    assert load_module("json") is json
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Tests for fingerprinted static assets
+"""
+
+import gzip
+import os
+import tempfile
+
+from static_assets import IMMUTABLE, REVALIDATE, Asset, StaticAssets
+
+SCRIPT = b"console.log('wanderwise');\n" * 100
+
+def make_assets(tmp, script=SCRIPT):
+    with open(os.path.join(tmp, "app.js"), "wb") as f:
+        f.write(script)
+    with open(os.path.join(tmp, "app.css"), "wb") as f:
+        f.write(b"body { margin: 0; }\n")
+    return StaticAssets(tmp)
+
+def test_fingerprinted_name_follows_content():
+    with tempfile.TemporaryDirectory() as tmp:
+        url = make_assets(tmp).url("app.js")
+        assert url.startswith("/assets/app.") and url.endswith(".js")
+        assert make_assets(tmp).url("app.js") == url
+        assert make_assets(tmp, SCRIPT + b"// changed\n").url("app.js") != url
+
+def test_lookup_by_fingerprint_is_cached_for_good():
+    with tempfile.TemporaryDirectory() as tmp:
+        assets = make_assets(tmp)
+        asset, cache_control = assets.lookup(assets.url("app.js").rsplit("/", 1)[1])
+        assert asset.body == SCRIPT and "javascript" in asset.mimetype
+        assert cache_control == IMMUTABLE
+
+def test_old_fingerprint_gets_current_file_uncached():
+    """A page from before a deploy still loads, without caching new content under the old URL"""
+    with tempfile.TemporaryDirectory() as tmp:
+        assets = make_assets(tmp)
+        asset, cache_control = assets.lookup("app.0123456789.css")
+        assert asset.name == "app.css" and cache_control == REVALIDATE
+        assert assets.lookup("other.0123456789.css") == (None, None)
+        assert assets.lookup("app.css")[0] is None
+
+def test_gzipped_up_front_with_strong_etag():
+    asset = Asset("app.js", SCRIPT)
+    not_modified, encoding, data = asset.negotiate("gzip")
+    assert not not_modified and encoding == "gzip" and gzip.decompress(data) == SCRIPT
+    assert not asset.etag.startswith("W/")
+    assert asset.negotiate("gzip", asset.etag)[0]
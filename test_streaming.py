@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Tests for streamed GPT recommendations: incremental parsing and the /stream route
+"""
+
+import json
+import os
+import tempfile
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+# The app reads its settings at import: keep it off shared files and real upstreams
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("CITY_INDEX_PATH", os.path.join(tempfile.mkdtemp(), "city_index.json"))
+os.environ.setdefault("RATE_LIMIT_PATH", "")
+os.environ.setdefault("SNAPSHOT_PATH", "")
+os.environ.setdefault("CACHE_BACKEND", "memory")
+
+import app
+from streaming import SectionStreamParser
+
+def test_sections_complete_incrementally():
+    """Each top-level section is emitted as soon as its value closes"""
+    payload = json.dumps({
+        "destination_info": {"name": "Tokyo", "weather_info": "Mild, \"humid\" {summers}"},
+        "travel_tips": ["Carry cash", "Get a Suica card"],
+    })
+    parser = SectionStreamParser()
+    emitted = parser.feed("```json\n")
+    for i in range(0, len(payload), 5):
+        emitted += parser.feed(payload[i:i + 5])
+    parser.feed("\n```")
+
+    assert [name for name, _ in emitted] == ["destination_info", "travel_tips"]
+    assert parser.complete
+    assert parser.sections == json.loads(payload)
+
+def test_incomplete_object_is_not_complete():
+    """A stream cut off mid-object keeps finished sections but isn't complete"""
+    parser = SectionStreamParser()
+    emitted = parser.feed('{"destination_info": {"name": "Paris"}, "hidden_gems": [{"na')
+    assert emitted == [("destination_info", {"name": "Paris"})]
+    assert not parser.complete
+
+REPLY = json.dumps({
+    "destination_info": {"name": "Streamville", "best_time_to_visit": "Spring"},
+    "travel_tips": ["Carry cash", "Walk everywhere"],
+})
+
+class FakeStream:
+    """A streamed completion sending text in small chunks; with hold_after, it pauses there until released"""
+
+    def __init__(self, text, hold_after=None):
+        self.pieces = [text[i:i + 7] for i in range(0, len(text), 7)]
+        self.hold_after = hold_after
+        self.release = threading.Event()
+        self.closed = threading.Event()
+        self.sent = 0
+
+    def __iter__(self):
+        for piece in self.pieces:
+            if self.sent == self.hold_after:
+                assert self.release.wait(5)
+            self.sent += 1
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=piece))], usage=None)
+
+    def close(self):
+        self.closed.set()
+
+@pytest.fixture
+def openai_stream(monkeypatch):
+    """Install a fake streaming OpenAI client: call it with the FakeStream to answer with"""
+    streams = []
+
+    def install(stream):
+        streams.append(stream)
+        client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=lambda **kwargs: stream)))
+        monkeypatch.setattr(app.recommender, "openai_client", client)
+        return stream
+
+    monkeypatch.setattr(app.recommender, "semantic_cache", None)
+    monkeypatch.setattr(app.recommender, "get_qloo_recommendations",
+                        lambda location, category, deadline: {"results": [f"{category} in {location}"]})
+    yield install
+    for stream in streams:
+        stream.release.set()
+
+def stream_events(location, **kwargs):
+    """POST to the stream route and return its frames as (event, data) pairs"""
+    response = app.app.test_client().post("/api/recommendations/stream", json=dict(location=location, **kwargs))
+    assert response.status_code == 200 and response.mimetype == "text/event-stream"
+    frames = [frame for frame in response.get_data(as_text=True).split("\n\n") if frame]
+    assert frames[0] == ": stream open"
+    events = []
+    for frame in frames[1:]:
+        event, data = frame.split("\n")
+        assert event.startswith("event: ") and data.startswith("data: ")
+        events.append((event[len("event: "):], json.loads(data[len("data: "):])))
+    return events
+
+def cached_gpt(location):
+    return app.recommender.cache.peek(app.recommender._gpt_cache_key(location, "", ""))
+
+def test_stream_sends_sections_in_order_then_done(openai_stream):
+    openai_stream(FakeStream(REPLY))
+    events = stream_events("Streamville")
+    sections = [(data["name"], data["value"]) for event, data in events if event == "section"]
+    assert sections == [("destination_info", {"name": "Streamville", "best_time_to_visit": "Spring"}),
+                        ("travel_tips", ["Carry cash", "Walk everywhere"])]
+    assert ("qloo", {"restaurants": {"results": ["restaurants in Streamville"]}}) in events
+    assert events[-1][0] == "done" and "generated_at" in events[-1][1]
+    assert "gpt_error" not in [event for event, _ in events]
+    assert cached_gpt("Streamville")["travel_tips"] == ["Carry cash", "Walk everywhere"]
+
+def test_truncated_stream_ends_in_gpt_error_and_is_not_cached(openai_stream):
+    # Usable sections, then cut off inside the next one
+    openai_stream(FakeStream(REPLY.replace("Streamville", "Cutoff Town")[:-1] + ', "hidden_gems": [{"na'))
+    events = stream_events("Cutoff Town")
+    names = [event for event, _ in events]
+    assert names.count("section") == 2
+    assert names.index("gpt_error") > max(i for i, name in enumerate(names) if name == "section")
+    error = dict(events)["gpt_error"]
+    assert "ended before the JSON object was complete" in json.dumps(error)
+    assert names[-1] == "done"
+    assert cached_gpt("Cutoff Town") is None
+
+def test_stream_past_the_deadline_falls_back(openai_stream, monkeypatch):
+    monkeypatch.setattr(app, "REQUEST_DEADLINE", 0.3)
+    monkeypatch.setattr(app.gpt_retry, "min_attempt_time", 0)  # let the stream open with so little time
+    reply = REPLY.replace("Streamville", "Slowtown")
+    # Stall once destination_info has been sent, and its section closed by the next key
+    stream = openai_stream(FakeStream(reply, hold_after=reply.index('"travel_tips"') // 7 + 1))
+    events = stream_events("Slowtown")
+    names = [event for event, _ in events]
+    assert names.count("section") == 1  # destination_info arrived before the stream stalled
+    assert "AI recommendations temporarily unavailable" in json.dumps(dict(events)["gpt_error"])
+    assert names[-1] == "done" and "qloo" in names
+    stream.release.set()
+    assert stream.closed.wait(5)
+    assert cached_gpt("Slowtown") is None
+
+def test_client_disconnect_stops_the_stream(openai_stream):
+    stream = openai_stream(FakeStream(REPLY.replace("Streamville", "Goneville"), hold_after=2))
+    response = app.app.test_client().post("/api/recommendations/stream", json={"location": "Goneville"}, buffered=False)
+    frames = iter(response.response)
+    assert next(frames) == b": stream open\n\n"
+    response.close()  # the browser went away
+    stream.release.set()
+    assert stream.closed.wait(5)
+    assert stream.sent < len(stream.pieces)  # no tokens were read after the stop
+    assert cached_gpt("Goneville") is None
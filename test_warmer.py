@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Tests for the background cache warmer
+"""
+
+from cache import MemoryCache, ResponseCache
+from warmer import CacheWarmer, DemandTracker
+
+def make_warmer(cache, calls, **kwargs):
+    def refresh(source, args):
+        calls.append((source, args))
+        result = {"fresh": args}
+        cache.set(source, f"{source}:{args[0]}", result)
+        return result
+    kwargs.setdefault("max_per_minute", 6000)
+    return CacheWarmer(cache, DemandTracker(), refresh, **kwargs)
+
+def test_demand_ranks_by_decayed_frequency():
+    tracker = DemandTracker(half_life=3600)
+    for _ in range(3):
+        tracker.record("gpt", "gpt:tokyo", ("Tokyo",))
+    tracker.record("gpt", "gpt:oslo", ("Oslo",))
+    assert [key for _, key, _ in tracker.top(2)] == ["gpt:tokyo", "gpt:oslo"]
+    assert [key for _, key, _ in tracker.top(5, min_score=2)] == ["gpt:tokyo"]
+
+def test_demand_tracking_is_bounded():
+    tracker = DemandTracker(max_tracked=2)
+    tracker.record("gpt", "gpt:tokyo", ("Tokyo",))
+    tracker.record("gpt", "gpt:tokyo", ("Tokyo",))
+    tracker.record("gpt", "gpt:oslo", ("Oslo",))
+    tracker.record("gpt", "gpt:rome", ("Rome",))
+    assert len(tracker) == 2
+    assert tracker.top(1)[0][1] == "gpt:tokyo"
+
+def test_refreshes_popular_entries_that_are_missing_or_expiring():
+    """Fresh entries and one-off requests are left alone"""
+    cache = ResponseCache(MemoryCache(), {"gpt": 100})
+    calls = []
+    warmer = make_warmer(cache, calls, min_requests=2)
+    for location in ("Tokyo", "Tokyo", "Paris", "Paris", "Oslo"):
+        warmer.record("gpt", f"gpt:{location}", (location,))
+    cache.backend.set("gpt:Paris", {"cached": True}, 90)  # plenty of TTL left
+
+    assert warmer.warm_once() == 1
+    assert calls == [("gpt", ("Tokyo",))]
+
+    cache.backend.set("gpt:Paris", {"cached": True}, 10)  # under refresh_ahead of the TTL
+    calls.clear()
+    assert warmer.warm_once() == 1
+    assert calls == [("gpt", ("Paris",))]
+
+def test_holds_off_while_upstream_is_busy():
+    cache = ResponseCache(MemoryCache(), {"qloo": 100})
+    calls, results = [], []
+    warmer = make_warmer(cache, calls, min_requests=1, is_busy=lambda source: True,
+                         on_result=lambda source, result: results.append(result))
+    warmer.record("qloo", "qloo:Tokyo", ("Tokyo", "restaurants"))
+    assert warmer.warm_once() == 0
+    assert calls == []
+    assert results == ["busy"]
+
+def test_failed_refresh_does_not_stop_the_pass():
+    cache = ResponseCache(MemoryCache(), {"gpt": 100})
+    calls = []
+
+    def refresh(source, args):
+        calls.append(args)
+        if args == ("Tokyo",):
+            raise RuntimeError("upstream down")
+        return {"fresh": True}
+    warmer = CacheWarmer(cache, DemandTracker(), refresh, min_requests=1, max_per_minute=6000)
+    warmer.record("gpt", "gpt:Tokyo", ("Tokyo",))
+    warmer.record("gpt", "gpt:Tokyo", ("Tokyo",))
+    warmer.record("gpt", "gpt:Paris", ("Paris",))
+    assert warmer.warm_once() == 1
+    assert calls == [("Tokyo",), ("Paris",)]
@@ -0,0 +1,141 @@
+"""
+Background cache warming for the most requested destinations
+
+Live requests are recorded as demand: decaying counts per GPT trip (normalized
+location, preferences and duration) and per Qloo location/category. A daemon thread
+periodically refreshes the most requested cache entries that are missing or close to
+expiring, so popular trips stay warm instead of the first user of each TTL window
+paying for the upstream calls. Warming is rate limited, and pauses while an upstream
+is busy with live traffic or its circuit is open.
+"""
+
+import threading
+import time
+
+
+class DemandTracker:
+    """Request counts that halve every half_life seconds, so yesterday's spike fades out"""
+
+    def __init__(self, half_life=3600.0, max_tracked=1000):
+        self.half_life = half_life
+        self.max_tracked = max_tracked
+        self._lock = threading.Lock()
+        self._entries = {}  # (source, cache key) -> [score, updated_at, fetch args]
+
+    def _decayed(self, score, updated_at, now):
+        return score * 0.5 ** ((now - updated_at) / self.half_life)
+
+    def record(self, source, key, args):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get((source, key))
+            score = 1.0 if entry is None else self._decayed(entry[0], entry[1], now) + 1.0
+            self._entries[(source, key)] = [score, now, args]
+            if len(self._entries) > self.max_tracked:
+                self._drop_coldest(now)
+
+    def _drop_coldest(self, now):
+        ranked = sorted(self._entries, key=lambda k: self._decayed(*self._entries[k][:2], now))
+        for k in ranked[:len(self._entries) - self.max_tracked]:
+            del self._entries[k]
+
+    def top(self, n, min_score=0.0):
+        """The n most requested (source, key, args), hottest first"""
+        now = time.time()
+        with self._lock:
+            scored = [(self._decayed(score, updated_at, now), source, key, args)
+                      for (source, key), (score, updated_at, args) in self._entries.items()]
+        scored.sort(key=lambda item: item[0], reverse=True)
+        # Rounded so a request made a moment ago still counts as a whole one
+        return [(source, key, args) for score, source, key, args in scored[:n] if round(score, 3) >= min_score]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class CacheWarmer:
+    """Refreshes the hottest GPT and Qloo cache entries ahead of expiry, at a bounded rate
+
+    refresh(source, args) re-fetches one entry into the cache; is_busy(source) says
+    whether live traffic currently needs that upstream more than the warmer does.
+    """
+
+    def __init__(self, cache, tracker, refresh, is_busy=lambda source: False, top_n=20, interval=60.0,
+                 refresh_ahead=0.2, max_per_minute=6, min_requests=2, on_result=None):
+        self.cache = cache
+        self.demand = tracker
+        self.refresh = refresh
+        self.is_busy = is_busy
+        self.top_n = top_n
+        self.interval = interval
+        # Refresh once less than this fraction of the entry's TTL is left
+        self.refresh_ahead = refresh_ahead
+        self.min_gap = 60.0 / max_per_minute
+        self.min_requests = min_requests
+        self.on_result = on_result or (lambda source, result: None)
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._last_refresh = 0.0
+
+    def record(self, source, key, args):
+        self.demand.record(source, key, args)
+
+    def due(self, source, key):
+        """Is this entry missing, or close enough to expiring to refresh now?"""
+        remaining = self.cache.expires_in(key)
+        return remaining is None or remaining < self.cache.ttls.get(source, 3600) * self.refresh_ahead
+
+    def warm_once(self):
+        """Refresh the hottest due entries, returning how many were refreshed"""
+        refreshed = 0
+        for source, key, args in self.demand.top(self.top_n, self.min_requests):
+            if self._stop.is_set():
+                break
+            if not self.due(source, key):
+                continue
+            if self.is_busy(source):
+                self.on_result(source, "busy")
+                continue
+            # Rate limit: at most max_per_minute refreshes, one at a time
+            if self._stop.wait(max(0.0, self._last_refresh + self.min_gap - time.monotonic())):
+                break
+            self._last_refresh = time.monotonic()
+            try:
+                result = self.refresh(source, args)
+            except Exception:
+                self.on_result(source, "error")
+                continue
+            if isinstance(result, dict) and "error" not in result:
+                refreshed += 1
+                self.on_result(source, "ok")
+            else:
+                self.on_result(source, "error" if result is not None else "skipped")
+        return refreshed
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.warm_once()
+            except Exception:
+                # Warming is best effort - never let one bad cycle end the thread
+                pass
+
+    def start(self):
+        """Start the warming thread (once per process; call again after a fork)"""
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="cache-warmer", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        return {
+            "running": self._thread is not None and self._thread.is_alive(),
+            "tracked": len(self.demand),
+            "hottest": [args for _, _, args in self.demand.top(5, self.min_requests)],
+        }